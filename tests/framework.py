@@ -1,3 +1,4 @@
+import io
 import os
 from dataclasses import dataclass
 
@@ -5,7 +6,7 @@ import pytest
 
 from textomatic.context import ProcessContext
 from textomatic.exceptions import ProcessException
-from textomatic.processor.process import process
+from textomatic.processor.process import process, process_stream
 
 
 @dataclass
@@ -40,26 +41,55 @@ def load_cases(name):
 
 
 def cases(fn):
+    return _cases(fn, run_and_assert_process)
+
+
+def stream_cases(fn):
+    return _cases(fn, run_and_assert_process_stream)
+
+
+def _cases(fn, run):
     prefix = len("test_")
     fn_name = fn.__name__
     name = fn_name[prefix:]
 
     @pytest.mark.parametrize("c", load_cases(name), ids=lambda c: f"{c.name} [{c.cmd}]")
     def f(c):
-        run_and_assert_process(c)
+        run(c)
 
     return f
 
 
 def run_and_assert_process(case):
-    if case.skipped:
-        raise pytest.skip()
-    try:
-        result = process(
+    def run():
+        return process(
             text=case.input_text,
             cmd=case.cmd,
             ctx=case.process_ctx,
-        ).strip()
+        )
+
+    _run_and_assert(case, run)
+
+
+def run_and_assert_process_stream(case):
+    def run():
+        out = io.StringIO()
+        process_stream(
+            lines=io.StringIO(case.input_text),
+            cmd=case.cmd,
+            ctx=case.process_ctx,
+            out=out,
+        )
+        return out.getvalue()
+
+    _run_and_assert(case, run)
+
+
+def _run_and_assert(case, run):
+    if case.skipped:
+        raise pytest.skip()
+    try:
+        result = run().strip()
         assert (
             result == case.expected_output
         ), f'''
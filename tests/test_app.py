@@ -8,15 +8,21 @@ import time
 import pyte
 
 
-def run():
+def run(keys=b"", args=(), on_start=None):
     screen = pyte.Screen(80, 24)
     stream = pyte.ByteStream(screen)
     p_pid, master_fd = pty.fork()
     python = sys.executable
-    args = [python, "-m", "textomatic.main"]
+    args = [python, "-m", "textomatic.main", *args]
     if p_pid == 0:
         os.execvpe(python, args, {})
     start = time.time()
+    if on_start:
+        time.sleep(0.5)
+        on_start()
+    if keys:
+        time.sleep(0.5)
+        os.write(master_fd, keys)
     while True:
         rlist, *_ = select.select([master_fd], [], [], 1)
         if time.time() - start > 1:
@@ -34,3 +40,82 @@ def test_sanity():
     output = run()
     assert output[0].startswith("INPUT")
     assert output[-1].startswith(">")
+
+
+def test_process_input():
+    output = run(b"1,2")
+    assert any("[['1', '2']]" in line for line in output)
+
+
+def test_preview_head(monkeypatch):
+    from textomatic.app import builder
+
+    monkeypatch.setattr(builder, "PREVIEW_MIN_SIZE", 3)
+    monkeypatch.setattr(builder, "PREVIEW_LINES", 2)
+    assert builder._head_end("a\nb") is None
+    assert builder._head_end("a\nb\nc\nd") == 4
+    monkeypatch.setattr(builder, "PREVIEW_MIN_SIZE", 100)
+    assert builder._head_end("a\nb\nc\nd") is None
+
+
+def test_follow(tmp_path):
+    path = tmp_path / "input.csv"
+    path.write_text("a,b\n1,2\n")
+
+    def append():
+        with open(path, "a") as f:
+            f.write("3,4\n")
+
+    output = run(args=["--follow", "-c", "h;o:jl", str(path)], on_start=append)
+    assert any('["1", "2"]' in line for line in output)
+    assert any('["3", "4"]' in line for line in output)
+
+
+def test_complete_mapped_input(tmp_path):
+    from prompt_toolkit.buffer import Buffer
+
+    from textomatic import context
+    from textomatic.app import builder
+    from textomatic.processor import mapped
+
+    path = tmp_path / "input"
+    path.write_text("a,b\n1,2\n")
+    context.reset()
+    try:
+        ctx = context.get()
+        ctx.mapped_input = mapped.MappedFile(str(path))
+        ctx.cmd_buffer = Buffer(multiline=False)
+        ctx.cmd_buffer.text = "h;o:jl"
+        app_builder = builder.AppBuilder()
+        # e.g. Ctrl-O while a run is pending
+        ctx.preview = (1, 2)
+        app_builder.complete()
+        assert not ctx.current_error
+        assert ctx.output_text().strip() == '["1", "2"]'
+    finally:
+        context.reset()
+
+
+def test_run_after_cancelled():
+    import threading
+
+    import pytest
+
+    from textomatic import context
+    from textomatic.app import builder
+    from textomatic.exceptions import ProcessCancelled
+
+    context.reset()
+    try:
+        app_builder = builder.AppBuilder()
+        assert app_builder.run("a,b\n1,2", "h;o:c", 0, {"input"}) == '"a","b"\n"1","2"\n'
+        cancelled = threading.Event()
+        cancelled.set()
+        app_builder.process_ctx.cancelled = cancelled
+        with pytest.raises(ProcessCancelled):
+            app_builder.run("a,b\n1,2", "h;o:jl", 0, {"cmd"})
+        # e.g. a character typed and deleted again while the command was processing
+        app_builder.process_ctx.cancelled = None
+        assert app_builder.run("a,b\n1,2", "h;o:jl", 0, {"cmd"}) == '["1", "2"]'
+    finally:
+        context.reset()
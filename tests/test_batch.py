@@ -0,0 +1,74 @@
+import pytest
+from click.testing import CliRunner
+
+from textomatic.exceptions import ProcessException
+from textomatic.main import main
+from textomatic.processor import batch
+
+
+@pytest.fixture
+def files(tmp_path):
+    (tmp_path / "in" / "sub").mkdir(parents=True)
+    (tmp_path / "in" / "x.csv").write_text("a,b\n1,2\n3,4\n")
+    (tmp_path / "in" / "sub" / "y.csv").write_text("b,c,c\n5,6,7\n")
+    (tmp_path / "in" / "z.csv").write_text("a,b\n8,9\n")
+    return tmp_path
+
+
+def _invoke(*args):
+    return CliRunner(mix_stderr=False).invoke(main, ["-p", *args])
+
+
+def test_expand_paths(files):
+    paths = batch.expand_paths([str(files / "in"), str(files / "in" / "*.csv")])
+    assert [name for _, name in paths] == ["x.csv", "z.csv", "sub/y.csv"]
+    (files / "x.csv").write_text("")
+    with pytest.raises(ProcessException):
+        batch.expand_paths([str(files / "in"), str(files / "x.csv")])
+    with pytest.raises(ProcessException):
+        batch.expand_paths([str(files / "*.txt")])
+
+
+@pytest.mark.parametrize("jobs", ["1", "2"])
+def test_union(files, jobs):
+    result = _invoke("-j", jobs, "-c", "h;t:b:i;o:jl", "--union", str(files / "in"))
+    assert result.exit_code == 0, result.output
+    assert result.stdout.splitlines() == [
+        '["1", 2, null, null]',
+        '["3", 4, null, null]',
+        '["8", 9, null, null]',
+        '[null, 5, "6", "7"]',
+    ]
+
+
+def test_union_headers(files):
+    result = _invoke("-c", "h;o:c", "--union", str(files / "in" / "*.csv"))
+    assert result.stdout.splitlines()[0] == '"a","b"'
+    result = _invoke("-c", "h;o:t", "--union", str(files / "in" / "sub"), str(files / "in" / "x.csv"))
+    assert result.stdout.splitlines()[1] == "│   b │   c │   c │   a │"
+
+
+@pytest.mark.parametrize("jobs", ["1", "2"])
+def test_output_dir(files, jobs):
+    output_dir = files / "out"
+    result = _invoke("-j", jobs, "-c", "h;t:a:i;o:jl", "--output-dir", str(output_dir), str(files / "in"))
+    assert result.exit_code == 1
+    assert result.stderr.splitlines()[0] == f"{files / 'in' / 'sub' / 'y.csv'}: KeyError: 'a'"
+    assert (output_dir / "x.csv").read_text() == '[1, "2"]\n[3, "4"]\n'
+    assert (output_dir / "z.csv").read_text() == '[8, "9"]\n'
+    assert not (output_dir / "sub" / "y.csv").exists()
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        ["a", "b"],
+        ["--union", "--output-dir", "out", "a"],
+        ["--union"],
+        ["--union", "--profile", "a"],
+    ],
+)
+def test_invalid_arguments(args):
+    result = _invoke(*args)
+    assert result.exit_code == 1
+    assert "Error" in result.stderr
@@ -0,0 +1,57 @@
+import os
+
+import pytest
+
+from textomatic import bench
+from textomatic.model import ProcessContext, ProcessedCommand
+from textomatic.processor import inputs, outputs
+from textomatic.processor.process import process_cmd
+
+
+def _aliases(attr, default):
+    result = set()
+    for benchmark in bench.BENCHMARKS:
+        processed_cmd, _ = process_cmd(ProcessContext(ProcessedCommand("")), benchmark.cmd)
+        processors = getattr(processed_cmd, attr)
+        result |= {p.alias for p in processors} or {"n" if processed_cmd.raw else default}
+    return result
+
+
+def test_benchmarks_cover_registries():
+    assert _aliases("inputs", "c") == set(inputs.registry.data)
+    assert _aliases("outputs", "l") == set(outputs.registry.data)
+
+
+@pytest.mark.parametrize("shape", ["narrow", "wide"])
+@pytest.mark.parametrize("format", ["csv", "jl", "sh"])
+def test_generate(format, shape):
+    text = bench.generate(format, shape, 10)
+    assert len(text.split("\n")) == 10 + (format != "jl")
+
+
+def test_run_and_baseline(tmp_path):
+    path = str(tmp_path / "baseline.json")
+    results = bench.run(sizes=[100], repeat=1)
+    assert [r.name for r in results] == [b.name for b in bench.BENCHMARKS]
+    assert all(r.rows_per_sec > 0 and r.peak_memory > 0 for r in results if r.name != "input-n")
+    bench.save_baseline(results, path)
+    baseline = bench.load_baseline(path)
+    results = bench.run(sizes=[100], name_filter="output-c", repeat=1, baseline=baseline)
+    assert [r.name for r in results] == ["output-c"]
+    assert results[0].ratio is not None
+    baseline["output-c@100"]["seconds"] = results[0].seconds / 10
+    results = bench.run(sizes=[100], name_filter="output-c", repeat=1, baseline=baseline)
+    assert bench.regressions(results) == results
+
+
+@pytest.mark.skipif(not os.environ.get("TM_BENCH_BASELINE"), reason="set TM_BENCH_BASELINE to run benchmarks")
+def test_no_regressions():
+    # saves a baseline on the first run and compares later runs with it
+    path = os.environ["TM_BENCH_BASELINE"]
+    baseline = bench.load_baseline(path) if os.path.exists(path) else None
+    results = bench.run(baseline=baseline)
+    print()
+    print(bench.format_results(results))
+    if baseline is None:
+        bench.save_baseline(results, path)
+    assert not bench.regressions(results)
@@ -0,0 +1,51 @@
+import pytest
+
+from textomatic.context import ProcessContext
+from textomatic.exceptions import ProcessException
+from textomatic.model import ProcessedCommand
+from textomatic.processor import columnar
+from textomatic.processor.process import process
+
+ROWS = 2000
+
+inputs = {
+    "numbers": "\n".join(f"{i},{i * 1.5},{'yes' if i % 2 else 'no'},v{i}" for i in range(ROWS)),
+    "invalid": "\n".join(f"{i if i % 100 else 'nope'},{i * 1.5},{'on' if i % 3 else 'off'},v{i}" for i in range(ROWS)),
+    "missing": "\n".join('{"a": 1, "b": 2}' if i % 10 else '{"b": 3}' for i in range(ROWS)),
+    "dates": "\n".join(
+        f"2020-{i % 12 + 1:02}-{i % 28 + 1:02} 10:00:{i % 60:02},{i % 28 + 1:02}/02/2020" for i in range(ROWS)
+    ),
+    "reordered": "\n".join(f'{{"a": {i}, "b": "{i}"}}' if i % 2 else f'{{"b": "{i}", "a": {i}}}' for i in range(ROWS)),
+}
+
+commands = [
+    ("numbers", "t:i,f,b"),
+    ("numbers", "t:i,f,b;s:{n:1,f:2,b:3}"),
+    ("numbers", "t:1:i,-3:f,1:s"),
+    ("numbers", "t:b,5?:i"),
+    ("invalid", "t:i?,f,b"),
+    ("invalid", "t:i/0/,f?,b"),
+    ("invalid", "t:i"),
+    ("missing", "i:jl;t:a?:i,b:f"),
+    ("missing", "i:jl;t:a:i"),
+    ("dates", "d:,;t:d,d"),
+    ("dates", "d:,;t:d`%Y-%m-%d %H:%M:%S`,d`%m/%d/%Y`"),
+    ("dates", "d:,;t:d,d`%m/%d/%Y`?;o:jl"),
+    ("reordered", "i:jl;t:a:s,b:f"),
+    ("reordered", "i:jl;t:b:i;s:{x:b,y:a}"),
+]
+
+
+def _process(text, cmd):
+    try:
+        return process(text=text, cmd=cmd, ctx=ProcessContext(ProcessedCommand("")))
+    except (ProcessException, IndexError, ValueError) as e:
+        return repr(e)
+
+
+@pytest.mark.parametrize("name,cmd", commands)
+def test_columnar_matches_row_path(name, cmd, monkeypatch):
+    text = inputs[name]
+    result = _process(text, cmd)
+    monkeypatch.setattr(columnar, "MIN_ROWS", float("inf"))
+    assert _process(text, cmd) == result
@@ -0,0 +1,192 @@
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+client_script = """
+import json
+import sys
+from textomatic.daemon import cli
+try:
+    cli()
+except SystemExit as e:
+    code = e.code
+print(json.dumps(sorted({m.split(".")[0] for m in sys.modules})), file=sys.stderr)
+sys.exit(code)
+"""
+
+
+def _env(socket_path):
+    return dict(os.environ, PYTHONPATH=ROOT, TM_SOCKET=socket_path)
+
+
+@pytest.fixture(scope="module")
+def socket_path(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("daemon") / "tm.sock")
+    server = subprocess.Popen(
+        [sys.executable, "-m", "textomatic.main", "serve", "-w", "4"],
+        env=_env(path),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+    )
+    deadline = time.time() + 30
+    while not os.path.exists(path):
+        assert server.poll() is None, server.stderr.read().decode()
+        assert time.time() < deadline
+        time.sleep(0.05)
+    yield path
+    server.terminate()
+    server.wait(10)
+    assert not os.path.exists(path)
+
+
+def _client(socket_path, args, text="", cwd=ROOT):
+    result = subprocess.run(
+        [sys.executable, "-c", client_script, *args],
+        input=text.encode(),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        env=_env(socket_path),
+        cwd=cwd,
+    )
+    *errors, modules = result.stderr.decode().splitlines()
+    return result.returncode, result.stdout.decode(), "\n".join(errors), set(json.loads(modules))
+
+
+def _local(args, text=""):
+    result = subprocess.run(
+        [sys.executable, "-m", "textomatic.main", *args],
+        input=text.encode(),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        env=_env(""),
+    )
+    return result.returncode, result.stdout.decode()
+
+
+@pytest.mark.parametrize(
+    "command,text",
+    [
+        ("h;o:jl", "a,b\n1,2\n3,4"),
+        ("t:i;o:c", "1\n2\n3"),
+        ("d:,;h;t:i,d;o:t", "a,b\n1,2020-01-01\n2,2020-01-02"),
+        ("i:jl;s:{x:a}", '{"a": 1}\n{"a": 2}'),
+        ("o:j", ""),
+    ],
+)
+def test_served(socket_path, command, text):
+    code, output, errors, modules = _client(socket_path, ["-p", "-c", command], text)
+    assert (code, output) == _local(["-p", "-c", command], text)
+    assert not errors
+    # the client only runs the invocation when the daemon does not serve it
+    assert "click" not in modules
+    assert "textomatic" in modules
+
+
+def test_served_path(socket_path, tmp_path):
+    (tmp_path / "input.csv").write_text("a,b\n1,2\n")
+    code, output, _, _ = _client(socket_path, ["-p", "-c", "h;o:jl", "input.csv"], cwd=str(tmp_path))
+    assert (code, output) == (0, '["1", "2"]\n')
+
+
+def test_served_errors(socket_path):
+    code, _, errors, modules = _client(socket_path, ["-p", "-m"])
+    assert code == 1
+    assert "--manual with --process-and-exit makes no sense" in errors
+    code, _, errors, _ = _client(socket_path, ["-p", "-c", "o:nope"], "1")
+    assert code == 1
+    assert "Unregistered output: nope" in errors
+    code, _, errors, _ = _client(socket_path, ["-p", "--nope"])
+    assert code == 2
+    assert "no such option: --nope" in errors
+    assert "click" not in modules
+
+
+def test_served_concurrently(socket_path):
+    text = "".join(f"{i}\n" for i in range(20000))
+    expected = _local(["-p", "-c", "t:i;o:c"], text)
+    with ThreadPoolExecutor(8) as executor:
+        results = list(executor.map(lambda _: _client(socket_path, ["-p", "-c", "t:i;o:c"], text)[:2], range(8)))
+    assert results == [expected] * 8
+
+
+def test_not_served(socket_path):
+    # jobs and subcommands run in the client
+    code, output, _, modules = _client(socket_path, ["-p", "-j", "2", "-c", "t:i;o:jl"], "1\n2")
+    assert (code, output) == (0, "[1]\n[2]\n")
+    assert "click" in modules
+    code, _, errors, _ = _client(socket_path, ["serve", "-s", socket_path])
+    assert code == 1
+    assert f"A daemon is already serving {socket_path}" in errors
+
+
+def test_without_daemon(tmp_path):
+    code, output, _, _ = _client(str(tmp_path / "missing.sock"), ["-p", "-c", "t:i;o:jl"], "1\n2")
+    assert (code, output) == (0, "[1]\n[2]\n")
+
+
+def test_socket_mode(socket_path):
+    assert os.stat(socket_path).st_mode & 0o777 == 0o600
+
+
+def test_not_own_socket(tmp_path):
+    import socket
+    from textomatic.daemon import run_client
+
+    path = str(tmp_path / "tm.sock")
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    server.listen()
+    with server:
+        # a socket others can connect to could have been created by another user
+        os.chmod(path, 0o666)
+        assert run_client(path, ["-p", "-c", "o:jl"]) is None
+        os.remove(path)
+        # as could anything else at the path
+        os.symlink(str(tmp_path / "other.sock"), path)
+        assert run_client(path, ["-p", "-c", "o:jl"]) is None
+
+
+def test_serve_not_own_socket(tmp_path):
+    path = str(tmp_path / "tm.sock")
+    with open(path, "w"):
+        pass
+    os.chmod(path, 0o666)
+    code, _, errors, _ = _client(path, ["serve", "-s", path])
+    assert code == 1
+    assert f"{path} is owned by someone else or accessible to others" in errors
+    # it is not removed like the socket of a daemon that was killed
+    assert os.path.exists(path)
+
+
+def test_socket_path(monkeypatch, tmp_path):
+    from textomatic.daemon import socket_path
+
+    monkeypatch.delenv("TM_SOCKET", raising=False)
+    monkeypatch.setenv("XDG_RUNTIME_DIR", str(tmp_path))
+    assert socket_path() == str(tmp_path / f"textomatic-{os.getuid()}.sock")
+    monkeypatch.delenv("XDG_RUNTIME_DIR")
+    monkeypatch.setenv("TMPDIR", "/var/tmp")
+    assert socket_path() == f"/var/tmp/textomatic-{os.getuid()}.sock"
+    monkeypatch.setenv("TM_SOCKET", str(tmp_path / "tm.sock"))
+    assert socket_path() == str(tmp_path / "tm.sock")
+
+
+def test_shared_caches():
+    from textomatic.processor.common import LRUCache
+
+    cache = LRUCache(8)
+
+    def get(i):
+        return [cache.get(k % 16, lambda: k % 16) for k in range(i, i + 5000)]
+
+    with ThreadPoolExecutor(8) as executor:
+        results = list(executor.map(get, range(8)))
+    assert results == [[k % 16 for k in range(i, i + 5000)] for i in range(8)]
+    assert len(cache.data) == 8
@@ -0,0 +1,109 @@
+import datetime
+import io
+
+import pytest
+
+from textomatic.model import ProcessContext, ProcessedCommand
+from textomatic.processor import dates, columnar, mapped, parallel
+from textomatic.processor import process as process_module
+from textomatic.processor.process import process, process_stream, process_follow
+
+
+@pytest.mark.parametrize(
+    "fmt,value",
+    [
+        ("%Y-%m-%d %H:%M:%S", "2020-01-02 10:11:12"),
+        ("%Y-%m-%d %H:%M:%S", "2020-1-2 10:11:12"),
+        ("%d/%m/%Y", "02/01/2020"),
+        ("%Y%m%d%H%M", "202001021011"),
+        ("%Y-%m-%d %H:%M:%S.%f", "2020-01-02 10:11:12.5"),
+    ],
+)
+def test_compile_format(fmt, value):
+    expected = datetime.datetime.strptime(value, fmt)
+    if "%H" not in fmt:
+        expected = expected.date()
+    assert dates.compile_format(fmt)(value) == expected
+
+
+@pytest.mark.parametrize("value", ["2020-01-02 10:11:1x", "2020/01/02 10:11:12", "2020-13-02 10:11:12"])
+def test_compile_format_invalid(value):
+    with pytest.raises(ValueError):
+        dates.compile_format("%Y-%m-%d %H:%M:%S")(value)
+
+
+def test_detect_from_sample():
+    # 01/02 alone would read day first, but the sample is only valid month first
+    parser = dates.DateParser()
+    assert parser.convert(["01/02/2020", "01/13/2020"]) == [datetime.date(2020, 1, 2), datetime.date(2020, 1, 13)]
+    assert parser("01/02/2020") == datetime.date(2020, 1, 2)
+
+
+def test_detect_again():
+    parser = dates.DateParser()
+    assert parser("2020-01-02") == datetime.date(2020, 1, 2)
+    assert parser("03/01/2020") == datetime.date(2020, 1, 3)
+    assert parser.memo == {"2020-01-02": datetime.date(2020, 1, 2), "03/01/2020": datetime.date(2020, 1, 3)}
+    with pytest.raises(ValueError):
+        parser("nope")
+
+
+def test_given_format():
+    parser = dates.DateParser("%d/%m/%Y")
+    assert parser.convert(["03/01/2020", "03/01/2020"]) == [datetime.date(2020, 1, 3)] * 2
+    with pytest.raises(ValueError):
+        parser("2020-01-03")
+
+
+@pytest.mark.parametrize("min_rows", [0, 10 ** 6])
+def test_row_and_batch_paths_agree(min_rows, monkeypatch):
+    monkeypatch.setattr(columnar, "MIN_ROWS", min_rows)
+    result = process("01/02/2020\n02/13/2020", "t:d;o:jl", ProcessContext(ProcessedCommand("")))
+    assert result == '["2020-01-02"]\n["2020-02-13"]'
+
+
+def test_detected_per_run():
+    # the format detected for an earlier column does not carry over to later runs of the same command
+    first = process("05/06/2020\n05/13/2020", "t:d;o:jl", ProcessContext(ProcessedCommand("")))
+    assert first == '["2020-05-06"]\n["2020-05-13"]'
+    assert process("05/06/2020", "t:d;o:jl", ProcessContext(ProcessedCommand(""))) == '["2020-06-05"]'
+    assert process("a\n05/06/2020", "h;t:a:d;w:a >= 2020-06;o:jl", ProcessContext(ProcessedCommand(""))) == (
+        '["2020-06-05"]'
+    )
+
+
+# 01/02/2020 alone reads day first, which later rows, once their format was detected, do not change
+chunked_text = "d,i\n" + "01/02/2020,1\n" * 200 + "02/13/2020,2\n01/02/2020,3\n"
+
+
+def _in_chunks(how, text, cmd, tmp_path):
+    out = io.StringIO()
+    ctx = ProcessContext(ProcessedCommand(""))
+    if how == "stream":
+        process_stream(io.StringIO(text), cmd, ctx, out)
+    elif how == "parallel":
+        assert parallel.process_parallel(text, cmd, ctx, out, jobs=3)
+    elif how == "follow":
+        lines = text.splitlines()
+        process_follow([lines[i : i + 50] for i in range(0, len(lines), 50)], cmd, ctx, out)
+    else:
+        path = tmp_path / "input"
+        path.write_text(text)
+        # chunks of lines are formatted as they are displayed, unless rows are filtered
+        out.write(str(mapped.process_mapped(mapped.MappedFile(str(path)), cmd, ctx)))
+    return out.getvalue()
+
+
+@pytest.mark.parametrize("how", ["stream", "parallel", "follow", "mapped"])
+@pytest.mark.parametrize("cmd", ["h;t:d;o:jl", "h;t:d;w:d == 2020-02-01;o:jl"])
+def test_detected_once_across_chunks(how, cmd, monkeypatch, tmp_path):
+    # formats are detected from the first 50 values, which the first chunk holds
+    monkeypatch.setattr(dates, "SAMPLE_SCAN_SIZE", 50)
+    monkeypatch.setattr(process_module, "STREAM_CHUNK_SIZE", 50)
+    monkeypatch.setattr(parallel, "MIN_PARALLEL_SIZE", 0)
+    expected = process(chunked_text, cmd, ProcessContext(ProcessedCommand("")))
+    assert expected.split("\n")[-1] == '["2020-02-01", "3"]'
+    if "w:" in cmd:
+        # the filter parses dates like the output does
+        assert '"2020-02-13"' not in expected
+    assert _in_chunks(how, chunked_text, cmd, tmp_path).strip() == expected.strip()
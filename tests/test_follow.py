@@ -0,0 +1,93 @@
+import io
+import os
+import subprocess
+import sys
+
+import pytest
+
+from textomatic.exceptions import ProcessException
+from textomatic.model import ProcessContext, ProcessedCommand
+from textomatic.processor import follow
+from textomatic.processor.process import process_follow
+
+
+class _Out(io.StringIO):
+    def flush(self):
+        self.write("|")
+
+
+def _follow(batches, cmd):
+    out = _Out()
+    process_follow(batches, cmd, ProcessContext(ProcessedCommand("")), out)
+    return out.getvalue()
+
+
+@pytest.mark.parametrize(
+    "cmd,batches,expected",
+    [
+        ("h;o:c", [["a,b"], ["1,2", "3,4"], ['5,"6,7"']], '"a","b"\n"1","2"\n"3","4"\n|"5","6,7"\n||'),
+        ("d:,;h;t:b:i;s:{x:b};o:jl", [["a,b", "1,2"], ["", "3,4"]], '{"x": 2}\n|{"x": 4}\n||'),
+        ("i:jl;o:jl", [['{"a": 1}', '{"b": 2}'], ['{"b": 3, "c": 4}']], "[1, null]\n[null, 2]\n|[null, 3]\n||"),
+        ("i:sh;h;o:jl", [["a b", "1 '2 3'"]], '["1", "2 3"]\n||'),
+        ("h;o:c", [], ""),
+        ("d:,;h;w:a > 1;n:2;o:jl", [["a", "1", "2"], ["3", "4"], ["5"]], '["2"]\n|["3"]\n|'),
+    ],
+)
+def test_process_follow(cmd, batches, expected):
+    assert _follow(batches, cmd) == expected
+
+
+@pytest.mark.parametrize("cmd", ["o:t", "o:jl,c", "i:jl,jq;o:jl", "r"])
+def test_process_follow_unsupported(cmd):
+    with pytest.raises(ProcessException):
+        _follow([["1"]], cmd)
+
+
+def test_follow_file(tmp_path, monkeypatch):
+    path = tmp_path / "input.jl"
+    path.write_text("a\nb")
+    sleeps = []
+    monkeypatch.setattr(follow.time, "sleep", sleeps.append)
+    batches = follow.follow_file(str(path))
+    assert next(batches) == ["a"]
+    with open(path, "a") as f:
+        f.write("\nc\n")
+    assert next(batches) == ["b", "c"]
+    # truncated files are followed from their start
+    path.write_text("d\n")
+    assert next(batches) == ["d"]
+    # replaced files are reopened
+    replacement = tmp_path / "replacement.jl"
+    replacement.write_text("e\n")
+    os.replace(replacement, path)
+    assert next(batches) == ["e"]
+    assert not sleeps
+
+
+def test_follow_stream():
+    read_fd, write_fd = os.pipe()
+    with os.fdopen(read_fd, "rb") as stream:
+        batches = follow.follow_stream(stream)
+        os.write(write_fd, "a\nb\né".encode()[:-1])
+        assert next(batches) == ["a", "b"]
+        os.write(write_fd, "é".encode()[-1:] + b"\nc")
+        assert next(batches) == ["é"]
+        os.close(write_fd)
+        assert list(batches) == [["c"]]
+
+
+def test_follow_and_exit():
+    process = subprocess.Popen(
+        [sys.executable, "-m", "textomatic.main", "-p", "--follow", "-c", "i:jl;o:c"],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+    )
+    process.stdin.write(b'{"a": 1}\n')
+    process.stdin.flush()
+    # rows are written as their lines arrive, before stdin ends
+    assert process.stdout.readline() == b'"a"\n'
+    assert process.stdout.readline() == b'"1"\n'
+    process.stdin.write(b'{"a": 2}\n')
+    process.stdin.close()
+    assert process.stdout.read() == b'"2"\n'
+    assert process.wait(10) == 0
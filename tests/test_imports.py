@@ -0,0 +1,43 @@
+import json
+import subprocess
+import sys
+
+import pytest
+
+HEAVY_MODULES = ["prompt_toolkit", "pygments", "clevercsv", "tabulate", "pyparsing", "pyperclip"]
+
+script = """
+import json
+import sys
+from textomatic.main import main
+try:
+    main()
+except SystemExit:
+    pass
+print(json.dumps(sorted({m.split(".")[0] for m in sys.modules})), file=sys.stderr)
+"""
+
+
+def _loaded(args, text):
+    result = subprocess.run(
+        [sys.executable, "-c", script, *args],
+        input=text.encode(),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        check=True,
+    )
+    return set(json.loads(result.stderr.decode().splitlines()[-1])) & set(HEAVY_MODULES)
+
+
+@pytest.mark.parametrize(
+    "command,text,expected",
+    [
+        ("i:jl;t:i;o:jl", '{"a": 1}', set()),
+        ("i:jl;o:c", '{"a": 1}', set()),
+        ("h;o:jl", "a,b\n1,2", {"clevercsv"}),
+        ("i:jl;o:t", '{"a": 1}', set()),
+        ("i:jl;s:{x:a}", '{"a": 1}', {"pyparsing"}),
+    ],
+)
+def test_process_and_exit_imports(command, text, expected):
+    assert _loaded(["-p", "-c", command], text) == expected
@@ -0,0 +1,119 @@
+import pytest
+
+from textomatic.context import ProcessContext
+from textomatic.model import ProcessedCommand
+from textomatic.processor import incremental
+from textomatic.processor.incremental import IncrementalProcessor
+from textomatic.processor.outputs import LazyOutput
+from textomatic.processor.process import process
+
+ROWS = 50
+
+csv_text = "\n".join(["a,b,c"] + [f"{i},{i * 2},v{i}" for i in range(ROWS)])
+sh_text = "\n".join(["a b c"] + [f"{i} '{i * 2}' v{i}" for i in range(ROWS)])
+jl_text = "\n".join(f'{{"a": {i}, "b": {i * 2}, "c": "v{i}"}}' for i in range(ROWS))
+
+edits = {
+    "change": lambda t: t.replace("\n7,", "\n70,").replace("\n7 ", "\n70 ").replace('"a": 7,', '"a": 70,'),
+    "insert": lambda t: t.replace("\n9,", "\n100,1,x\n9,")
+    .replace("\n9 ", "\n100 1 x\n9 ")
+    .replace('{"a": 9,', '{"a": 100, "b": 1, "c": "x"}\n{"a": 9,'),
+    "delete": lambda t: "\n".join(t.split("\n")[:5] + t.split("\n")[8:]),
+    "blank": lambda t: "\n".join(t.split("\n")[:5] + ["", "  "] + t.split("\n")[5:]),
+    "append": lambda t: t + "\n",
+    "first": lambda t: t.replace("\n0,", "\n1000,").replace("\n0 ", "\n1000 ").replace('"a": 0,', '"a": 1000,'),
+    "header": lambda t: t.replace("a", "A", 1),
+    "new_key": lambda t: t.replace('"c": "v3"}', '"c": "v3", "d": 1}'),
+    "quote": lambda t: t.replace("v3", '"v3"', 1),
+}
+
+commands = [
+    ("c", csv_text, "h;o:jl"),
+    ("c", csv_text, "h;t:i,i;s:[c,a];o:c"),
+    ("c", csv_text, "o:c"),
+    ("sh", sh_text, "i:sh;h;t:b:i;s:{a,b};o:jl"),
+    ("jl", jl_text, "i:jl;t:a:i;o:c"),
+    ("jl", jl_text, "i:jl;o:jl"),
+]
+
+
+def _full(text, cmd):
+    ctx = ProcessContext(ProcessedCommand(""))
+    try:
+        return process(text=text, cmd=cmd, ctx=ctx), ctx.processed_input.rows
+    except Exception as e:
+        return repr(e)
+
+
+def _incremental(incremental, text, cmd, ctx):
+    try:
+        result = incremental.process(text=text, cmd=cmd, ctx=ctx)
+        if result is None:
+            result = process(text=text, cmd=cmd, ctx=ctx)
+            incremental.reset(text, ctx, result)
+        return result, ctx.processed_input.rows
+    except Exception as e:
+        incremental.reset()
+        return repr(e)
+
+
+@pytest.mark.parametrize("edit", edits)
+@pytest.mark.parametrize("text,cmd", [c[1:] for c in commands], ids=[f"{c[0]}-{c[2]}" for c in commands])
+def test_incremental_matches_full(text, cmd, edit):
+    ctx = ProcessContext(ProcessedCommand(""))
+    incremental = IncrementalProcessor()
+    incremental.reset(text, ctx, process(text=text, cmd=cmd, ctx=ctx))
+    for i in range(2):
+        text = edits[edit](text)
+        assert _incremental(incremental, text, cmd, ctx) == _full(text, cmd)
+
+
+def test_incremental_applies():
+    ctx = ProcessContext(ProcessedCommand(""))
+    incremental = IncrementalProcessor()
+    text, cmd = csv_text, "h;t:i;o:jl"
+    process(text=text, cmd=cmd, ctx=ctx)
+    incremental.reset(text, ctx)
+    for position in [None, 0, len(text) // 2, len(text)]:
+        text = edits["change"](text) if position is None else text.replace("v5\n", "v55\n")
+        assert incremental.process(text=text, cmd=cmd, ctx=ctx, position=position) == _full(text, cmd)[0]
+
+
+@pytest.mark.parametrize(
+    "text,cmd,edit",
+    [
+        (csv_text, "h;o:jl", "header"),
+        (csv_text, "h;o:l", "change"),
+        (csv_text, "h;o:jl;r", "change"),
+        (jl_text, "i:jl;o:jl", "new_key"),
+        (csv_text, "h;o:jl", "quote"),
+        (csv_text, "h;n:3;o:jl", "change"),
+    ],
+)
+def test_incremental_falls_back(text, cmd, edit):
+    ctx = ProcessContext(ProcessedCommand(""))
+    incremental = IncrementalProcessor()
+    process(text=text, cmd=cmd, ctx=ctx)
+    incremental.reset(text, ctx)
+    assert incremental.process(text=edits[edit](text), cmd=cmd, ctx=ctx) is None
+
+
+def test_incremental_lazy(monkeypatch):
+    monkeypatch.setattr(incremental, "LAZY_MIN_ROWS", 0)
+    ctx = ProcessContext(ProcessedCommand(""))
+    processor = IncrementalProcessor()
+    text, cmd = csv_text, "h;t:i;o:c"
+    processor.reset(text, ctx, process(text=text, cmd=cmd, ctx=ctx, lazy=True))
+    for i in range(2):
+        text = edits["change"](text) + f"\n{i},1,x"
+        result = processor.process(text=text, cmd=cmd, ctx=ctx, lazy=True)
+        assert isinstance(result, LazyOutput)
+        assert str(result) == _full(text, cmd)[0]
+
+
+def test_incremental_command_changed():
+    ctx = ProcessContext(ProcessedCommand(""))
+    incremental = IncrementalProcessor()
+    process(text=csv_text, cmd="h;o:jl", ctx=ctx)
+    incremental.reset(csv_text, ctx)
+    assert incremental.process(text=edits["change"](csv_text), cmd="h;o:c", ctx=ctx) is None
@@ -0,0 +1,117 @@
+import pytest
+
+from textomatic.exceptions import ProcessException
+from textomatic.processor import jq
+
+jl = "\n".join(f'{{"one": {i}, "two": "v{i}"}}' for i in range(100))
+
+cases = [
+    (jl, ".one"),
+    (jl, "{o: .one, t: .two}"),
+    (jl, ".one, .two"),
+    (jl, "select(.one > 50) | .two"),
+    (jl, "empty"),
+    (jl, "def f: .one; f # comment"),
+    (jl, None),
+    ('{"a": [1, 2,\n 3]}\n\n  {"a": []}', ".a[]"),
+    ('1 "two" [3] {"four": 4.0} null true -0 1e1000 1.000', "."),
+    ("", "."),
+    ("\n  \n", "."),
+    ('{"a": 1}\n{"a": ', ".a"),
+    ('{"a": 1} nan', ".a"),
+    ('{"a": 1}{"a": 2}', ".a"),
+    ('{"a": 1}', ".a.b"),
+    ('{"a": 1}', "debug"),
+    ('{"a": 1}', ".a +"),
+    ("1 2 3", "[., input]"),
+    ("1 2 3", "input_line_number"),
+    ("1 2 3", "if . == 2 then halt_error else . end"),
+]
+
+
+def _run(fn, text, args):
+    try:
+        return fn(text, args)
+    except ProcessException as e:
+        return f"ERROR: {e}"
+
+
+@pytest.mark.parametrize("text,args", cases)
+def test_pool_matches_run_once(text, args):
+    expected = _run(jq.run_once, text, args)
+    pool = jq.JQPool()
+    try:
+        assert _run(pool.run, text, args) == expected
+        assert _run(pool.run, text, args) == expected
+    finally:
+        pool.close()
+
+
+def test_pool_reuses_workers():
+    pool = jq.JQPool()
+    try:
+        pool.run(jl, ".one")
+        (worker,) = pool.idle[".one"]
+        pool.run(jl, ".one")
+        assert pool.idle[".one"] == [worker]
+    finally:
+        pool.close()
+
+
+def test_pool_recovers_from_crash():
+    pool = jq.JQPool()
+    try:
+        expected = pool.run(jl, ".one")
+        (worker,) = pool.idle[".one"]
+        worker.process.kill()
+        worker.process.wait()
+        assert pool.run(jl, ".one") == expected
+        assert pool.run(jl, ".one") == expected
+    finally:
+        pool.close()
+
+
+def test_pool_size():
+    pool = jq.JQPool(size=2)
+    try:
+        for args in [".one", ".two", "."]:
+            pool.run(jl, args)
+        assert list(pool.idle) == [".two", "."]
+    finally:
+        pool.close()
+
+
+def test_pool_timeout(monkeypatch):
+    monkeypatch.setattr(jq, "TIMEOUT", 0.5)
+    pool = jq.JQPool()
+    try:
+        with pytest.raises(ProcessException):
+            pool.run("1", "until(false; .)")
+    finally:
+        pool.close()
+
+
+@pytest.mark.parametrize("args", [".one", "select(.one % 7 == 0) | .two", ".one | error", "[., input]"])
+def test_parallel(args, monkeypatch):
+    monkeypatch.setattr(jq, "LARGE_INPUT_SIZE", 0)
+    monkeypatch.setattr(jq, "PARALLEL_JOBS", 4)
+    monkeypatch.setattr(jq, "PARALLEL_CHUNK_SIZE", 100)
+    text = "\n".join([jl] * 10)
+    expected = _run(jq.run_once, text, args)
+    pool = jq.JQPool()
+    try:
+        assert _run(lambda t, a: pool.run(t, a, parallel=True), text, args) == expected
+    finally:
+        pool.close()
+
+
+def test_parallel_values_across_lines(monkeypatch):
+    monkeypatch.setattr(jq, "LARGE_INPUT_SIZE", 0)
+    monkeypatch.setattr(jq, "PARALLEL_JOBS", 4)
+    monkeypatch.setattr(jq, "PARALLEL_CHUNK_SIZE", 10)
+    text = '{"one": [\n1,\n2,\n3\n]}\n' * 20
+    pool = jq.JQPool()
+    try:
+        assert pool.run(text, ".one[]", parallel=True) == jq.run_once(text, ".one[]")
+    finally:
+        pool.close()
@@ -0,0 +1,36 @@
+from prompt_toolkit.document import Document
+
+from textomatic.app import builder
+from textomatic.app.lexer import lex_lines, lexer_cls
+from textomatic.processor import inputs
+
+text = "\n".join(["a,b,c"] + [f"{i},{i * 0.5},v{i}" for i in range(1000)])
+
+
+def test_block_lexing_matches_full_lexing(monkeypatch):
+    lexer = builder.ProcessorLexer(inputs.registry, take_last=False)
+    full = lexer.lex_document(Document(text))
+    monkeypatch.setattr(builder, "SYNC_FROM_START_MAX_SIZE", 0)
+    blocks = lexer.lex_document(Document(text))
+    line_count = text.count("\n") + 1
+    for i in [*range(line_count - 1, 0, -7), line_count - 1, line_count]:
+        assert _normalize(blocks(i)) == _normalize(full(i))
+
+
+def _normalize(line):
+    # pygments versions differ in where they split tokens and whether they emit empty ones
+    result = []
+    for style, text, *_ in line:
+        if not text:
+            continue
+        if result and result[-1][0] == style:
+            result[-1] = (style, result[-1][1] + text)
+        else:
+            result.append((style, text))
+    return result
+
+
+def test_lex_lines_cache():
+    cls = lexer_cls("json")
+    assert lex_lines(cls, '{"a": 1}\n[2]') is lex_lines(cls, '{"a": 1}\n[2]')
+    assert len(lex_lines(cls, '{"a": 1}\n[2]')) == 2
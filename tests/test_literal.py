@@ -0,0 +1,24 @@
+import collections
+import datetime
+
+import pytest
+
+from textomatic.processor import literal
+
+rows = {
+    "empty": [],
+    "short": [[1, "a"], [2, "b"]],
+    "long": [[i, f"value {i}", i * 1.5] for i in range(50)],
+    "wide": [["x" * 30, "y" * 30, 12345, None, True], ("z" * 40, "w" * 40)],
+    "nested": [[{"key": "v" * 30, "other": ["a" * 30, ("b" * 30,)]}, {"k": 1}]],
+    "long strings": [["long words " * 20, b"b" * 100]],
+    "other types": [[{1, 2, "s" * 80}, collections.OrderedDict(a="o" * 80)], [datetime.date(2020, 1, 2)] * 8],
+    "single tuple": [("t" * 90,)],
+    "not a list": tuple([1] * 100),
+}
+
+
+@pytest.mark.parametrize("name", list(rows))
+def test_matches_pprint(name):
+    expected = literal.pformat(rows[name])
+    assert "".join(literal.render(rows[name])) == expected
@@ -0,0 +1,102 @@
+import pytest
+
+from textomatic.model import ProcessContext, ProcessedCommand
+from textomatic.processor import mapped
+from textomatic.processor.process import process
+
+csv_text = "\n".join(["a,b,c"] + [f"{i},{i * 2},v{i}" for i in range(500)] + ["", "7,8,9", ""])
+jl_text = "\n".join(f'{{"a": {i}, "b": "v{i}"}}' for i in range(300))
+
+
+@pytest.fixture(autouse=True)
+def small_blocks(monkeypatch):
+    monkeypatch.setattr(mapped, "BLOCK_SIZE", 64)
+
+
+def _mapped(tmp_path, text):
+    path = tmp_path / "input"
+    path.write_text(text)
+    return mapped.MappedFile(str(path))
+
+
+def _ctx():
+    return ProcessContext(ProcessedCommand(""))
+
+
+@pytest.mark.parametrize("text", [csv_text, jl_text, "", "\n", "a", "a\n\nb\n", "ü,ö\n" * 100])
+def test_lines(tmp_path, text):
+    mapped_file = _mapped(tmp_path, text)
+    lines = text.split("\n")
+    assert mapped_file.line_count == len(lines)
+    assert mapped_file.lines(0, len(lines)) == lines
+    assert list(mapped_file.iter_lines()) == text.splitlines(keepends=True)
+    assert mapped_file.text() == text
+
+
+@pytest.mark.parametrize(
+    "text,cmd",
+    [
+        (csv_text, "h;o:jl"),
+        (csv_text, "h;t:i,i;s:[c,a];o:c"),
+        (csv_text, "o:c"),
+        ("\n".join(["a b", "1 '2 3'"] * 200), "i:sh;h;o:jl"),
+    ],
+    ids=["csv-jl", "csv-c-types", "csv-c", "sh-jl"],
+)
+def test_lazy(tmp_path, text, cmd):
+    result = mapped.process_mapped(_mapped(tmp_path, text), cmd, _ctx())
+    assert isinstance(result, mapped.MappedOutput)
+    expected = process(text, cmd, _ctx())
+    lines = [result.line(i) for i in range(result.line_count)]
+    assert [line for line in lines if line] == [line for line in expected.split("\n") if line]
+    # the text of the output is what is displayed, with a line for each line of the input
+    assert str(result) == "\n".join(lines)
+
+
+@pytest.mark.parametrize(
+    "cmd", ["h;o:t", "h", "i:jl;o:j", "r", "h;n:2;o:jl", "h;w:1 != x;o:jl", "i:jl;o:jl", "i:jl;s:{x:b};o:c"]
+)
+def test_fallback(tmp_path, cmd):
+    text = jl_text if "jl" in cmd else csv_text
+    result = mapped.process_mapped(_mapped(tmp_path, text), cmd, _ctx())
+    assert not isinstance(result, mapped.MappedOutput)
+    assert result == process(text, cmd, _ctx())
+
+
+@pytest.mark.parametrize("cmd", ["i:jl;o:jl", "i:jl;o:c"])
+def test_changing_keys(tmp_path, cmd):
+    text = '{"a": 1}\n{"a": 2}\n' * 100 + '{"b": 3}\n{"a": 4}'
+    # jl lines may have other keys than the first ones, so jl is processed in full
+    result = mapped.process_mapped(_mapped(tmp_path, text), cmd, _ctx())
+    assert result == process(text, cmd, _ctx())
+
+
+@pytest.mark.parametrize("access", ["line", "str"])
+def test_invalid_lines(tmp_path, access):
+    text = csv_text + "x,y,z\n"
+    result = mapped.process_mapped(_mapped(tmp_path, text), "h;t:i;o:jl", _ctx())
+    assert isinstance(result, mapped.MappedOutput)
+    assert result.line(0) == '[0, "0", "v0"]'
+    if access == "line":
+        # the error is not shown in place of the line, the whole output is replaced by the error
+        assert result.line(result.line_count - 1) == ""
+        assert isinstance(result.error, ValueError)
+    with pytest.raises(ValueError):
+        str(result)
+
+
+def test_scheduled_fallback(tmp_path):
+    text = csv_text + "x,y,z\n"
+    scheduled = []
+    result = mapped.process_mapped(_mapped(tmp_path, text), "h;t:i;o:jl", _ctx(), scheduled.append)
+    last = result.line_count - 1
+    # the whole text is not processed while lines are displayed
+    assert result.line(last) == ""
+    assert result.line(0) == ""
+    assert len(scheduled) == 1
+    assert result.fallback is None
+    scheduled[0]()
+    assert isinstance(result.error, ValueError)
+    assert result.line_count == 1
+    result.line(last)
+    assert len(scheduled) == 1
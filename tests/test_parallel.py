@@ -0,0 +1,83 @@
+import io
+
+import pytest
+
+from tests.framework import load_cases
+from textomatic.model import ProcessContext, ProcessedCommand
+from textomatic.processor import parallel
+from textomatic.processor.process import process_stream
+
+ROWS = 2000
+
+csv_text = "\n".join(["a,b,c"] + [f"{i},{i * 2},v{i}" for i in range(ROWS)])
+sh_text = "\n".join(["a b c"] + [f"{i} '{i * 2}' v{i}" for i in range(ROWS)])
+jl_text = "\n".join(f'{{"a": {i}, "b": {i * 2}, "c": "v{i}"}}' for i in range(ROWS))
+
+
+def _stream(text, cmd):
+    out = io.StringIO()
+    process_stream(io.StringIO(text), cmd, ProcessContext(ProcessedCommand("")), out)
+    return out.getvalue()
+
+
+def _parallel(text, cmd):
+    out = io.StringIO()
+    if not parallel.process_parallel(text, cmd, ProcessContext(ProcessedCommand("")), out, jobs=3):
+        return None
+    return out.getvalue()
+
+
+@pytest.fixture(autouse=True)
+def small_inputs(monkeypatch):
+    monkeypatch.setattr(parallel, "MIN_PARALLEL_SIZE", 0)
+
+
+@pytest.mark.parametrize(
+    "text,cmd",
+    [
+        (csv_text, "h;o:jl"),
+        (csv_text, "h;t:i,i;s:[c,a];o:c"),
+        (csv_text, "o:c"),
+        (csv_text, "h;t:a:i;s:[a,b];o:t"),
+        (csv_text + "\n\n\n", "h;o:jl"),
+        (sh_text, "i:sh;h;t:b:i;s:{a,b};o:jl"),
+        (jl_text, "i:jl;t:a:i;o:c"),
+        (jl_text, "i:jl;o:l"),
+        ("a,b\n", "h;o:c"),
+    ],
+    ids=lambda v: v if len(v) < 40 else "",
+)
+def test_parallel_matches_stream(text, cmd):
+    assert _parallel(text, cmd) == _stream(text, cmd)
+
+
+@pytest.mark.parametrize(
+    "text,cmd",
+    [
+        (jl_text + '\n{"a": 1}', "i:jl;o:jl"),
+        (csv_text.replace("v5", '"v,5"'), "h;o:jl"),
+        (csv_text, "h;r"),
+        (csv_text, "h;i:c,jq;o:jl"),
+    ],
+    ids=lambda v: v if len(v) < 40 else "",
+)
+def test_parallel_falls_back(text, cmd):
+    assert _parallel(text, cmd) is None
+
+
+def test_parallel_errors():
+    with pytest.raises(ValueError):
+        _parallel(csv_text + "\nx,1,1", "h;t:i;o:jl")
+
+
+@pytest.mark.parametrize("case", load_cases("stream"), ids=lambda c: f"{c.name} [{c.cmd}]")
+def test_parallel_stream_cases(case):
+    try:
+        expected = _stream(case.input_text, case.cmd)
+    except Exception as e:
+        expected = repr(e)
+    try:
+        result = _parallel(case.input_text, case.cmd)
+    except Exception as e:
+        result = repr(e)
+    assert result in [None, expected]
@@ -4,6 +4,8 @@ from typing import List, Callable
 
 import pytest
 
+from textomatic.exceptions import ProcessException
+from textomatic.processor import parser
 from textomatic.processor.parser import parse_structure, parse_types, parse_processors
 
 types_tests = [
@@ -56,6 +58,16 @@ processor_tests = [
     "i1,i1`one, two, three`, i2, i2`one, two, three`",
 ]
 
+filter_tests = [
+    "a == 1",
+    "1 != x",
+    "-1 < 1.5",
+    "a.b.-1 ~ '^x y$'",
+    "'a b' >= \"c d\"",
+    "a == 1 and b == 2 or not c == 3",
+    "not (a == 1 or b == 2)",
+]
+
 
 @dataclass
 class Case:
@@ -70,6 +82,7 @@ class Case:
         Case("structure", structure_tests, parse_structure),
         Case("types", types_tests, parse_types),
         Case("processors", processor_tests, parse_processors),
+        Case("filter", filter_tests, parser.parse_filter),
     ],
     ids=lambda case, *_: case.name,
 )
@@ -79,3 +92,42 @@ def test_parser(case: Case):
         print(f"## expr: {test}")
         result = case.fn(test)
         pprint(result)
+
+
+@pytest.mark.parametrize(
+    "fn,grammar,expr",
+    [(parse_types, "types", e) for e in ["i", ",f,", "s, s, s,", " f ,i, s ", ",", "_,b,j,l,d"]]
+    + [(parse_processors, "processors", e) for e in ["i", "jl", " c , t ", "i1,i2"]],
+)
+def test_plain_expressions(fn, grammar, expr):
+    assert fn(expr) == parser._parse(getattr(parser._grammar(), grammar), expr)
+
+
+def test_filter():
+    assert parser.parse_filter("a == 1 and not b ~ 'x y' or c != 1.5") == parser.BoolOpData(
+        "or",
+        [
+            parser.BoolOpData(
+                "and",
+                [
+                    parser.ComparisonData([parser.IdData("a")], "==", 1),
+                    parser.NotData(parser.ComparisonData([parser.IdData("b")], "~", "x y")),
+                ],
+            ),
+            parser.ComparisonData([parser.IdData("c")], "!=", 1.5),
+        ],
+    )
+    assert parser.parse_filter("1.a == 1a").ref == [parser.LocData(1), parser.IdData("a")]
+    assert parser.parse_filter("a == 1a").value == "1a"
+
+
+@pytest.mark.parametrize("expr", ["a = 1", "a ==", "== 1", "and == 1", "a == 1 and", "(a == 1"])
+def test_invalid_filter(expr):
+    with pytest.raises(ProcessException):
+        parser.parse_filter(expr)
+
+
+@pytest.mark.parametrize("expr", ["-1", "x", "1.5"])
+def test_invalid_limit(expr):
+    with pytest.raises(ProcessException):
+        parser.parse_limit(expr)
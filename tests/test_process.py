@@ -1,4 +1,11 @@
-from tests.framework import cases
+import io
+
+import pytest
+
+from tests.framework import cases, stream_cases
+from textomatic.context import ProcessContext
+from textomatic.model import ProcessedCommand
+from textomatic.processor import process, outputs
 
 
 @cases
@@ -46,6 +53,153 @@ def test_macros():
     pass
 
 
+@cases
+def test_filter():
+    pass
+
+
+@stream_cases
+def test_stream():
+    pass
+
+
+def test_command_plan_cache():
+    ctx = ProcessContext(ProcessedCommand(""))
+    text = "a,b\n1,2"
+    process.process(text, "h;t:a:i;s:{x:a}", ctx)
+    parsed = ctx.processed_command.types
+    row_processor = process._build_row_processor(ctx.processed_command, ctx.processed_input.headers, frozenset(), True)
+    process.process(text, "h;t:a:i;s:{x:a};o:jl", ctx)
+    assert ctx.processed_command.types is parsed
+    assert (
+        process._build_row_processor(ctx.processed_command, ctx.processed_input.headers, frozenset(), True)
+        is row_processor
+    )
+
+
+@pytest.mark.parametrize("cmd", ["h;o:jl", "h;t:i;s:{x:b,y:a};o:c", "o:c", "h;s:[];o:c"])
+def test_lazy_output(cmd, monkeypatch):
+    monkeypatch.setattr(process, "LAZY_MIN_ROWS", 0)
+    text = "\n".join(["a,b"] + [f"{i},v{i}" for i in range(250)])
+    expected = process.process(text, cmd, ProcessContext(ProcessedCommand("")))
+    result = process.process(text, cmd, ProcessContext(ProcessedCommand("")), lazy=True)
+    assert isinstance(result, outputs.LazyOutput)
+    lines = [result.line(i) for i in reversed(range(result.line_count))][::-1]
+    assert lines == expected.splitlines()
+    assert str(result) == expected
+
+
+def test_lazy_output_small():
+    assert isinstance(process.process("a,b\n1,2", "h;o:jl", ProcessContext(ProcessedCommand("")), lazy=True), str)
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "\n".join(["a,b,c"] + [f"{i},{i * 2},v{i}" for i in range(2000)]),
+        "\n".join(
+            f'{{"a": {i}, "b": {i * 2}, "c": "v{i}"}}' if i % 3 else f'{{"a": {i}, "b": 0}}' for i in range(1, 50)
+        ),
+    ],
+)
+def test_stage_cache(text):
+    cmds = [
+        "h;t:a:i,b:f;s:{x:a,y:[b]};o:j",
+        "h;t:a:i,b:f;s:{x:a,y:[b]};o:c",
+        "h;t:a:i,b:f;s:[b,a];o:jl",
+        "h;t:a:i,b:f;s:[b];o:t",
+        "h;t:a:i,b:f;s:{k:{n:b}};o:jl",
+        "h;t:a:i,b:f;s:[b,a];o:l",
+        "h;t:a:i?,b:f?;s:[b,a];o:l",
+        "h;o:c",
+    ]
+    if text.startswith("{"):
+        cmds = [f"i:jl;{cmd}" for cmd in cmds]
+    ctx = ProcessContext(ProcessedCommand(""))
+    process.process(text, "h", ctx)
+    for cmd in cmds + cmds[-2::-1]:
+        expected = process.process(text, cmd, ProcessContext(ProcessedCommand("")))
+        assert process.process(text, cmd, ctx, trigger="cmd") == expected
+
+
+def test_stage_cache_reuse():
+    ctx = ProcessContext(ProcessedCommand(""))
+    text = "a,b\n1,2\n3,4"
+    process.process(text, "h;t:i;s:[b,a];o:j", ctx)
+    rows = ctx.stages.get(("rows", "i", "[b,a]", ("a", "b")), None)
+    process.process(text, "h;t:i;s:[b,a];o:jl", ctx, trigger="cmd")
+    assert ctx.stages.get(("rows", "i", "[b,a]", ("a", "b")), None) is rows
+    process.process(text, "h;t:i;s:[a];o:jl", ctx, trigger="cmd")
+    assert ("types", "i", ("a", "b")) in ctx.stages
+    process.process(text, "h;t:i;s:[a];o:jl", ctx)
+    assert ("types", "i", ("a", "b")) not in ctx.stages
+
+
+def test_stage_cache_size():
+    ctx = ProcessContext(ProcessedCommand(""))
+    text = "\n".join(["a,b"] + [f"{i},{i}" for i in range(1000)])
+    process.process(text, "h;s:[a]", ctx)
+    ctx.stages.max_size = ctx.stages.size
+    process.process(text, "h;s:[b]", ctx, trigger="cmd")
+    assert ctx.stages.size <= ctx.stages.max_size
+    assert ("rows", None, "[a]", ("a", "b")) not in ctx.stages
+
+
+@pytest.mark.parametrize("cmd", ["i:jl;o:jl", "i:jl;o:c", "i:jl;s:{a?,c?};o:jl", "i:jl"])
+def test_stream_matches_process_on_changing_keys(cmd):
+    text = '{"a": 1}\n{"b": 2}\n{"a": 3, "c": 4}\n'
+    out = io.StringIO()
+    process.process_stream(io.StringIO(text), cmd, ProcessContext(ProcessedCommand("")), out)
+    assert out.getvalue().strip() == process.process(text, cmd, ProcessContext(ProcessedCommand(""))).strip()
+
+
+@pytest.mark.parametrize("cmd", ["h;n:3;o:c", "h;t:a:i;w:a >= 20000;n:3;o:c"])
+def test_limit_stops_reading(cmd):
+    consumed = []
+
+    def lines():
+        yield "a,b\n"
+        for i in range(10 ** 6):
+            consumed.append(i)
+            yield f"{i},{i}\n"
+
+    out = io.StringIO()
+    process.process_stream(lines(), cmd, ProcessContext(ProcessedCommand("")), out)
+    assert len(out.getvalue().splitlines()) == 4
+    assert len(consumed) < 10 ** 5
+
+
+def test_limit_parses_head():
+    text = "\n".join(["a,b"] + [f"{i},{i}" for i in range(1000)])
+    ctx = ProcessContext(ProcessedCommand(""))
+    assert process.process(text, "h;n:2;o:c", ctx) == '"a","b"\n"0","0"\n"1","1"\n'
+    assert len(ctx.processed_input.rows) == 2
+    # changing the filter or limit parses the input again
+    assert process.process(text, "h;w:a > 997;o:c", ctx, trigger="cmd") == '"a","b"\n"998","998"\n"999","999"\n'
+    assert process.process(text, "h;w:a > 997;n:1;o:c", ctx, trigger="cmd") == '"a","b"\n"998","998"\n'
+    assert process.process(text, "h;w:a < 1;n:1;o:c", ctx, trigger="cmd") == '"a","b"\n"0","0"\n'
+
+
+@pytest.mark.parametrize("cmd", ["h;n:2;o:c", "h;w:a > 1;n:2;o:c", "h;t:a:i;w:a > 1;n:2;s:[b];o:c"])
+def test_limit_selects_once(cmd, monkeypatch):
+    text = "\n".join(["a,b"] + [f"{i},{i}" for i in range(1000)])
+    selected = []
+    select_rows = process.select_rows
+
+    def counted_select_rows(processed_cmd, headers, rows, *args):
+        rows = select_rows(processed_cmd, headers, rows, *args)
+        selected.append(len(rows))
+        return rows
+
+    monkeypatch.setattr(process, "select_rows", counted_select_rows)
+    expected = process.process(text, cmd.replace("n:2", "n:3"), ProcessContext(ProcessedCommand("")))
+    selected.clear()
+    output = process.process(text, cmd, ProcessContext(ProcessedCommand("")))
+    assert output == "\n".join(expected.splitlines()[:3]) + "\n"
+    # the rows selected while parsing the head of the input are not selected again
+    assert selected == [2]
+
+
 # @cases
 # def test_single():
 #     pass
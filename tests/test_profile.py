@@ -0,0 +1,65 @@
+import json
+
+from click.testing import CliRunner
+
+from textomatic.main import main
+from textomatic.model import ProcessContext, ProcessedCommand
+from textomatic.processor import profiling
+from textomatic.processor.process import process
+
+text = "a,b\n1,2\n3,4"
+
+
+def _profile(cmd):
+    ctx = ProcessContext(ProcessedCommand(""), profile=profiling.Profile())
+    process(text, cmd, ctx)
+    return ctx.profile
+
+
+def test_stages():
+    profile = _profile("h;t:i;o:jl")
+    stages = {s.name: s for s in profile.stages}
+    assert list(stages) == ["command", "input:c", "rows", "types:columnar", "output:jl"]
+    assert stages["input:c"].bytes == len(text)
+    assert stages["input:c"].rows == 2
+    assert stages["rows"].rows == 2
+    assert stages["types:columnar"].depth == 1
+    assert stages["output:jl"].rows == 2
+    assert stages["output:jl"].bytes == len('[1, "2"]\n[3, "4"]')
+    assert all(s.seconds is not None for s in profile.stages)
+    assert profile.seconds == sum(s.seconds for s in profile.stages if s.depth == 0)
+
+
+def test_jq_stage():
+    profile = _profile("h;o:jl,jq`.[0]`")
+    names = [(s.name, s.depth) for s in profile.stages]
+    assert names[-2:] == [("output:jq", 0), ("jq", 1)]
+    assert profile.stages[-1].bytes == len('"1"\n"3"\n')
+
+
+def test_not_profiled():
+    ctx = ProcessContext(ProcessedCommand(""))
+    process(text, "h", ctx)
+    assert ctx.profile is None
+
+
+def test_hooks():
+    started, ended = [], []
+    remove = profiling.add_hook(lambda s: started.append(s.name), lambda s: ended.append((s.name, s.seconds)))
+    try:
+        process(text, "h;o:jl", ProcessContext(ProcessedCommand("")))
+    finally:
+        remove()
+    assert started == ["command", "input:c", "rows", "types:columnar", "output:jl"]
+    assert [name for name, _ in ended] == ["command", "input:c", "types:columnar", "rows", "output:jl"]
+    assert all(seconds is not None for _, seconds in ended)
+    process(text, "h;o:jl", ProcessContext(ProcessedCommand("")))
+    assert len(started) == 5
+
+
+def test_cli():
+    result = CliRunner(mix_stderr=False).invoke(main, ["-p", "--profile", "-c", "h;o:jl"], input=text)
+    assert result.exit_code == 0, result.output
+    assert result.stdout == '["1", "2"]\n["3", "4"]\n'
+    profile = json.loads(result.stderr)
+    assert [s["name"] for s in profile["stages"]] == ["command", "input:c", "rows", "types:columnar", "output:jl"]
@@ -0,0 +1,70 @@
+import datetime
+
+import pytest
+import tabulate as tabulate_module
+from tabulate import tabulate
+
+from textomatic.processor import table
+
+tables = {
+    "numbers": [[1, 1.5, "1"], [-20, 1e20, " 2 "], [None, float("nan"), "3.25"]],
+    "strings": [["a", "  b  ", "<&>"], ["ünï", "日本語", ""], [True, None, "x"]],
+    "mixed": [[[1, 2], {"a": 1}], [datetime.date(2020, 1, 2), (1,)], ["True", "False"]],
+    "ragged": [[1, 2], [3], [4, 5, 6]],
+    "multiline": [["a\nb", 1], ["c", 2]],
+    "control": [["a\tb", "\x07"]],
+    "dicts": [{"a": 1}, {"b": 2}],
+    "empty": [],
+}
+headers = [(), ["x"], ["x", "y", "z", "w"], ["日本", "<b>"]]
+# the tabulate versions whose output render reproduces, see pyproject.toml
+MATCHED_VERSIONS = "0.8."
+
+
+@pytest.mark.skipif(
+    not tabulate_module.__version__.startswith(MATCHED_VERSIONS), reason="other tabulate versions render differently"
+)
+@pytest.mark.parametrize("tablefmt", list(table.FORMATS))
+@pytest.mark.parametrize("header", headers)
+@pytest.mark.parametrize("name", list(tables))
+def test_matches_tabulate(name, header, tablefmt):
+    rows = tables[name]
+    try:
+        expected = tabulate(rows, headers=header, tablefmt=tablefmt)
+    except ValueError:
+        with pytest.raises(ValueError):
+            list(table.render(rows, header, tablefmt))
+        return
+    assert "\n".join(table.render(rows, header, tablefmt)) == expected
+
+
+@pytest.mark.parametrize(
+    "name,header,tablefmt,expected",
+    [
+        ("empty", ["x"], "html", "<table>\n<thead>\n<tr></tr>\n</thead>\n<tbody>\n</tbody>\n</table>"),
+        (
+            "numbers",
+            ["x", "y", "z"],
+            "html",
+            '<table>\n<thead>\n<tr><th style="text-align: right;">  x</th><th style="text-align: right;">      y</th>'
+            '<th style="text-align: right;">   z</th></tr>\n</thead>\n<tbody>\n'
+            '<tr><td style="text-align: right;">  1</td><td style="text-align: right;">  1.5  </td>'
+            '<td style="text-align: right;">1   </td></tr>\n'
+            '<tr><td style="text-align: right;">-20</td><td style="text-align: right;">  1e+20</td>'
+            '<td style="text-align: right;">2   </td></tr>\n'
+            '<tr><td style="text-align: right;">   </td><td style="text-align: right;">nan    </td>'
+            '<td style="text-align: right;">3.25</td></tr>\n</tbody>\n</table>',
+        ),
+        (
+            "numbers",
+            (),
+            "fancy_grid",
+            "╒═════╤═════════╤══════╕\n│   1 │   1.5   │ 1    │\n├─────┼─────────┼──────┤\n"
+            "│ -20 │   1e+20 │ 2    │\n├─────┼─────────┼──────┤\n│     │ nan     │ 3.25 │\n"
+            "╘═════╧═════════╧══════╛",
+        ),
+    ],
+)
+def test_pinned(name, header, tablefmt, expected):
+    # rendered by tabulate 0.8.7, so render is tested whichever tabulate version is installed
+    assert "\n".join(table.render(tables[name], header, tablefmt)) == expected
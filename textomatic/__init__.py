@@ -1,4 +1,15 @@
-from textomatic.processor import inputs, outputs
+# the processors are imported on first use, as the client of the daemon (see daemon) imports this package
+_ATTRIBUTES = {
+    "inputs": lambda inputs, outputs: inputs,
+    "outputs": lambda inputs, outputs: outputs,
+    "register_input": lambda inputs, outputs: inputs.registry.register,
+    "register_output": lambda inputs, outputs: outputs.registry.register,
+}
 
-register_input = inputs.registry.register
-register_output = outputs.registry.register
+
+def __getattr__(name):
+    if name not in _ATTRIBUTES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    from textomatic.processor import inputs, outputs
+
+    return _ATTRIBUTES[name](inputs, outputs)
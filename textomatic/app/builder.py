@@ -1,7 +1,11 @@
+import queue
+import threading
+import time
 from textwrap import dedent
 
 from prompt_toolkit import Application, HTML
 from prompt_toolkit.clipboard.pyperclip import PyperclipClipboard
+from prompt_toolkit.document import Document
 from prompt_toolkit.enums import EditingMode
 from prompt_toolkit.filters import Condition
 from prompt_toolkit.layout import (
@@ -16,31 +20,55 @@ from prompt_toolkit.layout import (
     ConditionalContainer,
 )
 from prompt_toolkit.layout.processors import BeforeInput
-from prompt_toolkit.lexers import PygmentsLexer, DynamicLexer
+from prompt_toolkit.lexers import PygmentsLexer, Lexer
 from prompt_toolkit.output import ColorDepth
 from prompt_toolkit.widgets import FormattedTextToolbar, VerticalLine, Dialog, Label
 
 from textomatic import context
 from textomatic.app import style
-from textomatic.app.lexer import CommandLexer
-from textomatic.processor import outputs, inputs
-from textomatic.exceptions import ProcessException
+from textomatic.app.lexer import CommandLexer, lexer_cls, lex_lines
+from textomatic.processor import outputs, inputs, profiling, mapped
+from textomatic.exceptions import ProcessException, ProcessCancelled
 from textomatic.app.keys import kb, cmd_kb
 from textomatic.processor.process import process
+from textomatic.processor.incremental import IncrementalProcessor
 from textomatic.app.style import application_style
-from textomatic.app.widgets import textbox
+from textomatic.app.widgets import textbox, LinesControl
+from textomatic.model import ProcessContext, ProcessedCommand
 from textomatic.processor.registry import Registry
 from textomatic.text import as_printable
 
+DEBOUNCE_SECONDS = 0.05
+PROCESSING_REFRESH_SECONDS = 0.1
+SYNC_FROM_START_MAX_SIZE = 100000
+LEX_BLOCK_SIZE = 100
+SYNC_MARGIN = 50
+# smaller inputs are processed in full right away
+PREVIEW_MIN_SIZE = 1 << 20
+# the number of lines a preview processes
+PREVIEW_LINES = 500
+
 
 class AppBuilder:
     def __init__(self):
         self.ctx = context.get()
         self.process_ctx = context.get_process()
         self.ctx.process_fn = self.process_key
-        self.lexer_threshold = 10000
-        self.input_lexer = ToggledLexer(inputs.registry, take_last=False)
-        self.output_lexer = ToggledLexer(outputs.registry, take_last=True)
+        self.ctx.complete_fn = self.complete
+        self.input_lexer = ProcessorLexer(inputs.registry, take_last=False)
+        self.output_lexer = ProcessorLexer(outputs.registry, take_last=True)
+        self.lazy_output_control = LinesControl(lambda: self.ctx.lazy_output, self.output_lexer.get_lexer_cls)
+        self.mapped_input_control = LinesControl(lambda: self.ctx.mapped_input, self.input_lexer.get_lexer_cls)
+        self.incremental = IncrementalProcessor()
+        # previews have a context of their own, so they do not replace the state of full runs
+        self.preview_ctx = ProcessContext(ProcessedCommand(""))
+        self.generation = 0
+        self.pending_triggers = set()
+        self.unprocessed_triggers = set()
+        self.debounce_handle = None
+        self.cancelled = None
+        self.jobs = queue.Queue()
+        self.worker = None
 
     def create_app(self, focus):
         ctx = self.ctx
@@ -51,13 +79,13 @@ class AppBuilder:
             focused_element = {
                 "COMMAND": ctx.cmd_buffer,
                 "c": ctx.cmd_buffer,
-                "INPUT": ctx.input_buffer,
-                "i": ctx.input_buffer,
-                "OUTPUT": ctx.output_buffer,
-                "o": ctx.output_buffer,
+                "INPUT": self.input_focus_target(),
+                "i": self.input_focus_target(),
+                "OUTPUT": self.output_focus_target(),
+                "o": self.output_focus_target(),
             }[focus]
         else:
-            focused_element = ctx.cmd_buffer if ctx.input_buffer.text else ctx.input_buffer
+            focused_element = ctx.cmd_buffer if ctx.input_buffer.text or ctx.mapped_input else ctx.input_buffer
         layout = Layout(
             FloatContainer(
                 HSplit(
@@ -73,7 +101,7 @@ class AppBuilder:
             ),
             focused_element=focused_element,
         )
-        return Application(
+        app = Application(
             key_bindings=kb,
             editing_mode=EditingMode.VI,
             clipboard=PyperclipClipboard(),
@@ -84,45 +112,259 @@ class AppBuilder:
             style=application_style,
             layout=layout,
         )
+        if ctx.follow_input is not None:
+            # the lines are appended by the loop of the application, which only exists once it runs
+            app.pre_run_callables.append(self.follow)
+        return app
+
+    def follow(self):
+        """Append the batches of lines of ctx.follow_input to INPUT as they arrive, reading them in a thread"""
+        ctx = self.ctx
+        loop = ctx.app.loop
+
+        def read():
+            try:
+                for lines in ctx.follow_input:
+                    loop.call_soon_threadsafe(self.append_input, lines)
+            except Exception as e:
+                loop.call_soon_threadsafe(self.show_follow_error, e)
+
+        threading.Thread(target=read, daemon=True).start()
+
+    def append_input(self, lines):
+        # appended lines are processed incrementally, as any other edit at the end of INPUT
+        buffer = self.ctx.input_buffer
+        added = "\n".join(lines)
+        text = f"{buffer.text}\n{added}" if buffer.text else added
+        buffer.set_document(Document(text, buffer.cursor_position), bypass_readonly=True)
+
+    def show_follow_error(self, e):
+        self.show_error(e)
+        self.ctx.app.invalidate()
 
     def process_key(self, trigger=None):
         ctx = self.ctx
         ctx.current_error = None
         ctx.display_help = False
-        self.input_lexer.enabled = len(ctx.input_buffer.text) < self.lexer_threshold
         if not ctx.live and trigger != "run":
             ctx.dirty = True
             return
         if trigger:
             trigger = "cmd" if trigger is ctx.cmd_buffer else "input"
+        self.pending_triggers.add(trigger)
+        self.generation += 1
+        if self.cancelled:
+            self.cancelled.set()
+        if self.debounce_handle:
+            self.debounce_handle.cancel()
+            self.debounce_handle = None
+        if ctx.app and not ctx.non_interactive:
+            self.debounce_handle = ctx.app.loop.call_later(DEBOUNCE_SECONDS, self.submit)
+            return
+        triggers, self.pending_triggers = self.pending_triggers, set()
+        self.process_ctx.cancelled = None
         try:
-            result = process(
-                text=ctx.input_buffer.text,
-                cmd=ctx.cmd_buffer.text,
-                ctx=self.process_ctx,
-                trigger=trigger,
-            )
-            if result is not None:
-                if not isinstance(result, str):
-                    result = str(result)
-                self.output_lexer.enabled = len(result) < self.lexer_threshold
-                ctx.output_buffer._set_text(result)
-            ctx.dirty = False
+            result = self.run(ctx.input_buffer.text, ctx.cmd_buffer.text, ctx.input_buffer.cursor_position, triggers)
         except Exception as e:
             if ctx.non_interactive:
                 raise
-            if isinstance(e, ProcessException):
-                ctx.current_error = str(e)
+            self.show_error(e)
+        else:
+            self.show_result(result, self.process_ctx.profile)
+
+    def submit(self):
+        """Run processing in the worker thread. Only the result of the newest run is shown"""
+        ctx = self.ctx
+        self.debounce_handle = None
+        triggers, self.pending_triggers = self.pending_triggers, set()
+        generation = self.generation
+        self.cancelled = cancelled = threading.Event()
+        text, cmd, position = ctx.input_buffer.text, ctx.cmd_buffer.text, ctx.input_buffer.cursor_position
+        loop = ctx.app.loop
+        # edits of the input are usually processed incrementally, everything else is previewed first
+        head_end = None if triggers == {"input"} or ctx.mapped_input else _head_end(text)
+
+        def job():
+            self.process_ctx.cancelled = cancelled
+            if head_end is not None:
+                self.preview(generation, text, head_end, cmd)
+            try:
+                result = self.run(text, cmd, position, triggers)
+            except Exception as e:
+                loop.call_soon_threadsafe(self.done, generation, None, e)
             else:
-                ctx.current_error = f"{e.__class__.__name__}: {e}"
+                loop.call_soon_threadsafe(self.done, generation, result, None, self.process_ctx.profile)
+
+        if ctx.processing_start_time is None:
+            ctx.processing_start_time = time.monotonic()
+            self.refresh_processing_status()
+        self.put_job(job)
+
+    def schedule(self, fn):
+        """Run fn in the worker thread, after the runs already submitted, and redraw once it is done"""
+        app = self.ctx.app
+        if not app:
+            fn()
+            return
+
+        def job():
+            fn()
+            app.loop.call_soon_threadsafe(app.invalidate)
+
+        self.put_job(job)
+
+    def put_job(self, job):
+        if not self.worker:
+            self.worker = threading.Thread(target=self.work, daemon=True)
+            self.worker.start()
+        self.jobs.put(job)
+
+    def preview(self, generation, text, head_end, cmd):
+        """Process the head of text, showing it until the full run is done"""
+        loop = self.ctx.app.loop
+        try:
+            result = process(text=text[:head_end], cmd=cmd, ctx=self.preview_ctx)
+        except Exception as e:
+            loop.call_soon_threadsafe(self.done_preview, generation, None, None, e)
+            return
+        rows = self.preview_ctx.processed_input.rows
+        preview_rows = len(rows) if isinstance(rows, list) else PREVIEW_LINES
+        # the rest of the input is assumed to hold a row per line
+        total_rows = preview_rows + text.count("\n", head_end) + (not text.endswith("\n"))
+        loop.call_soon_threadsafe(self.done_preview, generation, result, (preview_rows, total_rows), None)
+
+    def done_preview(self, generation, result, preview, error):
+        # errors in the head are shown right away, while the full run goes on in case it succeeds
+        ctx = self.ctx
+        if generation != self.generation or ctx.processing_start_time is None:
+            return
+        if error:
+            self.show_error(error)
+        else:
+            self.show_result(result)
+            ctx.preview = preview
+        ctx.app.invalidate()
+
+    def complete(self):
+        """Replace a preview, or the output of a run that did not finish yet, with the output of the whole
+        input, processing it in the foreground"""
+        ctx = self.ctx
+        if not ctx.preview and ctx.processing_start_time is None and not self.debounce_handle:
+            return
+        if self.debounce_handle:
+            self.debounce_handle.cancel()
+            self.debounce_handle = None
+        self.pending_triggers.clear()
+        self.generation += 1
+        if self.cancelled:
+            self.cancelled.set()
+        ctx.processing_start_time = None
+        process_ctx = ProcessContext(ProcessedCommand(""))
+        try:
+            if ctx.mapped_input:
+                result = mapped.process_mapped(ctx.mapped_input, ctx.cmd_buffer.text, process_ctx, self.schedule)
+            else:
+                result = process(text=ctx.input_buffer.text, cmd=ctx.cmd_buffer.text, ctx=process_ctx, lazy=True)
+        except Exception as e:
+            self.show_error(e)
+        else:
+            self.show_result(result)
+
+    def work(self):
+        while True:
+            self.jobs.get()()
+
+    def run(self, text, cmd, position, triggers):
+        # triggers of runs that were cancelled are carried over, so their changes are not lost
+        self.unprocessed_triggers |= triggers
+        trigger = next(iter(self.unprocessed_triggers)) if len(self.unprocessed_triggers) == 1 else None
+        self.process_ctx.profile = profile = profiling.Profile()
+        try:
+            result = None
+            if self.ctx.mapped_input:
+                with profiling.profiled(profile), profiling.stage("mapped"):
+                    return mapped.process_mapped(self.ctx.mapped_input, cmd, self.process_ctx, self.schedule)
+            if trigger == "input":
+                with profiling.profiled(profile), profiling.stage("incremental"):
+                    result = self.incremental.process(
+                        text=text, cmd=cmd, ctx=self.process_ctx, position=position, lazy=True
+                    )
+            if result is None:
+                result = process(text=text, cmd=cmd, ctx=self.process_ctx, trigger=trigger, lazy=True)
+                if result is not None:
+                    self.incremental.reset(text, self.process_ctx, result)
+        except ProcessCancelled:
+            self.incremental.reset()
+            # the command was already stored, so the next run must not skip it as unchanged
+            self.unprocessed_triggers.add(None)
+            raise
+        except Exception:
+            self.incremental.reset()
+            self.unprocessed_triggers.clear()
+            raise
+        self.unprocessed_triggers.clear()
+        return result
+
+    def done(self, generation, result, error, profile=None):
+        ctx = self.ctx
+        if generation != self.generation:
+            return
+        ctx.processing_start_time = None
+        if error:
+            self.show_error(error)
+        else:
+            self.show_result(result, profile)
+        ctx.app.invalidate()
+
+    def show_result(self, result, profile=None):
+        ctx = self.ctx
+        ctx.preview = None
+        if result is not None:
+            ctx.profile = profile
+            focused = ctx.app and ctx.app.layout.has_focus(self.output_focus_target())
+            if isinstance(result, (outputs.LazyOutput, mapped.MappedOutput)):
+                ctx.lazy_output = result
+                ctx.output_buffer._set_text("")
+            else:
+                if not isinstance(result, str):
+                    result = str(result)
+                ctx.lazy_output = None
+                ctx.output_buffer._set_text(result)
+            if focused:
+                ctx.app.layout.focus(self.output_focus_target())
+        ctx.dirty = False
+
+    def input_focus_target(self):
+        return self.mapped_input_control if self.ctx.mapped_input else self.ctx.input_buffer
+
+    def output_focus_target(self):
+        return self.lazy_output_control if self.ctx.lazy_output else self.ctx.output_buffer
+
+    def show_error(self, e):
+        ctx = self.ctx
+        ctx.preview = None
+        ctx.current_error = _error_text(e)
+
+    def refresh_processing_status(self):
+        ctx = self.ctx
+        if ctx.processing_start_time is None:
+            return
+        ctx.app.invalidate()
+        ctx.app.loop.call_later(PROCESSING_REFRESH_SECONDS, self.refresh_processing_status)
 
     def create_status_bar(self):
         ctx = self.ctx
         process_ctx = self.process_ctx
 
+        def _current_error():
+            # outputs of mapped files may only fail once their lines are displayed, see mapped.MappedOutput
+            output_error = getattr(ctx.lazy_output, "error", None)
+            return ctx.current_error or (_error_text(output_error) if output_error else None)
+
         def _get_text():
             cmd = process_ctx.processed_command
-            if ctx.current_error:
+            current_error = _current_error()
+            if current_error:
                 result = ["{current_error}"]
             else:
                 current = ctx.app.layout.current_buffer
@@ -130,7 +372,9 @@ class AppBuilder:
                     id(ctx.cmd_buffer): "COMMAND",
                     id(ctx.input_buffer): "INPUT",
                     id(ctx.output_buffer): "OUTPUT",
-                }[id(current)]
+                }.get(id(current))
+                if not focused:
+                    focused = "INPUT" if ctx.app.layout.current_control is self.mapped_input_control else "OUTPUT"
                 mode = "live" if ctx.live else "manual"
                 elem = "ansired" if ctx.dirty else "ansigreen"
                 mode = f"<{elem}>{mode}</{elem}>"
@@ -144,6 +388,13 @@ class AppBuilder:
                     f"header:{str(cmd.has_header).lower()}|",
                     f"raw:{str(cmd.raw).lower()}",
                 ]
+                if ctx.preview:
+                    result.append("|<ansiyellow>preview: {preview}</ansiyellow>")
+                if ctx.processing_start_time is not None:
+                    elapsed = time.monotonic() - ctx.processing_start_time
+                    result.append(f"|<ansiyellow>processing {elapsed:.1f}s</ansiyellow>")
+                elif ctx.profile and ctx.profile.stages:
+                    result.append("|{profile}")
                 if ctx.copied_to_clipboard:
                     result.append(" [Copied output to clipboard]")
             inp = ",".join([i.alias for i in cmd.inputs or []] or ["c"])
@@ -152,13 +403,15 @@ class AppBuilder:
                 input=inp,
                 output=out,
                 delimiter=as_printable(cmd.delimiter) or "auto",
-                current_error=str(ctx.current_error),
+                current_error=str(current_error),
+                profile=_format_profile(ctx.profile),
+                preview="{} of ~{} rows".format(*ctx.preview) if ctx.preview else "",
             )
 
         def _get_style():
             if ctx.copied_to_clipboard:
                 cls = style.STATUS_BAR_NOTIFY
-            elif ctx.current_error:
+            elif _current_error():
                 cls = style.STATUS_BAR_ERROR
             else:
                 cls = style.STATUS_BAR
@@ -168,8 +421,10 @@ class AppBuilder:
 
     def create_boxes(self):
         ctx = self.ctx
-        input_box = textbox(ctx.input_buffer, "INPUT", lexer=self.input_lexer)
-        output_box = textbox(ctx.output_buffer, "OUTPUT", lexer=self.output_lexer)
+        input_box = textbox(ctx.input_buffer, "INPUT", lexer=self.input_lexer, lazy_control=self.mapped_input_control)
+        output_box = textbox(
+            ctx.output_buffer, "OUTPUT", lexer=self.output_lexer, lazy_control=self.lazy_output_control
+        )
         vertical_boxes = VSplit([input_box, VerticalLine(), output_box])
         horizontal_boxes = HSplit([input_box, output_box])
         return DynamicContainer(lambda: vertical_boxes if ctx.box_veritcal_orientation else horizontal_boxes)
@@ -204,8 +459,8 @@ class AppBuilder:
                 dedent(
                     """
                     Tab               Switch focus between INPUT/OUTPUT/COMMAND
-                    Ctrl-P            Copy OUTPUT to clipboard
-                    Ctrl-O            Exit and print OUTPUT to stdout
+                    Ctrl-P            Copy OUTPUT to clipboard (processing all of INPUT first if previewed)
+                    Ctrl-O            Exit and print OUTPUT to stdout (same)
                     Ctrl-C            Exit
                     Ctrl-T            Toggle vertical/horizontal view
                     Ctrl-L            Toggle live/manual mode
@@ -222,28 +477,76 @@ class AppBuilder:
         return ConditionalContainer(dialog, Condition(lambda: ctx.display_help))
 
 
-class ToggledLexer(DynamicLexer):
+class ProcessorLexer(Lexer):
+    """Highlights with the lexer of the first or last processor of the current command.
+
+    Documents up to SYNC_FROM_START_MAX_SIZE are lexed from their start. Larger ones are lexed in blocks
+    of lines around the displayed ones, each starting SYNC_MARGIN lines early so tokens that span lines
+    are usually complete.
+    """
+
     def __init__(self, registry: Registry, take_last):
-        self.enabled = True
         self.registry = registry
+        self.take_last = take_last
+        self.lexers = {}
 
-        def get_lexer():
-            if not self.enabled:
-                return None
-            process_ctx = context.get_process()
-            processors = self.registry.get(process_ctx.processed_command, safe=True)
-            processor = processors[-1] if take_last else processors[0]
-            return PygmentsLexer(processor.lexer)
+    def get_lexer_cls(self):
+        process_ctx = context.get_process()
+        processors = self.registry.get(process_ctx.processed_command, safe=True)
+        processor = processors[-1] if self.take_last else processors[0]
+        return lexer_cls(processor.lexer)
 
-        super().__init__(get_lexer)
+    def lex_document(self, document):
+        cls = self.get_lexer_cls()
+        if len(document.text) <= SYNC_FROM_START_MAX_SIZE:
+            pygments_lexer = self.lexers.get(cls)
+            if not pygments_lexer:
+                pygments_lexer = self.lexers[cls] = PygmentsLexer(cls)
+            return pygments_lexer.lex_document(document)
 
+        lines = document.lines
+        blocks = {}
 
-def process_one():
-    builder = AppBuilder()
-    builder.process_key()
+        def get_line(i):
+            start = i - i % LEX_BLOCK_SIZE
+            block = blocks.get(start)
+            if block is None:
+                sync_start = max(start - SYNC_MARGIN, 0)
+                text = "\n".join(lines[sync_start : start + LEX_BLOCK_SIZE])
+                block = blocks[start] = lex_lines(cls, text)[start - sync_start :]
+            return block[i - start] if i - start < len(block) else []
+
+        return get_line
+
+    def invalidation_hash(self):
+        return self.get_lexer_cls()
 
 
 def create_app(focus):
     builder = AppBuilder()
     builder.process_key()
     return builder.create_app(focus)
+
+
+def _error_text(e):
+    return str(e) if isinstance(e, ProcessException) else f"{e.__class__.__name__}: {e}"
+
+
+def _head_end(text):
+    # the end of the first PREVIEW_LINES lines, or None if text is small enough to process in full
+    if len(text) < PREVIEW_MIN_SIZE:
+        return None
+    end = 0
+    for _ in range(PREVIEW_LINES):
+        end = text.find("\n", end) + 1
+        if not end:
+            return None
+    return end
+
+
+def _format_profile(profile):
+    # the total time and the stage most of it went to
+    if not profile or not profile.stages:
+        return ""
+    slowest = profile.slowest()
+    return f"{profile.seconds * 1000:.0f}ms ({slowest.name} {slowest.seconds * 1000:.0f}ms)"
@@ -19,6 +19,7 @@ def change_boxes_orientation(_):
 @kb.add("c-o")
 def exit_and_print_output(_):
     ctx = context.get()
+    ctx.complete_fn()
     ctx.print_output_on_exit = True
     ctx.app.exit()
 
@@ -26,7 +27,8 @@ def exit_and_print_output(_):
 @kb.add("c-p")
 def copy_output_to_clipboard(_):
     ctx = context.get()
-    ctx.app.clipboard.set_text(ctx.output_buffer.text)
+    ctx.complete_fn()
+    ctx.app.clipboard.set_text(ctx.output_text())
     ctx.copied_to_clipboard = True
 
     def off():
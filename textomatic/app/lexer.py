@@ -1,12 +1,45 @@
+import functools
+from typing import List
+
+from prompt_toolkit.formatted_text import PygmentsTokens, to_formatted_text, StyleAndTextTuples
+from prompt_toolkit.formatted_text.utils import split_lines
 from pygments.lexer import RegexLexer, bygroups
+from pygments.lexers import find_lexer_class_by_name
 from pygments.token import Text, Keyword, Operator
 
+from textomatic.processor.common import LRUCache
+
 
 class CommandLexer(RegexLexer):
     tokens = {
         "root": [
-            (r"([iosthrd])(:)", bygroups(Keyword, Text)),
+            (r"([iosthrdwn])(:)", bygroups(Keyword, Text)),
             (r";", Operator),
             (r".", Text),
         ],
     }
+
+
+LEXED_TEXTS_CACHE_SIZE = 1024
+
+_lexers = {}
+_lexed_texts = LRUCache(LEXED_TEXTS_CACHE_SIZE)
+
+
+@functools.lru_cache(maxsize=None)
+def lexer_cls(lexer):
+    """Return the pygments lexer class for a lexer class or alias"""
+    return find_lexer_class_by_name(lexer) if isinstance(lexer, str) else lexer
+
+
+def lex_lines(cls, text) -> List[StyleAndTextTuples]:
+    """Return the highlighted lines of text. Results are cached per lexer class and text"""
+
+    def lex():
+        lexer = _lexers.get(cls)
+        if not lexer:
+            lexer = _lexers[cls] = cls(stripnl=False, stripall=False, ensurenl=False)
+        tokens = [(t, v) for _, t, v in lexer.get_tokens_unprocessed(text)]
+        return list(split_lines(to_formatted_text(PygmentsTokens(tokens))))
+
+    return _lexed_texts.get((cls, text), lex)
@@ -1,33 +1,152 @@
-from prompt_toolkit.layout import HSplit, Window, BufferControl
+from prompt_toolkit.application import get_app
+from prompt_toolkit.data_structures import Point
+from prompt_toolkit.key_binding import KeyBindings
+from prompt_toolkit.layout import HSplit, Window, BufferControl, UIControl, UIContent, DynamicContainer
+from prompt_toolkit.mouse_events import MouseEventType
 from prompt_toolkit.widgets import FormattedTextToolbar
 
 from textomatic import context
 from textomatic.app import style
+from textomatic.app.lexer import lex_lines
 
 
-def textbox(buffer, title, lexer=None):
+def textbox(buffer, title, lexer=None, lazy_control=None):
     def get_style():
         ctx = context.get()
-        if ctx.app.layout.current_buffer is buffer:
+        layout = ctx.app.layout
+        if layout.current_buffer is buffer or (lazy_control and layout.current_control is lazy_control):
             cls = style.TEXTBOX_FOCUSED
         else:
             cls = style.TEXTBOX
         return f"class:{cls}"
 
+    body = Window(
+        cursorline=True,
+        content=BufferControl(
+            buffer=buffer,
+            focus_on_click=True,
+            lexer=lexer,
+        ),
+        ignore_content_width=True,
+    )
+    if lazy_control:
+        lazy_body = Window(
+            cursorline=True,
+            content=lazy_control,
+            ignore_content_width=True,
+        )
+        buffer_body = body
+        body = DynamicContainer(lambda: lazy_body if lazy_control.get_lines() else buffer_body)
+
     return HSplit(
         [
             FormattedTextToolbar(
                 text=title,
                 style=get_style,
             ),
-            Window(
-                cursorline=True,
-                content=BufferControl(
-                    buffer=buffer,
-                    focus_on_click=True,
-                    lexer=lexer,
-                ),
-                ignore_content_width=True,
-            ),
+            body,
         ]
     )
+
+
+class LinesControl(UIControl):
+    """Displays a read only text that is too large for a buffer, only getting the visible lines.
+
+    get_lines returns the text, anything with a line_count and a line method, e.g. AppContext.lazy_output
+    or AppContext.mapped_input, or None when there is none. Lines are highlighted on their own.
+    """
+
+    def __init__(self, get_lines, get_lexer_cls=None):
+        self.x = 0
+        self.y = 0
+        self.key_bindings = _lines_kb(self)
+        self.get_lines = get_lines
+        self.get_lexer_cls = get_lexer_cls
+
+    def is_focusable(self):
+        return True
+
+    def create_content(self, width, height):
+        output = self.get_lines()
+        line_count = output.line_count if output else 0
+        self.y = max(min(self.y, line_count - 1), 0)
+
+        lexer_cls = self.get_lexer_cls() if self.get_lexer_cls else None
+
+        def get_line(i):
+            line = output.line(i).replace("\n", "\\n")
+            if not lexer_cls:
+                return [("", line)]
+            return lex_lines(lexer_cls, line)[0]
+
+        return UIContent(get_line=get_line, line_count=line_count, cursor_position=Point(x=self.x, y=self.y))
+
+    def mouse_handler(self, mouse_event):
+        if mouse_event.event_type != MouseEventType.MOUSE_UP:
+            return NotImplemented
+        get_app().layout.current_control = self
+        self.x, self.y = mouse_event.position.x, mouse_event.position.y
+        return None
+
+    def move_cursor_down(self):
+        self.y += 1
+
+    def move_cursor_up(self):
+        self.y = max(self.y - 1, 0)
+
+    def get_key_bindings(self):
+        return self.key_bindings
+
+
+def _lines_kb(control):
+    kb = KeyBindings()
+
+    def page(event):
+        info = event.app.layout.current_window.render_info
+        return max(info.window_height - 1, 1) if info else 1
+
+    def move(keys, fn):
+        for key in keys:
+            kb.add(*key)(fn)
+
+    def up(event):
+        control.y = max(control.y - event.arg, 0)
+
+    def down(event):
+        control.y += event.arg
+
+    def left(event):
+        control.x = max(control.x - event.arg, 0)
+
+    def right(event):
+        control.x += event.arg
+
+    def page_up(event):
+        control.y = max(control.y - page(event), 0)
+
+    def page_down(event):
+        control.y += page(event)
+
+    def first_line(_):
+        control.y = 0
+
+    def last_line(_):
+        control.y = control.get_lines().line_count - 1
+
+    def line_start(_):
+        control.x = 0
+
+    def line_end(_):
+        control.x = len(control.get_lines().line(control.y))
+
+    move([("up",), ("k",)], up)
+    move([("down",), ("j",)], down)
+    move([("left",), ("h",)], left)
+    move([("right",), ("l",)], right)
+    move([("pageup",), ("c-b",)], page_up)
+    move([("pagedown",), ("c-f",)], page_down)
+    move([("home",), ("g", "g")], first_line)
+    move([("end",), ("G",)], last_line)
+    move([("0",)], line_start)
+    move([("$",)], line_end)
+    return kb
@@ -0,0 +1,165 @@
+import json
+import time
+import tracemalloc
+from dataclasses import dataclass, asdict
+from typing import List, Dict
+
+from textomatic.model import ProcessContext, ProcessedCommand
+from textomatic.processor.process import process
+
+SIZES = [1000, 10000, 100000, 1000000]
+DEFAULT_SIZES = [1000, 10000, 100000]
+WIDE_COLUMNS = 30
+# slower runs than this ratio of the baseline are reported as regressions
+DEFAULT_THRESHOLD = 1.5
+
+
+@dataclass
+class Benchmark:
+    name: str
+    # csv, jl or sh
+    format: str
+    # narrow or wide
+    shape: str
+    cmd: str
+
+
+@dataclass
+class Result:
+    name: str
+    rows: int
+    seconds: float
+    rows_per_sec: float
+    peak_memory: int
+    # seconds relative to the baseline, if one was given
+    ratio: float = None
+
+    @property
+    def key(self):
+        return f"{self.name}@{self.rows}"
+
+
+BENCHMARKS = [
+    # inputs
+    Benchmark("input-c", "csv", "narrow", "h;o:n"),
+    Benchmark("input-c-wide", "csv", "wide", "h;o:n"),
+    Benchmark("input-jl", "jl", "narrow", "i:jl;o:n"),
+    Benchmark("input-jl-wide", "jl", "wide", "i:jl;o:n"),
+    Benchmark("input-sh", "sh", "narrow", "i:sh;h;o:n"),
+    Benchmark("input-jq", "jl", "narrow", "i:jq`{a, c}`,jl;o:n"),
+    Benchmark("input-n", "csv", "narrow", "r;o:n"),
+    # outputs
+    Benchmark("output-l", "csv", "narrow", "h;o:l"),
+    Benchmark("output-j", "csv", "narrow", "h;o:j"),
+    Benchmark("output-jl", "csv", "narrow", "h;o:jl"),
+    Benchmark("output-c", "csv", "narrow", "h;o:c"),
+    Benchmark("output-t", "csv", "narrow", "h;o:t"),
+    Benchmark("output-h", "csv", "narrow", "h;o:h"),
+    Benchmark("output-jq", "csv", "narrow", "h;o:jl,jq`.[0]`"),
+    Benchmark("output-n", "csv", "narrow", "h;o:n"),
+    # types and structure
+    Benchmark("types", "csv", "narrow", "h;t:i,f;o:n"),
+    Benchmark("types-named", "jl", "narrow", "i:jl;t:a:s,b:i;o:n"),
+    Benchmark("types-wide", "csv", "wide", "h;t:i,f,s,i,f;o:n"),
+    Benchmark("structure", "csv", "narrow", "h;s:{x:a,y:[b,c]};o:n"),
+    Benchmark("types-structure", "csv", "narrow", "h;t:a:i;s:{x:b,y:{k:a}};o:jl"),
+]
+
+
+def generate(format: str, shape: str, rows: int) -> str:
+    """Return a synthetic dataset. Narrow ones have an int, a float and a string column, wide ones repeat them"""
+    columns = 3 if shape == "narrow" else WIDE_COLUMNS
+    headers = [chr(ord("a") + i) if i < 26 else f"c{i}" for i in range(columns)]
+
+    def values(i):
+        return [(i, i * 0.5, f"v{i}")[j % 3] for j in range(columns)]
+
+    if format == "csv":
+        lines = [",".join(headers)] + [",".join(map(str, values(i))) for i in range(rows)]
+    elif format == "sh":
+        lines = [" ".join(headers)] + [" ".join(map(str, values(i))) for i in range(rows)]
+    elif format == "jl":
+        lines = [json.dumps(dict(zip(headers, values(i)))) for i in range(rows)]
+    else:
+        raise ValueError(f"Unknown format: {format}")
+    return "\n".join(lines)
+
+
+def run(sizes: List[int] = None, name_filter: str = None, repeat: int = 3, baseline: Dict = None) -> List[Result]:
+    """Run benchmarks whose name contains name_filter on each size, timing the best of repeat runs.
+
+    Peak memory is measured in a separate run, as tracing allocations slows processing down.
+    """
+    results = []
+    datasets = {}
+    for rows in sizes or DEFAULT_SIZES:
+        for benchmark in BENCHMARKS:
+            if name_filter and name_filter not in benchmark.name:
+                continue
+            key = (benchmark.format, benchmark.shape, rows)
+            if key not in datasets:
+                datasets.clear()
+                datasets[key] = generate(*key)
+            text = datasets[key]
+            # also warms up caches and lazy imports before timing
+            peak_memory = _peak_memory(text, benchmark.cmd)
+            seconds = min(_time(text, benchmark.cmd) for _ in range(repeat))
+            result = Result(
+                name=benchmark.name,
+                rows=rows,
+                seconds=seconds,
+                rows_per_sec=rows / seconds if seconds else float("inf"),
+                peak_memory=peak_memory,
+            )
+            if baseline and result.key in baseline:
+                result.ratio = seconds / baseline[result.key]["seconds"]
+            results.append(result)
+    return results
+
+
+def regressions(results: List[Result], threshold: float = DEFAULT_THRESHOLD) -> List[Result]:
+    return [r for r in results if r.ratio is not None and r.ratio > threshold]
+
+
+def save_baseline(results: List[Result], path: str, baseline: Dict = None):
+    """Save results to path, keeping entries of the previous baseline that were not run again"""
+    data = dict(baseline or {})
+    for result in results:
+        data[result.key] = {k: v for k, v in asdict(result).items() if k != "ratio"}
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+
+
+def load_baseline(path: str) -> Dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def format_results(results: List[Result]) -> str:
+    lines = [f"{'name':<20}{'rows':>10}{'seconds':>12}{'rows/sec':>14}{'peak MB':>10}{'vs base':>10}"]
+    for r in results:
+        ratio = f"{r.ratio:.2f}x" if r.ratio is not None else "-"
+        lines.append(
+            f"{r.name:<20}{r.rows:>10}{r.seconds:>12.4f}{r.rows_per_sec:>14.0f}"
+            f"{r.peak_memory / (1 << 20):>10.1f}{ratio:>10}"
+        )
+    return "\n".join(lines)
+
+
+def _process(text, cmd):
+    return process(text=text, cmd=cmd, ctx=ProcessContext(ProcessedCommand("")))
+
+
+def _time(text, cmd):
+    start = time.perf_counter()
+    _process(text, cmd)
+    return time.perf_counter() - start
+
+
+def _peak_memory(text, cmd):
+    tracemalloc.start()
+    try:
+        _process(text, cmd)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
@@ -4,13 +4,15 @@ from dataclasses import dataclass
 from prompt_toolkit import Application
 from prompt_toolkit.buffer import Buffer
 
-from textomatic.model import ProcessedCommand, ProcessedInput
+from textomatic.model import ProcessContext
 
 
 @dataclass
 class AppContext:
     app: Application = None
     process_fn = None
+    # replaces a preview with the output of the whole input
+    complete_fn = None
     box_veritcal_orientation = True
     display_help = False
     print_output_on_exit: bool = False
@@ -20,16 +22,24 @@ class AppContext:
     current_error: str = None
     copied_to_clipboard = False
     dirty = False
+    processing_start_time: float = None
+    # the number of rows the output is a preview of and the estimated number of rows in the input
+    preview: tuple = None
+    # set instead of the output_buffer text for large outputs, see outputs.LazyOutput
+    lazy_output: object = None
+    # set instead of the input_buffer text for large files, see mapped.MappedFile
+    mapped_input: object = None
+    # the profiling.Profile of the run the output is the result of
+    profile: object = None
+    # batches of lines that are appended to INPUT as they arrive, see follow
+    follow_input: object = None
 
     cmd_buffer: Buffer = Buffer(multiline=False)
     input_buffer: Buffer = Buffer()
     output_buffer: Buffer = Buffer(read_only=True)
 
-
-@dataclass
-class ProcessContext:
-    processed_command: ProcessedCommand = ProcessedCommand("")
-    processed_input: ProcessedInput = None
+    def output_text(self) -> str:
+        return str(self.lazy_output) if self.lazy_output else self.output_buffer.text
 
 
 _current = ContextVar("current", default=AppContext())
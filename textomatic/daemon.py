@@ -0,0 +1,369 @@
+"""The tm serve daemon and the client that forwards tm invocations to it.
+
+The client is what the tm script runs. When a daemon listens on the socket, the arguments, working directory and
+stdin of the invocation are sent to it, and the daemon runs them like tm would, with its modules imported and its
+caches of parsed commands, compiled row processors and sniffed csv dialects warm. Its output, errors and exit code are
+sent back as frames. Anything the daemon does not serve, e.g. the UI, or no daemon at all, runs in the client as usual.
+
+Only the standard library is imported at the top of this module, as importing it is most of the startup time of the
+client.
+"""
+import os
+import socket
+import stat
+import struct
+import sys
+import threading
+
+# frames are a kind and the length of their payload
+_HEADER = struct.Struct(">cI")
+# the working directory, whether stdin is a terminal and the arguments, separated by NUL, which arguments cannot hold
+_REQUEST = b"r"
+_STDOUT = b"o"
+_STDERR = b"e"
+_EXIT = b"x"
+# the first frame is either of these, unless the arguments are invalid. stdin is only sent once they are accepted
+_ACCEPT = b"a"
+_LOCAL = b"l"
+CHUNK_SIZE = 1 << 16
+# output is sent in frames of about this size
+OUTPUT_BUFFER_SIZE = 1 << 16
+
+
+def socket_path() -> str:
+    """Return the path of the socket the daemon listens on: $TM_SOCKET, or a per user path in $XDG_RUNTIME_DIR,
+    falling back to the temp directory"""
+    if os.environ.get("TM_SOCKET"):
+        return os.environ["TM_SOCKET"]
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR") or os.environ.get("TMPDIR") or "/tmp"
+    return os.path.join(runtime_dir, f"textomatic-{os.getuid()}.sock")
+
+
+def cli():
+    code = None
+    if len(sys.argv) > 1 and hasattr(socket, "AF_UNIX"):
+        code = run_client(socket_path(), sys.argv[1:])
+    if code is None:
+        from textomatic.main import cli as local_cli
+
+        local_cli()
+    else:
+        sys.exit(code)
+
+
+def run_client(path, args):
+    """Run args in the daemon listening on path and return the exit code, or None if they should run locally"""
+    if not _is_own_socket(path):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except OSError:
+        # e.g. the socket of a daemon that was killed
+        sock.close()
+        return None
+    with sock:
+        stdin_tty = sys.stdin is None or sys.stdin.isatty()
+        request = "\0".join([os.getcwd(), "1" if stdin_tty else "", *args])
+        _send_frame(sock, _REQUEST, os.fsencode(request))
+        frames = _read_frames(sock.makefile("rb"))
+        kind, payload = next(frames, (_EXIT, b"1"))
+        if kind == _LOCAL:
+            return None
+        if stdin_tty:
+            sock.shutdown(socket.SHUT_WR)
+        else:
+            # stdin is sent while output is received, as the daemon may write output before reading all of it
+            threading.Thread(target=_send_stdin, args=(sock,), daemon=True).start()
+        try:
+            while kind != _EXIT:
+                if kind in (_STDOUT, _STDERR):
+                    stream = sys.stdout if kind == _STDOUT else sys.stderr
+                    stream.buffer.write(payload)
+                    stream.flush()
+                kind, payload = next(frames, (_EXIT, b"1"))
+        except BrokenPipeError:
+            # e.g. output piped into head. stdout is replaced, so that flushing it on exit does not fail again
+            sys.stdout = open(os.devnull, "w")
+            return 1
+        return int(payload)
+
+
+def _is_own_socket(path):
+    # invocations hold the input of the user, so they are only sent to a socket only they can have created and
+    # connect to, and not e.g. to one another user created at the path in a shared temp directory
+    try:
+        st = os.lstat(path)
+    except OSError:
+        return False
+    return stat.S_ISSOCK(st.st_mode) and st.st_uid == os.getuid() and not st.st_mode & 0o077
+
+
+def _send_stdin(sock):
+    try:
+        fd = sys.stdin.fileno()
+        while True:
+            chunk = os.read(fd, CHUNK_SIZE)
+            if not chunk:
+                break
+            sock.sendall(chunk)
+        sock.shutdown(socket.SHUT_WR)
+    except OSError:
+        # the daemon stops reading when the invocation fails before reading all of stdin
+        pass
+
+
+def _read_frames(rfile):
+    while True:
+        header = rfile.read(_HEADER.size)
+        if len(header) < _HEADER.size:
+            return
+        kind, size = _HEADER.unpack(header)
+        yield kind, rfile.read(size)
+
+
+def _send_frame(sock, kind, payload=b""):
+    sock.sendall(_HEADER.pack(kind, len(payload)) + payload)
+
+
+def serve(path, workers):
+    """Serve requests of clients on the Unix socket at path, workers of them at a time, until interrupted"""
+    import signal
+
+    server = create_server(path, workers)
+    # terminating the daemon removes its socket like interrupting it does
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def create_server(path, workers):
+    """Return a server for the Unix socket at path, with its modules imported and the std streams redirectable"""
+    import socketserver
+    from concurrent.futures import ThreadPoolExecutor
+
+    class Handler(socketserver.BaseRequestHandler):
+        def handle(self):
+            _handle(self.request)
+
+    class Server(socketserver.UnixStreamServer):
+        def __init__(self):
+            self.executor = ThreadPoolExecutor(workers)
+            super().__init__(path, Handler)
+
+        def process_request(self, request, client_address):
+            self.executor.submit(self._process_request, request, client_address)
+
+        def _process_request(self, request, client_address):
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+        def server_close(self):
+            super().server_close()
+            self.executor.shutdown(wait=False)
+            if os.path.exists(path):
+                os.remove(path)
+
+    _check_not_served(path)
+    _warm()
+    _redirect_std_streams()
+    umask = os.umask(0o077)
+    try:
+        server = Server()
+    finally:
+        os.umask(umask)
+    os.chmod(path, 0o600)
+    return server
+
+
+def _check_not_served(path):
+    from textomatic.exceptions import ProcessException
+
+    if not os.path.lexists(path):
+        return
+    if not _is_own_socket(path):
+        # e.g. created by another user in a shared temp directory, which clients would not connect to
+        raise ProcessException(f"{path} is owned by someone else or accessible to others, serve on another --socket")
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except OSError:
+        # left behind by a daemon that was killed
+        os.remove(path)
+        return
+    finally:
+        sock.close()
+    raise ProcessException(f"A daemon is already serving {path}")
+
+
+def _warm():
+    # imports the modules of processing, builds the command grammar and sniffs a csv dialect
+    from textomatic import main  # noqa: F401
+    from textomatic.model import ProcessContext, ProcessedCommand
+    from textomatic.processor import process
+
+    process.process("a,b\n1,2020-01-01", "h;t:i,d;s:[a, b];o:jl", ProcessContext(ProcessedCommand("")))
+
+
+_local = threading.local()
+
+
+class _ThreadStream:
+    """Stands in for a std stream, forwarding to the stream the current thread redirected it to, if any"""
+
+    def __init__(self, name, default):
+        self._name = name
+        self._default = default
+
+    def _stream(self):
+        return getattr(_local, self._name, self._default)
+
+    def __getattr__(self, name):
+        return getattr(self._stream(), name)
+
+    def __iter__(self):
+        return iter(self._stream())
+
+
+def _redirect_std_streams():
+    for name in ["stdin", "stdout", "stderr"]:
+        if not isinstance(getattr(sys, name), _ThreadStream):
+            setattr(sys, name, _ThreadStream(name, getattr(sys, name)))
+
+
+class _Input:
+    """The stdin of a client, which is read from its socket after the request"""
+
+    def __init__(self, rfile, tty):
+        import io
+
+        self._tty = tty
+        self._text = io.TextIOWrapper(rfile, encoding="utf-8")
+
+    def isatty(self):
+        return self._tty
+
+    def __getattr__(self, name):
+        return getattr(self._text, name)
+
+    def __iter__(self):
+        return iter(self._text)
+
+
+class _Output:
+    """A text stream that sends what is written to it as frames of kind"""
+
+    encoding = "utf-8"
+    errors = "strict"
+
+    def __init__(self, sock, kind, buffer_size):
+        self._sock = sock
+        self._kind = kind
+        self._buffer_size = buffer_size
+        self._parts = []
+        self._size = 0
+
+    def write(self, text):
+        if not isinstance(text, str):
+            raise TypeError(f"write() argument must be str, not {type(text).__name__}")
+        self._parts.append(text)
+        self._size += len(text)
+        if self._size >= self._buffer_size:
+            self.flush()
+        return len(text)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def flush(self):
+        if self._parts:
+            payload = "".join(self._parts).encode(self.encoding)
+            self._parts = []
+            self._size = 0
+            _send_frame(self._sock, self._kind, payload)
+
+    def isatty(self):
+        return False
+
+    def writable(self):
+        return True
+
+    def fileno(self):
+        raise OSError("Client streams have no file descriptor")
+
+
+def _handle(sock):
+    rfile = sock.makefile("rb")
+    frame = next(_read_frames(rfile), None)
+    if frame is None:
+        # e.g. checking whether the daemon is running
+        return
+    cwd, stdin_tty, *args = os.fsdecode(frame[1]).split("\0")
+    stdout = _Output(sock, _STDOUT, OUTPUT_BUFFER_SIZE)
+    # stderr is not buffered, like the stderr of tm
+    stderr = _Output(sock, _STDERR, 0)
+    _local.stdin = _Input(rfile, bool(stdin_tty))
+    _local.stdout = stdout
+    _local.stderr = stderr
+    try:
+        code = _run(sock, args, cwd)
+        if code is None:
+            return
+        stdout.flush()
+        _send_frame(sock, _EXIT, str(code).encode())
+    except (BrokenPipeError, ConnectionResetError):
+        # the client went away, e.g. when its output was piped into head
+        pass
+    finally:
+        del _local.stdin, _local.stdout, _local.stderr
+
+
+def _run(sock, args, cwd):
+    """Run args like tm would, and return the exit code, or None if the client should run them"""
+    import traceback
+
+    import click
+
+    from textomatic import main
+
+    if args and args[0] in main.SUBCOMMANDS:
+        _send_frame(sock, _LOCAL)
+        return None
+    try:
+        ctx = main.main.make_context("tm", list(args))
+        params = ctx.params
+        # the UI needs the terminal of the client, and jobs fork processes, which threads do not mix with
+        if not params["process_and_exit"] or params["jobs"] not in (None, 1):
+            _send_frame(sock, _LOCAL)
+            return None
+        # following inputs runs until interrupted, so there is no startup to save
+        if params["output_dir"] is not None or params["union"] or params["follow"]:
+            _send_frame(sock, _LOCAL)
+            return None
+        params["path"] = tuple(os.path.join(cwd, p) for p in params["path"])
+        _send_frame(sock, _ACCEPT)
+        with ctx:
+            main.main.invoke(ctx)
+        return 0
+    except click.ClickException as e:
+        e.show()
+        return e.exit_code
+    except click.exceptions.Exit as e:
+        return e.exit_code
+    except click.Abort:
+        click.echo("Aborted!", err=True)
+        return 1
+    except (BrokenPipeError, ConnectionResetError):
+        raise
+    except Exception:
+        traceback.print_exc(file=sys.stderr)
+        return 1
@@ -1,2 +1,6 @@
 class ProcessException(RuntimeError):
     pass
+
+
+class ProcessCancelled(Exception):
+    pass
@@ -1,10 +1,11 @@
+import io
+import json
+import os
 import sys
 
 import click
-from prompt_toolkit.patch_stdout import patch_stdout
 
-from textomatic import context
-from textomatic.app.builder import create_app, process_one
+from textomatic.model import ProcessContext
 
 
 @click.command()
@@ -39,41 +40,283 @@ from textomatic.app.builder import create_app, process_one
     type=click.Choice(["COMMAND", "INPUT", "OUTPUT", "c", "i", "o"]),
     help="Start the specified component focused",
 )
-def main(path, command, process_and_exit, horizontal, manual, focus):
-    if len(path) > 1:
-        raise click.ClickException("Only one path argument is supported")
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=0),
+    help="Process large inputs, or the files of --output-dir and --union, in JOBS processes with "
+    "--process-and-exit. 0 uses all cores, which is the default for --output-dir and --union",
+)
+@click.option(
+    "--profile",
+    is_flag=True,
+    help="Write the time, rows and bytes of each processing stage to stderr as JSON with --process-and-exit",
+)
+@click.option(
+    "--output-dir",
+    type=click.Path(file_okay=False),
+    help="Process each file of PATH (files, directories or glob patterns) into a file of the same name "
+    "under OUTPUT_DIR with --process-and-exit",
+)
+@click.option(
+    "-F",
+    "--follow",
+    is_flag=True,
+    help="Keep reading lines as they are appended to PATH, or as they arrive on stdin, and update OUTPUT with "
+    "their rows. With --process-and-exit, requires a single c, sh or jl input and a single jl or c output",
+)
+@click.option(
+    "--union",
+    is_flag=True,
+    help="Process each file of PATH (files, directories or glob patterns) and write the union of their rows, "
+    "with columns matched by header, with --process-and-exit",
+)
+def main(path, command, process_and_exit, horizontal, manual, focus, jobs, profile, output_dir, union, follow):
+    batch = output_dir is not None or union
+
+    if len(path) > 1 and not batch:
+        raise click.ClickException("Several paths are only supported with --output-dir or --union")
 
     if process_and_exit and manual:
         raise click.ClickException("--manual with --process-and-exit makes no sense")
 
-    ctx = context.get()
+    if jobs not in (None, 1) and not process_and_exit:
+        raise click.ClickException("--jobs without --process-and-exit makes no sense")
+
+    if profile and not process_and_exit:
+        raise click.ClickException("--profile without --process-and-exit makes no sense")
+
+    if profile and jobs not in (None, 1):
+        raise click.ClickException("--profile with --jobs is not supported")
+
+    if batch and not process_and_exit:
+        raise click.ClickException("--output-dir or --union without --process-and-exit makes no sense")
+
+    if output_dir is not None and union:
+        raise click.ClickException("--output-dir with --union makes no sense")
+
+    if batch and profile:
+        raise click.ClickException("--profile with --output-dir or --union is not supported")
+
+    if batch and not path:
+        raise click.ClickException("--output-dir and --union require a PATH")
+
+    if follow and (batch or profile or jobs not in (None, 1)):
+        raise click.ClickException("--follow with --jobs, --profile, --output-dir or --union is not supported")
+
+    if follow and not path and sys.stdin.isatty():
+        raise click.ClickException("--follow requires a PATH or input piped to stdin")
+
+    if batch:
+        _process_batch_and_exit(path, command, jobs, output_dir)
+        return
 
     path = path[0] if path else None
-    if path or not sys.stdin.isatty():
+    if process_and_exit:
+        if follow:
+            _follow_and_exit(path, command)
+        elif profile:
+            _profile_and_exit(path, command)
+        else:
+            _process_and_exit(path, command, jobs)
+        return
+
+    # the UI is only imported when it is used, as it takes most of the startup time
+    from prompt_toolkit.patch_stdout import patch_stdout
+    from textomatic import context
+    from textomatic.app.builder import create_app
+
+    ctx = context.get()
+
+    if follow:
+        from textomatic.processor import follow as follow_module
+
+        # the input is read as it arrives once the UI runs
         if path:
+            ctx.follow_input = follow_module.follow_file(path)
+        else:
+            ctx.follow_input = follow_module.follow_stream(sys.stdin.buffer)
+            sys.stdin = open(2)
+    elif path or not sys.stdin.isatty():
+        from textomatic.processor import mapped
+
+        if path and os.path.getsize(path) >= mapped.MIN_SIZE:
+            # large files are shown read only and paged in on demand instead of being read into the buffer
+            ctx.mapped_input = mapped.MappedFile(path)
+        elif path:
             with open(path) as f:
-                text = f.read()
+                ctx.input_buffer.text = f.read()
         else:
-            text = sys.stdin.read()
+            ctx.input_buffer.text = sys.stdin.read()
             sys.stdin.close()
             sys.stdin = open(2)
-        ctx.input_buffer.text = text
 
     ctx.live = not manual
     ctx.box_veritcal_orientation = not horizontal
     ctx.cmd_buffer.text = command
 
-    if process_and_exit:
-        ctx.non_interactive = True
-        process_one()
+    ctx.app = create_app(focus)
+    with patch_stdout():
+        ctx.app.run()
+
+    if ctx.print_output_on_exit:
+        print(ctx.output_text())
+
+
+def _process_and_exit(path, command, jobs=None):
+    from textomatic.processor.process import process_stream
+
+    process_ctx = ProcessContext()
+    if jobs not in (None, 1):
+        from textomatic.processor import parallel
+
+        # the whole input is needed to split it between jobs
+        text = _read_input(path)
+        if not parallel.process_parallel(text, command, process_ctx, sys.stdout, jobs or parallel.default_jobs()):
+            process_stream(io.StringIO(text), command, process_ctx, sys.stdout)
+    elif path:
+        with open(path) as f:
+            process_stream(f, command, process_ctx, sys.stdout)
+    elif not sys.stdin.isatty():
+        process_stream(sys.stdin, command, process_ctx, sys.stdout)
     else:
-        ctx.app = create_app(focus)
-        with patch_stdout():
-            ctx.app.run()
+        process_stream([], command, process_ctx, sys.stdout)
+
+
+def _follow_and_exit(path, command):
+    from textomatic.exceptions import ProcessException
+    from textomatic.processor import follow
+    from textomatic.processor.process import process_follow
+
+    batches = follow.follow_file(path) if path else follow.follow_stream(sys.stdin.buffer)
+    try:
+        process_follow(batches, command, ProcessContext(), sys.stdout)
+    except ProcessException as e:
+        raise click.ClickException(str(e))
+    except KeyboardInterrupt:
+        # following a file only stops when interrupted
+        pass
+
+
+def _process_batch_and_exit(paths, command, jobs, output_dir):
+    from textomatic.exceptions import ProcessException
+    from textomatic.processor import batch, parallel
 
-    if ctx.print_output_on_exit or ctx.non_interactive:
-        print(ctx.output_buffer.text)
+    jobs = jobs or parallel.default_jobs()
+    try:
+        files = batch.expand_paths(paths)
+        if output_dir is None:
+            batch.process_union(files, command, sys.stdout, jobs)
+            return
+        errors = batch.process_to_dir(files, command, output_dir, jobs)
+    except ProcessException as e:
+        raise click.ClickException(str(e))
+    for path, error in errors:
+        click.echo(f"{path}: {error}", err=True)
+    if errors:
+        raise click.ClickException(f"Failed to process {len(errors)} of {len(files)} files")
+
+
+def _profile_and_exit(path, command):
+    # streaming interleaves the stages, so the whole input is processed at once to time each of them
+    from textomatic.processor import profiling
+    from textomatic.processor.process import process
+
+    process_ctx = ProcessContext(profile=profiling.Profile())
+    result = process(_read_input(path), command, process_ctx)
+    sys.stdout.write(f"{result}\n")
+    sys.stdout.flush()
+    click.echo(json.dumps(process_ctx.profile.to_dict()), err=True)
+
+
+def _read_input(path):
+    if path:
+        with open(path) as f:
+            return f.read()
+    return "" if sys.stdin.isatty() else sys.stdin.read()
+
+
+@click.command()
+@click.option(
+    "-s",
+    "--sizes",
+    default=",".join(map(str, [1000, 10000, 100000])),
+    help="Comma separated numbers of rows to generate datasets with",
+)
+@click.option("-k", "--filter", "name_filter", help="Only run benchmarks whose name contains FILTER")
+@click.option("-r", "--repeat", type=click.IntRange(min=1), default=3, help="Time the best of REPEAT runs")
+@click.option("-b", "--baseline", type=click.Path(dir_okay=False), help="Compare results with the BASELINE file")
+@click.option("--save", is_flag=True, help="Save results into the --baseline file")
+@click.option(
+    "-t",
+    "--threshold",
+    type=float,
+    default=1.5,
+    help="Fail when a benchmark is slower than THRESHOLD times its baseline",
+)
+def bench(sizes, name_filter, repeat, baseline, save, threshold):
+    """Benchmark processing of synthetic datasets with each input, output and common commands"""
+    from textomatic import bench as benchmarks
+
+    if save and not baseline:
+        raise click.ClickException("--save requires --baseline")
+    try:
+        sizes = [int(size) for size in sizes.split(",")]
+    except ValueError:
+        raise click.ClickException(f"Invalid sizes: {sizes}")
+    baseline_data = None
+    if baseline and os.path.exists(baseline):
+        baseline_data = benchmarks.load_baseline(baseline)
+    results = benchmarks.run(sizes, name_filter, repeat, baseline_data)
+    click.echo(benchmarks.format_results(results))
+    if save:
+        benchmarks.save_baseline(results, baseline, baseline_data)
+        return
+    regressions = benchmarks.regressions(results, threshold)
+    if regressions:
+        raise click.ClickException(f"Slower than baseline: {', '.join(r.key for r in regressions)}")
+
+
+@click.command()
+@click.option(
+    "-s",
+    "--socket",
+    "socket_path",
+    help="Listen on the Unix socket SOCKET_PATH. Defaults to $TM_SOCKET, or textomatic-UID.sock in $XDG_RUNTIME_DIR "
+    "or else the temp directory",
+)
+@click.option(
+    "-w",
+    "--workers",
+    type=click.IntRange(min=1),
+    help="Handle up to WORKERS requests at a time. Defaults to the number of cores",
+)
+def serve(socket_path, workers):
+    """Run --process-and-exit invocations of tm in a daemon, with modules and caches kept warm between them"""
+    from textomatic import daemon
+    from textomatic.exceptions import ProcessException
+
+    socket_path = socket_path or daemon.socket_path()
+    try:
+        daemon.serve(socket_path, workers or os.cpu_count())
+    except ProcessException as e:
+        raise click.ClickException(str(e))
+
+
+# subcommands are dispatched by hand, as main accepts any path as its argument
+SUBCOMMANDS = {
+    "bench": bench,
+    "serve": serve,
+}
+
+
+def cli():
+    subcommand = SUBCOMMANDS.get(sys.argv[1]) if len(sys.argv) > 1 else None
+    if subcommand:
+        subcommand(sys.argv[2:], prog_name=f"tm {sys.argv[1]}")
+    else:
+        main()
 
 
 if __name__ == "__main__":
-    main()
+    cli()
@@ -1,3 +1,4 @@
+import threading
 from dataclasses import dataclass, field
 from typing import Any, List
 
@@ -13,12 +14,19 @@ class ProcessedCommand:
     has_header: bool = False
     headers: dict = None
     raw: bool = False
+    # rows are filtered and limited before types and structure are applied
+    filter: object = None
+    limit: int = None
+    # the text of the t, s and w expressions the types, structure and filter were parsed from
+    expressions: dict = field(default_factory=dict, compare=False, repr=False)
 
 
 @dataclass
 class ProcessedInput:
     rows: list
     headers: dict
+    # the rows already passed the filter and limit, see process.parses_head
+    selected: bool = False
 
 
 @dataclass
@@ -33,3 +41,15 @@ class Missing:
 
 NO_DEFAULT = NotSet()
 MISSING = Missing()
+
+
+@dataclass
+class ProcessContext:
+    # a command of its own, as processing a command updates the previous one
+    processed_command: ProcessedCommand = field(default_factory=lambda: ProcessedCommand(""))
+    processed_input: ProcessedInput = None
+    cancelled: threading.Event = None
+    # a profiling.Profile that processing records its stages into
+    profile: object = None
+    # rows of processed_input after types and structure, see process._cached_rows
+    stages: object = None
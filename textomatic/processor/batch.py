@@ -0,0 +1,164 @@
+import glob
+import multiprocessing
+import os
+from typing import List, Tuple, TextIO
+
+from textomatic.exceptions import ProcessException
+from textomatic.model import ProcessContext, ProcessedCommand
+from textomatic.processor import outputs, dates
+from textomatic.processor.process import (
+    process_cmd,
+    process_stream,
+    process_rows,
+    parse_input,
+    parses_head,
+    extract_output_headers,
+)
+
+
+def expand_paths(paths: List[str]) -> List[Tuple[str, str]]:
+    """Return the path and output name of every file paths refer to, in order.
+
+    Directories refer to the files under them, named relative to the directory, and patterns
+    (e.g. logs/*.jl) to the files they match, named by their basename like other files.
+    """
+    result = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    file_path = os.path.join(root, name)
+                    result.append((file_path, os.path.relpath(file_path, path)))
+        elif os.path.exists(path) or not glob.has_magic(path):
+            result.append((path, os.path.basename(path)))
+        else:
+            matches = sorted(p for p in glob.glob(path, recursive=True) if os.path.isfile(p))
+            if not matches:
+                raise ProcessException(f"No files match {path}")
+            result.extend((p, os.path.basename(p)) for p in matches)
+    # files that several paths refer to are only processed once
+    unique = {}
+    for path, name in result:
+        unique.setdefault(os.path.normpath(path), (path, name))
+    result = list(unique.values())
+    names = {}
+    for path, name in result:
+        if names.setdefault(name, path) != path:
+            raise ProcessException(f"Both {names[name]} and {path} would be written to {name}")
+    return result
+
+
+def process_to_dir(files: List[Tuple[str, str]], cmd: str, output_dir: str, jobs: int) -> List[Tuple[str, str]]:
+    """Process each file into a file of the same name under output_dir.
+
+    Files that fail do not stop the others. Returns the path and error of each of them.
+    """
+    _prepare(cmd)
+    arguments = [(path, os.path.join(output_dir, name), cmd) for path, name in files]
+    results = _map(_process_to_file, arguments, jobs)
+    return [(path, error) for (path, _, _), error in zip(arguments, results) if error]
+
+
+def process_union(files: List[Tuple[str, str]], cmd: str, out: TextIO, jobs: int):
+    """Process each file and write the union of their rows to out.
+
+    Columns of files with headers are matched by header, in the order they first appear, and cells of
+    columns a file does not have are None. Rows of files without headers are written as they are.
+    """
+    processed_cmd = _prepare(cmd)
+    if processed_cmd.raw:
+        raise ProcessException("Raw output cannot be unioned")
+    results = _map(_process_rows, [(path, cmd) for path, _ in files], jobs)
+    for (path, _), (_, _, error) in zip(files, results):
+        if error:
+            raise ProcessException(f"{path}: {error}")
+    headers_list, rows = _union([(headers, rows) for headers, rows, _ in results])
+    if processed_cmd.limit is not None:
+        # each file is limited on its own, the union as a whole is limited as well
+        del rows[processed_cmd.limit :]
+    processed_cmd.headers = {i: h for i, h in enumerate(headers_list)} or None
+    *output_objs, last_output_obj = outputs.registry.get(processed_cmd)
+    for output_obj in output_objs:
+        rows = output_obj.create_output(rows, processed_cmd)
+    last_output_obj.write_output(rows, processed_cmd, out)
+
+
+def _prepare(cmd):
+    # the command is parsed before workers are forked, so they inherit its parse results and fail early
+    # on invalid commands. Workers then cache row processors across the files they process
+    processed_cmd, _ = process_cmd(_context(), cmd)
+    outputs.registry.get(processed_cmd)
+    return processed_cmd
+
+
+def _map(function, arguments, jobs):
+    if jobs < 2 or len(arguments) < 2 or "fork" not in multiprocessing.get_all_start_methods():
+        return [function(*a) for a in arguments]
+    with multiprocessing.get_context("fork").Pool(min(jobs, len(arguments))) as pool:
+        return pool.starmap(function, arguments, chunksize=1)
+
+
+def _context():
+    return ProcessContext(ProcessedCommand(""))
+
+
+def _process_to_file(path, output_path, cmd):
+    try:
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        with open(path) as f, open(output_path, "w") as out:
+            process_stream(f, cmd, _context(), out)
+    except Exception as e:
+        # outputs of files that failed would look complete
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        return _error(e)
+    return None
+
+
+def _process_rows(path, cmd):
+    try:
+        processed_cmd, _ = process_cmd(_context(), cmd)
+        date_parsers = dates.DateParsers()
+        with open(path) as f:
+            # files are read in full, as inputs like jl may only find some of the headers while reading
+            rows, headers = parse_input(f.read(), processed_cmd, date_parsers=date_parsers)
+        rows = list(process_rows(processed_cmd, headers, rows, parses_head(processed_cmd), date_parsers))
+    except Exception as e:
+        return None, None, _error(e)
+    headers_list = list(extract_output_headers(processed_cmd.structure, headers).values())
+    return headers_list, rows, None
+
+
+def _error(e):
+    # errors are sent back from workers as text, as not every exception can be pickled
+    return str(e) if isinstance(e, (ProcessException, OSError)) else f"{e.__class__.__name__}: {e}"
+
+
+def _union(results):
+    # columns are keyed by their header and how many columns before them have the same header
+    keys = {}
+    file_keys = []
+    for headers_list, _ in results:
+        seen = {}
+        row_keys = []
+        for header in headers_list:
+            key = (header, seen.setdefault(header, 0))
+            seen[header] += 1
+            keys.setdefault(key, len(keys))
+            row_keys.append(key)
+        file_keys.append(row_keys)
+    union = []
+    for row_keys, (_, rows) in zip(file_keys, results):
+        positions = [keys[k] for k in row_keys]
+        if not positions or positions == list(range(len(keys))):
+            union.extend(rows)
+            continue
+        for row in rows:
+            if isinstance(row, (list, tuple)):
+                values = [None] * len(keys)
+                for position, value in zip(positions, row):
+                    values[position] = value
+                row = values if isinstance(row, list) else tuple(values)
+            union.append(row)
+    return [header for header, _ in keys], union
@@ -0,0 +1,69 @@
+from itertools import repeat
+from operator import is_
+
+from textomatic.model import MISSING
+from textomatic.processor import dates
+from textomatic.processor.common import gc_paused
+from textomatic.processor.compiler import TRUE_VALUES
+
+MIN_ROWS = 1000
+
+
+def _to_bool(column, _):
+    return list(map(TRUE_VALUES.__contains__, map(str.lower, map(str, column))))
+
+
+# converters are called with a column and the args of its type, or for d, the date parser of the column
+BATCH_CONVERTERS = {
+    "i": lambda column, _: list(map(int, column)),
+    "f": lambda column, _: list(map(float, column)),
+    "b": _to_bool,
+    "d": lambda column, date_parser: date_parser.convert(column),
+}
+
+
+def convert_columns(rows, type_processors, date_parsers: dates.DateParsers):
+    """Convert whole i/f/b/d columns in batch. Dates are parsed with the parsers of date_parsers.
+
+    Returns the converted rows, the positions of the type processors that were applied and whether
+    the rows may contain MISSING values. A column is only converted in batch if every cell in it
+    converts successfully, otherwise its type processor is left for the per row path, which handles
+    optional and default values.
+    """
+    converted = frozenset()
+    if len(rows) < MIN_ROWS or not type_processors:
+        return rows, converted, True
+    # rows that are built on access, e.g. inputs.SparseRows, are only built once
+    rows = rows if isinstance(rows, list) else list(rows)
+    row_lengths = set(map(len, rows))
+    if len(row_lengths) != 1:
+        return rows, converted, True
+    (width,) = row_lengths
+    column_type_processors = {}
+    for position, (i, t, *_, args) in enumerate(type_processors):
+        if -width <= i < width:
+            column_type_processors.setdefault(i % width, []).append((position, t, args))
+    batched = [
+        (i, *column[0])
+        for i, column in column_type_processors.items()
+        if len(column) == 1 and column[0][1] in BATCH_CONVERTERS
+    ]
+    if not batched:
+        return rows, converted, True
+    with gc_paused():
+        columns = list(zip(*rows))
+        missing = {i for i, column in enumerate(columns) if any(map(is_, column, repeat(MISSING)))}
+        for i, position, t, args in batched:
+            if i in missing:
+                continue
+            if t == "d":
+                args = date_parsers.get(type_processors[position][0], args, columns[i])
+            try:
+                columns[i] = BATCH_CONVERTERS[t](columns[i], args)
+            except Exception:
+                continue
+            converted |= {position}
+        if not converted:
+            return rows, converted, True
+        rows = list(map(list, zip(*columns)))
+    return rows, converted, bool(missing)
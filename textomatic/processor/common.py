@@ -1,16 +1,124 @@
-import subprocess
+import gc
+import sys
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
 
-from textomatic.exceptions import ProcessException
+from textomatic.processor import jq, profiling
 
 
-def run_jq(text, args):
-    final_args = ["jq", "-c", args or "."]
-    text = bytes(text, encoding="utf-8") if text else None
+def run_jq(text, args, parallel=False):
+    with profiling.stage("jq") as stage:
+        result = jq.pool.run(text, args, parallel=parallel)
+        if stage:
+            stage.bytes = profiling.size(result)
+    return result
+
+
+@contextmanager
+def gc_paused():
+    # building rows allocates a container per row, none of which can be part of a
+    # reference cycle, so there is no point in letting the collector walk them
+    enabled = gc.isenabled()
+    gc.disable()
     try:
-        return subprocess.check_output(
-            final_args,
-            stderr=subprocess.STDOUT,
-            input=text,
-        ).decode()
-    except subprocess.CalledProcessError as e:
-        raise ProcessException(e.stdout.decode())
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+class LRUCache:
+    """An LRU cache that can be shared by the threads of the daemon"""
+
+    def __init__(self, size):
+        self.size = size
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, factory):
+        """Return the value cached for key, creating it with factory if it is missing"""
+        with self.lock:
+            try:
+                self.data.move_to_end(key)
+                return self.data[key]
+            except KeyError:
+                pass
+        # factory runs unlocked, so threads missing the same key may both create it, and the last one is kept
+        value = factory()
+        with self.lock:
+            self.data[key] = value
+            self.data.move_to_end(key)
+            if len(self.data) > self.size:
+                self.data.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+
+class SizedLRUCache:
+    """An LRU cache bounded by the total size of its values, as estimated by sizeof"""
+
+    def __init__(self, max_size, sizeof=None):
+        self.max_size = max_size
+        self.sizeof = sizeof or estimate_size
+        self.size = 0
+        # key -> (value, size)
+        self.data = OrderedDict()
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def keys(self):
+        return list(self.data)
+
+    def get(self, key, factory):
+        """Return the value cached for key, creating it with factory if it is missing"""
+        try:
+            self.data.move_to_end(key)
+            return self.data[key][0]
+        except KeyError:
+            pass
+        value = factory()
+        self.put(key, value)
+        return value
+
+    def put(self, key, value):
+        self.pop(key)
+        size = self.sizeof(value)
+        if size > self.max_size:
+            return
+        self.data[key] = (value, size)
+        self.size += size
+        while self.size > self.max_size:
+            _, (_, evicted_size) = self.data.popitem(last=False)
+            self.size -= evicted_size
+
+    def pop(self, key):
+        if key in self.data:
+            _, size = self.data.pop(key)
+            self.size -= size
+
+    def clear(self):
+        self.data.clear()
+        self.size = 0
+
+
+def estimate_size(value, sample_size=100):
+    """Estimate the memory used by value, a list of rows, from the size of a sample of them"""
+    if not isinstance(value, list) or not value:
+        return _deep_size(value)
+    sample = value[:: max(len(value) // sample_size, 1)][:sample_size]
+    row_size = sum(map(_deep_size, sample)) / len(sample)
+    return sys.getsizeof(value) + int(row_size * len(value))
+
+
+def _deep_size(value):
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(map(_deep_size, value.keys())) + sum(map(_deep_size, value.values()))
+    elif isinstance(value, (list, tuple)):
+        size += sum(map(_deep_size, value))
+    return size
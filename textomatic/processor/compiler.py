@@ -0,0 +1,443 @@
+import ast
+import datetime
+import functools
+import json
+import operator
+import re
+from typing import Sequence
+
+from textomatic.exceptions import ProcessException
+from textomatic.model import NO_DEFAULT, MISSING
+from textomatic.processor import parser, dates
+
+TRUE_VALUES = frozenset({"true", "yes", "y", "on", "1"})
+
+TYPE_EXPRESSIONS = {
+    "_": "str({})",
+    "s": "str({})",
+    "f": "float({})",
+    "i": "int({})",
+    "b": "str({}).lower() in TRUE_VALUES",
+    "j": "json.loads(str({}))",
+    "l": "ast.literal_eval(str({}))",
+}
+
+
+def compile_row_processor(type_processors, structure, headers, missing=True):
+    """Compile type processors and structure into a single function that processes one row
+
+    When missing is False, rows are known not to contain MISSING values and are owned by the caller,
+    so they are not checked for MISSING values and may be returned as is.
+    """
+    headers_inverse = {h: i for i, h in headers.items()}
+    code = _Code()
+    code.emit(1, "row = row[:]" if type_processors else "pass")
+    for i, t, optional_ref, optional_type, default, args in type_processors:
+        _emit_type_processor(code, i, t, optional_ref, optional_type, default, args)
+    values = "[None if v is MISSING else v for v in row]" if missing else "row"
+    if structure:
+        result = _emit_structure(code, structure, values, headers, headers_inverse)
+    else:
+        result = values
+    code.emit(1, f"return {result}")
+    return code.compile()
+
+
+def compile_row_filter(filter_data, type_processors, headers):
+    """Compile a w filter into a single function that returns whether one row passes it
+
+    Rows are filtered before they are typed, so the columns the filter refers to are typed on their own
+    first. Values that are missing compare as None.
+    """
+    headers_inverse = {h: i for i, h in headers.items()}
+    comparisons = list(_filter_comparisons(filter_data))
+    columns = {_filter_column(c.ref[0], headers_inverse) for c in comparisons}
+    type_processors = [tp for tp in type_processors if tp[0] in columns]
+    code = _Code()
+    code.emit(1, "row = row[:]" if type_processors else "pass")
+    for i, t, optional_ref, optional_type, default, args in type_processors:
+        _emit_type_processor(code, i, t, optional_ref, optional_type, default, args)
+    variables = {id(c): _emit_filter_ref(code, c.ref, headers_inverse) for c in comparisons}
+    code.emit(1, f"return {_emit_filter(code, filter_data, variables)}")
+    return code.compile()
+
+
+def bind_dates(process_row, rows: Sequence, date_parsers: dates.DateParsers):
+    """Return process_row with the parser of date_parsers for each of its date columns. Parsers that are
+    missing detect their formats from rows.
+
+    Compiled functions are shared between runs, so the state of date parsers, e.g. their detected format,
+    is bound for each run instead of being compiled in.
+    """
+    if not process_row.dates:
+        return process_row
+    parsers = {name: date_parsers.get(i, fmt, column_values(rows, i)) for name, (i, fmt) in process_row.dates.items()}
+    return functools.partial(process_row, **parsers)
+
+
+def build_row_types_processor(types, headers_inverse):
+    type_processors = []
+    if not types:
+        return type_processors
+    saw_header = False
+    for i, col_type in enumerate(types):
+        if isinstance(col_type, parser.TypeDefData):
+            if saw_header:
+                raise ProcessException("Cannot specify types for indexed columns after named columns")
+            type_def = col_type
+            optional_type = type_def.optional
+            optional_ref = optional_type
+            default = type_def.default
+        elif isinstance(col_type, parser.KeyToValueData):
+            saw_header = True
+            type_def = col_type.value
+            optional_type = type_def.optional
+            default = type_def.default
+            if isinstance(col_type.key, parser.LocData):
+                optional_ref = col_type.key.optional
+                i = col_type.key.value
+                if i > 0:
+                    i -= 1
+            elif isinstance(col_type.key, parser.IdData):
+                optional_ref = col_type.key.optional
+                header = col_type.key.value
+                i = headers_inverse[header]
+            else:
+                raise ProcessException(f"Unknown key type: {col_type.key}")
+        else:
+            raise ProcessException(f"Unknown col_type: {col_type}")
+        _validate_type(type_def)
+        if default is not NO_DEFAULT and not (optional_ref or optional_type):
+            optional_ref = True
+            optional_type = True
+        default = _literal_default(default)
+        type_processors.append((i, type_def.type, optional_ref, optional_type, default, type_def.args))
+    return type_processors
+
+
+def structure_field_name(field: parser.ParseData, headers):
+    if isinstance(field, parser.KeyToValueData):
+        name = field.key.value
+    elif isinstance(field, parser.RefData):
+        first, rest = field.value[0], field.value[1:]
+        if isinstance(first, parser.LocData):
+            num = first.value
+            if num > 0:
+                num -= 1
+            else:
+                num += len(headers)
+            if num in headers:
+                first_name = headers[num]
+            else:
+                first_name = str(first.value)
+        elif isinstance(first, parser.IdData):
+            first_name = first.value
+        else:
+            raise ProcessException(f"Unexpected first field: {first}")
+        name = ".".join([first_name] + [str(f.value) for f in rest])
+    else:
+        raise ProcessException(f"Unexpected field: {field}")
+    return name
+
+
+_COMPARISON_OPERATORS = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+}
+
+
+def _comparison(op, value):
+    # numbers compare to values as numbers, anything else, and dates, compare to their text. values that
+    # cannot be compared, e.g. None, only pass !=
+    text = value if isinstance(value, str) else str(value)
+    if op == "~":
+        try:
+            search = re.compile(text).search
+        except re.error as e:
+            raise ProcessException(f"Not a valid pattern: {text}") from e
+        return lambda v: v is not None and search(_text(v)) is not None
+    compare = _COMPARISON_OPERATORS[op]
+    failed = op == "!="
+    numeric = not isinstance(value, str)
+
+    def check(v):
+        if v is None:
+            return failed
+        try:
+            if numeric and not isinstance(v, (datetime.date, datetime.time)):
+                return compare(_number(v), value)
+            return compare(_text(v), text)
+        except (TypeError, ValueError):
+            return failed
+
+    return check
+
+
+def _text(value):
+    if isinstance(value, str):
+        return value
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    return str(value)
+
+
+def _number(value):
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value
+    return float(value)
+
+
+def _filter_comparisons(data):
+    if isinstance(data, parser.ComparisonData):
+        yield data
+    elif isinstance(data, parser.BoolOpData):
+        for operand in data.operands:
+            yield from _filter_comparisons(operand)
+    elif isinstance(data, parser.NotData):
+        yield from _filter_comparisons(data.operand)
+    else:
+        raise ProcessException(f"Unsupported parser data: {data}")
+
+
+def _filter_column(part, headers_inverse):
+    if isinstance(part, parser.IdData):
+        return headers_inverse.get(part.value)
+    key = part.value
+    return key - 1 if key > 0 else key
+
+
+def _emit_filter(code, data, variables):
+    if isinstance(data, parser.ComparisonData):
+        return f"{code.constant(_comparison(data.op, data.value))}({variables[id(data)]})"
+    elif isinstance(data, parser.BoolOpData):
+        return f"({f' {data.op} '.join(_emit_filter(code, o, variables) for o in data.operands)})"
+    else:
+        return f"(not {_emit_filter(code, data.operand, variables)})"
+
+
+def _emit_filter_ref(code, path, headers_inverse):
+    # unlike structures, refs that do not resolve are None rather than errors
+    variable = code.variable("r")
+    column = _filter_column(path[0], headers_inverse)
+    if column is None:
+        code.emit(1, f"{variable} = None")
+        return variable
+    code.emit(1, "try:")
+    code.emit(2, f"{variable} = row[{repr(column)}]")
+    code.emit(1, "except IndexError:")
+    code.emit(2, f"{variable} = None")
+    code.emit(1, f"if {variable} is MISSING:")
+    code.emit(2, f"{variable} = None")
+    for part in path[1:]:
+        code.emit(1, "try:")
+        code.emit(2, f"{variable} = {variable}[{repr(part.value)}]")
+        code.emit(1, "except Exception:")
+        code.emit(2, f"{variable} = None")
+    return variable
+
+
+class _Code:
+    def __init__(self):
+        self.lines = []
+        self.constants = {
+            "MISSING": MISSING,
+            "TRUE_VALUES": TRUE_VALUES,
+            "ProcessException": ProcessException,
+            "str": str,
+            "int": int,
+            "float": float,
+            "json": json,
+            "ast": ast,
+        }
+        self.counter = 0
+        # the constants that date parsers are bound to, with their column and format
+        self.dates = {}
+
+    def emit(self, indent, line):
+        self.lines.append("    " * indent + line)
+
+    def constant(self, value):
+        name = self.variable("_c")
+        self.constants[name] = value
+        return name
+
+    def date_parser(self, i, fmt):
+        name = self.constant(_unbound_date_parser)
+        self.dates[name] = (i, fmt)
+        return name
+
+    def variable(self, prefix):
+        self.counter += 1
+        return f"{prefix}{self.counter}"
+
+    def compile(self):
+        # constants are bound as default arguments so they are looked up as locals
+        args = "".join(f", {name}={name}" for name in self.constants)
+        source = "\n".join([f"def process_row(row{args}):"] + self.lines)
+        namespace = dict(self.constants)
+        exec(compile(source, "<textomatic>", "exec"), namespace)
+        process_row = namespace["process_row"]
+        process_row.source = source
+        process_row.dates = self.dates
+        return process_row
+
+
+def _unbound_date_parser(value):
+    raise ProcessException("Date parsers are bound to each run, see bind_dates")
+
+
+def column_values(rows, i):
+    """Yield the values of column i of rows, skipping those that are missing"""
+    for row in rows:
+        try:
+            value = row[i]
+        except IndexError:
+            continue
+        if value is not MISSING and value is not None:
+            yield value
+
+
+def _validate_type(type_def: parser.TypeDefData):
+    t = type_def.type
+    if t != "d" and t not in TYPE_EXPRESSIONS:
+        raise ProcessException(f"Unsupported column type: {t}")
+    if type_def.args is not None and t != "d":
+        raise ProcessException(f"Column type {t} takes no arguments")
+
+
+def _literal_default(default):
+    if default is NO_DEFAULT:
+        return None
+    try:
+        return ast.literal_eval(default)
+    except Exception as e:
+        raise ProcessException(f"Invalid default literal value: {default}") from e
+
+
+def _emit_type_processor(code, i, t, optional_ref, optional_type, default, args):
+    index = repr(i)
+    if optional_ref or optional_type:
+        default = code.constant(default)
+    if t == "d":
+        # each column detects and memoizes its own date format, see bind_dates
+        convert = f"row[{index}] = {code.date_parser(i, args)}(v)"
+    else:
+        convert = f"row[{index}] = {TYPE_EXPRESSIONS[t].format('v')}"
+    indent = 1
+    if optional_ref:
+        code.emit(indent, "try:")
+        indent += 1
+    code.emit(indent, f"v = row[{index}]")
+    code.emit(indent, "if v is MISSING:")
+    if optional_ref:
+        code.emit(indent + 1, f"row[{index}] = {default}")
+        code.emit(indent, "else:")
+        indent += 1
+    else:
+        code.emit(indent + 1, f"raise IndexError({repr(f'Missing index {i}')})")
+    if optional_type:
+        code.emit(indent, "try:")
+        code.emit(indent + 1, convert)
+        code.emit(indent, "except ProcessException:")
+        code.emit(indent + 1, "raise")
+        code.emit(indent, "except Exception:")
+        code.emit(indent + 1, f"row[{index}] = {default}")
+    else:
+        code.emit(indent, convert)
+    if optional_ref:
+        code.emit(1, "except IndexError:")
+        code.emit(2, "pass")
+
+
+def _emit_structure(code, data: parser.StructureData, values, headers, headers_inverse):
+    # Values are assigned to variables in the order they would be evaluated
+    # lazily, so errors surface exactly as they would when nesting functions
+    if not data.fields:
+        if data.type == "[]":
+            return values
+        elif data.type == "()":
+            return f"tuple({values})"
+        elif data.type == "s()":
+            return f"set({values})"
+        elif data.type in {"{}", "d()"}:
+            return f"dict(zip({code.constant(tuple(headers.values()))}, {values}))"
+        else:
+            raise ProcessException(f"Unsupported data type: {data.type}")
+    fields = [_emit_field(code, f, values, headers, headers_inverse) for f in data.fields]
+    if data.type == "[]":
+        result = f"[{', '.join(fields)}]"
+    elif data.type == "()":
+        result = f"({''.join(f'{v}, ' for v in fields)})"
+    elif data.type == "s()":
+        result = f"{{{', '.join(fields)}}}"
+    elif data.type in {"{}", "d()"}:
+        keys = [code.constant(_emit_key(f, headers)) for f in data.fields]
+        result = f"{{{', '.join(f'{k}: {v}' for k, v in zip(keys, fields))}}}"
+    else:
+        raise ProcessException(f"Unsupported data type: {data.type}")
+    variable = code.variable("s")
+    code.emit(1, f"{variable} = {result}")
+    return variable
+
+
+def _emit_field(code, data: parser.ParseData, values, headers, headers_inverse):
+    if isinstance(data, parser.StructureData):
+        return _emit_structure(code, data, values, headers, headers_inverse)
+    elif isinstance(data, parser.KeyToValueData):
+        return _emit_field(code, data.value, values, headers, headers_inverse)
+    elif isinstance(data, parser.RefData):
+        return _emit_ref(code, data, headers_inverse)
+    else:
+        raise ProcessException(f"Unsupported parser data: {data}")
+
+
+def _emit_key(data: parser.ParseData, headers):
+    if isinstance(data, parser.KeyToValueData):
+        return data.key.value
+    elif isinstance(data, parser.RefData):
+        return structure_field_name(data, headers)
+    else:
+        raise ProcessException(f"Unsupported parser data: {data}")
+
+
+def _emit_ref(code, data: parser.RefData, headers_inverse):
+    path = data.value
+    has_default = data.default is not NO_DEFAULT
+    default = code.constant(_literal_default(data.default))
+    has_optional = any(isinstance(p, (parser.IdData, parser.LocData)) and p.optional for p in path)
+    variable = code.variable("r")
+    source = "row"
+    indent = 1
+    for part_index, part in enumerate(path):
+        if isinstance(part, parser.IdData):
+            key = part.value
+            if part_index == 0:
+                key = headers_inverse.get(key)
+        elif isinstance(part, parser.LocData):
+            key = part.value
+            if part_index == 0 and key > 0:
+                key -= 1
+        else:
+            raise ProcessException(f"Unexpected part {part}")
+        if part_index > 0:
+            code.emit(indent, f"if {variable} is not {default}:")
+            indent += 1
+        if part.optional or (has_default and not has_optional):
+            code.emit(indent, "try:")
+            code.emit(indent + 1, f"{variable} = {source}[{repr(key)}]")
+            code.emit(indent + 1, f"if {variable} is MISSING:")
+            code.emit(indent + 2, f"{variable} = {default}")
+            code.emit(indent, "except Exception:")
+            code.emit(indent + 1, f"{variable} = {default}")
+        else:
+            code.emit(indent, f"{variable} = {source}[{repr(key)}]")
+            code.emit(indent, f"if {variable} is MISSING:")
+            code.emit(indent + 1, f"raise IndexError({repr(f'Missing {key}')})")
+        source = variable
+    return variable
@@ -0,0 +1,188 @@
+import datetime
+import functools
+import itertools
+import re
+from typing import Iterable, List
+
+# the number of distinct values a column's format is detected from
+SAMPLE_SIZE = 100
+# the number of leading values of a column that are looked at for the sample
+SAMPLE_SCAN_SIZE = 10000
+# parsed values are memoized, as dates tend to repeat within a column, e.g. timestamps of log lines
+MEMO_SIZE = 1 << 16
+
+# strptime formats that are detected after ISO 8601 and unix timestamps, in order of preference
+FORMATS = [
+    "%Y/%m/%d %H:%M:%S",
+    "%Y/%m/%d",
+    "%d/%m/%Y %H:%M:%S",
+    "%d/%m/%Y",
+    "%m/%d/%Y %H:%M:%S",
+    "%m/%d/%Y",
+    "%d.%m.%Y %H:%M:%S",
+    "%d.%m.%Y",
+    "%Y-%m-%d %H:%M:%S,%f",
+    "%d/%b/%Y:%H:%M:%S %z",
+    "%a, %d %b %Y %H:%M:%S %z",
+    "%a %b %d %H:%M:%S %Y",
+    "%d %b %Y",
+    "%b %d %Y",
+]
+
+_TIMESTAMP = re.compile(r"\d{9,10}(\.\d*)?|\d{12,13}")
+# directives that always have the same width, in the order datetime takes them
+_FIXED_WIDTHS = {"%Y": 4, "%m": 2, "%d": 2, "%H": 2, "%M": 2, "%S": 2}
+_TIME_DIRECTIVES = ("%H", "%I", "%M", "%S", "%f", "%p", "%z", "%c", "%X")
+
+
+class DateParser:
+    """Parses the values of a single column into datetime.datetime, or datetime.date if they have no time.
+
+    Unless a strptime format is given, the format is detected once, from the given sample of the column or
+    else from the first values it converts. Values that do not match it are parsed with the format detected
+    from them alone. Parsed values are memoized, so a parser is meant for a single run.
+    """
+
+    def __init__(self, fmt: str = None, sample: List[str] = None):
+        self.fixed = bool(fmt)
+        self.parse = compile_format(fmt) if fmt else None
+        if self.parse is None and sample:
+            try:
+                self.parse = detect(sample)
+            except ValueError:
+                pass
+        self.memo = {}
+
+    def __call__(self, value):
+        value = str(value)
+        result = self.memo.get(value)
+        if result is None:
+            result = self._parse(value)
+            if len(self.memo) >= MEMO_SIZE:
+                self.memo.clear()
+            self.memo[value] = result
+        return result
+
+    def convert(self, column) -> list:
+        """Parse a whole column, parsing each distinct value once"""
+        distinct = dict.fromkeys(column)
+        if self.parse is None:
+            self.parse = detect(sample(column))
+        parsed = dict(zip(distinct, map(self._parse, map(str, distinct))))
+        return list(map(parsed.__getitem__, column))
+
+    def _parse(self, value):
+        if self.parse is None:
+            self.parse = detect([value])
+            return self.parse(value)
+        try:
+            return self.parse(value)
+        except ValueError:
+            if self.fixed:
+                raise
+        return detect([value])(value)
+
+
+class DateParsers:
+    """The date parsers of a single run, by column and format.
+
+    The filter, the types and every chunk or batch of rows of a run parse a column with the same parser, so a
+    value is parsed the same wherever it is. Its format is detected from the first rows a parser is asked for,
+    e.g. the first chunk of a stream.
+    """
+
+    def __init__(self):
+        self.parsers = {}
+
+    def __contains__(self, key):
+        return key in self.parsers
+
+    def get(self, i: int, fmt: str, column: Iterable) -> DateParser:
+        """Return the parser of column i, creating it from a sample of column, its values, if it is missing"""
+        key = (i, fmt)
+        parser = self.parsers.get(key)
+        if parser is None:
+            parser = self.parsers[key] = DateParser(fmt, sample(column))
+        return parser
+
+
+def sample(values: Iterable) -> List[str]:
+    """Return the first SAMPLE_SIZE distinct values of a column, out of its first SAMPLE_SCAN_SIZE values, as
+    convert detects the format from"""
+    distinct = dict.fromkeys(map(str, itertools.islice(values, SAMPLE_SCAN_SIZE)))
+    return list(itertools.islice(distinct, SAMPLE_SIZE))
+
+
+def detect(sample):
+    """Return the parser of the format that parses the most values of sample"""
+    best, best_count = None, 0
+    for parse in _candidates():
+        count = 0
+        for value in sample:
+            try:
+                parse(value)
+            except ValueError:
+                continue
+            count += 1
+        if count == len(sample):
+            return parse
+        if count > best_count:
+            best, best_count = parse, count
+    if best is None:
+        raise ValueError(f"Unknown date format: {sample[0] if sample else ''}")
+    return best
+
+
+def compile_format(fmt):
+    """Return a function that parses values in the strptime format fmt.
+
+    Formats made of numeric fields of a fixed width, e.g. %Y-%m-%d %H:%M:%S, slice the fields out of values,
+    which is several times faster than strptime. Values of a different length still go through strptime.
+    """
+    date_only = not any(d in fmt for d in _TIME_DIRECTIVES)
+
+    def strptime(value):
+        result = datetime.datetime.strptime(value, fmt)
+        return result.date() if date_only else result
+
+    fields, checks, position = {}, [], 0
+    for token in re.findall(r"%.|[^%]", fmt):
+        if token in _FIXED_WIDTHS and token not in fields:
+            fields[token] = (position, position + _FIXED_WIDTHS[token])
+            position += _FIXED_WIDTHS[token]
+        elif token.startswith("%"):
+            return strptime
+        else:
+            checks.append(f"v[{position}] == {token!r}")
+            position += 1
+    order = list(_FIXED_WIDTHS)
+    # datetime takes fields positionally, so they have to start with the year and skip none
+    if len(fields) < 3 or set(fields) != set(order[: len(fields)]):
+        return strptime
+    args = ", ".join(f"int(v[{fields[d][0]}:{fields[d][1]}])" for d in order[: len(fields)])
+    cls = "date" if date_only else "datetime"
+    condition = " and ".join([f"len(v) == {position}"] + checks)
+    namespace = {"date": datetime.date, "datetime": datetime.datetime, "strptime": strptime}
+    return eval(f"lambda v: {cls}({args}) if {condition} else strptime(v)", namespace)
+
+
+def _iso(value):
+    if len(value) == 10:
+        return datetime.date.fromisoformat(value)
+    if value.endswith("Z"):
+        value = f"{value[:-1]}+00:00"
+    return datetime.datetime.fromisoformat(value)
+
+
+def _timestamp(value):
+    if not _TIMESTAMP.fullmatch(value):
+        raise ValueError(f"Invalid timestamp: {value}")
+    seconds = float(value)
+    if len(value) > 11 and "." not in value:
+        seconds /= 1000
+    return datetime.datetime.fromtimestamp(seconds, datetime.timezone.utc)
+
+
+@functools.lru_cache(maxsize=None)
+def _candidates():
+    return (_iso, _timestamp, *map(compile_format, FORMATS))
@@ -0,0 +1,84 @@
+import codecs
+import locale
+import os
+import time
+from typing import Iterator, List, BinaryIO
+
+# how long to wait before checking a followed file for more lines
+POLL_SECONDS = 0.1
+READ_SIZE = 1 << 16
+
+
+class _Lines:
+    """Splits decoded chunks of bytes into complete lines, holding on to the last line until it ends"""
+
+    def __init__(self):
+        self.decoder = codecs.getincrementaldecoder(locale.getpreferredencoding(False))()
+        self.pending = ""
+
+    def feed(self, data: bytes) -> List[str]:
+        self.pending += self.decoder.decode(data)
+        end = self.pending.rfind("\n")
+        if end == -1:
+            return []
+        lines = self.pending[:end].split("\n")
+        self.pending = self.pending[end + 1 :]
+        return lines
+
+    def finish(self) -> List[str]:
+        rest = self.pending + self.decoder.decode(b"", final=True)
+        self.pending = ""
+        return [rest] if rest else []
+
+
+def follow_file(path: str, poll_seconds: float = POLL_SECONDS) -> Iterator[List[str]]:
+    """Yield the lines of the file at path in batches, first the lines it has and then lines as they are appended.
+
+    Lines are only yielded once they end. The file is followed from its start again when it is truncated,
+    and reopened when it is replaced, e.g. when logs are rotated. Never ends.
+    """
+    f = open(path, "rb")
+    lines = _Lines()
+    try:
+        while True:
+            data = f.read(READ_SIZE)
+            if data:
+                batch = lines.feed(data)
+                if batch:
+                    yield batch
+                continue
+            if _replaced(f, path):
+                f.close()
+                f = open(path, "rb")
+                lines = _Lines()
+            elif os.fstat(f.fileno()).st_size < f.tell():
+                f.seek(0)
+                lines = _Lines()
+            else:
+                time.sleep(poll_seconds)
+    finally:
+        f.close()
+
+
+def follow_stream(stream: BinaryIO) -> Iterator[List[str]]:
+    """Yield the lines of stream in batches, as they arrive, until it ends"""
+    lines = _Lines()
+    while True:
+        # read1 returns what is available instead of waiting for a full read
+        data = stream.read1(READ_SIZE)
+        if not data:
+            break
+        batch = lines.feed(data)
+        if batch:
+            yield batch
+    batch = lines.finish()
+    if batch:
+        yield batch
+
+
+def _replaced(f, path):
+    try:
+        return os.stat(path).st_ino != os.fstat(f.fileno()).st_ino
+    except FileNotFoundError:
+        # the file is about to be replaced, and is followed until then
+        return False
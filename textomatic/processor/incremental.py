@@ -0,0 +1,175 @@
+from itertools import chain, repeat
+from operator import is_
+from typing import Optional, Union
+
+from textomatic.model import MISSING, ProcessContext
+from textomatic.processor import inputs, outputs, dates
+from textomatic.processor.process import process_cmd, process_rows, clear_stages, detect_dates, LAZY_MIN_ROWS
+
+CHUNK_SIZE = 1 << 16
+
+
+class IncrementalProcessor:
+    """Re-processes only the INPUT lines that changed since the last run.
+
+    Applies to a single line oriented input (see Input.line_parser) and a single row oriented output
+    (see Output.format_rows). Anything else, including edits to the header, returns None and should
+    fall back to a full process.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self, text: str = None, ctx: ProcessContext = None, output: str = None):
+        """Record the text, command and output of a successful full run, or forget them when called without arguments"""
+        self.text = text
+        self.output = output
+        self.processed_cmd = ctx.processed_command if ctx else None
+        self.parser_key = None
+        self.formatted_rows = None
+        self.date_parsers = None
+
+    def process(
+        self, text: str, cmd: str, ctx: ProcessContext, position: int = None, lazy: bool = False
+    ) -> Optional[Union[str, outputs.LazyOutput]]:
+        """Return the output for text, or None if it cannot be computed incrementally.
+
+        position is a hint of where the text changed, e.g. the cursor position after the edit.
+        lazy is the same as in process.
+        """
+        if self.text is None:
+            return None
+        try:
+            result = self._process(text, cmd, ctx, position, lazy)
+        except Exception:
+            self.reset()
+            raise
+        if result is None:
+            self.reset()
+        return result
+
+    def _process(self, text, cmd, ctx, position, lazy):
+        processed_cmd, _ = process_cmd(ctx, cmd)
+        if processed_cmd is not self.processed_cmd or processed_cmd.raw or not ctx.processed_input:
+            return None
+        # edited lines may change which rows are selected
+        if processed_cmd.filter is not None or processed_cmd.limit is not None:
+            return None
+        input_objs = inputs.registry.get(processed_cmd)
+        output_objs = outputs.registry.get(processed_cmd)
+        if len(input_objs) != 1 or len(output_objs) != 1 or not output_objs[0].streaming:
+            return None
+        (input_obj,), (output_obj,) = input_objs, output_objs
+        rows = ctx.processed_input.rows
+        headers = ctx.processed_input.headers
+        headers_list = list(headers.values())
+
+        if self.formatted_rows is None and not self._start(input_obj, output_obj, processed_cmd, rows, headers):
+            return None
+
+        lines = text.split("\n")
+        parser = input_obj.line_parser(text, lines, processed_cmd)
+        if not parser or parser.key != self.parser_key:
+            return None
+        old_text = self.text
+        first, old_lines, new_lines = _changed_lines(old_text, text, position)
+        if first < parser.header_size:
+            return None
+        start = _count_rows(lines[parser.header_size : first])
+        end = start + _count_rows(old_lines)
+        new_rows = parser.parse(new_lines, headers_list)
+        if new_rows is None or not _complete(new_rows):
+            return None
+        processed_rows = process_rows(processed_cmd, headers, new_rows, date_parsers=self.date_parsers)
+        formatted_rows = output_obj.format_rows(list(processed_rows), processed_cmd)
+
+        rows[start:end] = new_rows
+        clear_stages(ctx)
+        self.formatted_rows[start:end] = formatted_rows
+        self.text = text
+        if lazy and len(self.formatted_rows) >= LAZY_MIN_ROWS:
+            return outputs.LazyOutput(output_obj, processed_cmd, formatted_rows=list(self.formatted_rows))
+        return output_obj.join_rows(self.formatted_rows, processed_cmd)
+
+    def _start(self, input_obj, output_obj, processed_cmd, rows, headers):
+        # the rows of the last full run are split from its output, or formatted again when that is
+        # ambiguous, so later edits only format changed rows
+        lines = self.text.split("\n")
+        parser = input_obj.line_parser(self.text, lines, processed_cmd)
+        if not parser or not isinstance(rows, list) or not _complete(rows):
+            return False
+        if _count_rows(lines[parser.header_size :]) != len(rows):
+            return False
+        self.parser_key = parser.key
+        # edited rows parse dates in the formats the full run detected from all rows
+        self.date_parsers = dates.DateParsers()
+        detect_dates(processed_cmd, headers, rows, self.date_parsers)
+        formatted_rows = None
+        if isinstance(self.output, outputs.LazyOutput):
+            formatted_rows = list(self.output.format_all())
+        elif isinstance(self.output, str):
+            formatted_rows = output_obj.split_output(self.output, processed_cmd)
+        if formatted_rows is None or len(formatted_rows) != len(rows):
+            processed_rows = process_rows(processed_cmd, headers, rows, date_parsers=self.date_parsers)
+            formatted_rows = output_obj.format_rows(list(processed_rows), processed_cmd)
+        self.formatted_rows = formatted_rows
+        self.output = None
+        return True
+
+
+def _count_rows(lines):
+    return sum(map(bool, map(str.strip, lines)))
+
+
+def _complete(rows):
+    # rows with MISSING values depend on other rows for their headers
+    return not any(map(is_, chain.from_iterable(rows), repeat(MISSING)))
+
+
+def _changed_lines(old, new, position=None):
+    """Return the index of the first changed line, followed by the changed lines in old and in new"""
+    limit = min(len(old), len(new))
+    prefix = 0
+    suffix = 0
+    if position is not None:
+        # edits usually happen in the line the cursor is in
+        line_start = min(new.rfind("\n", 0, position) + 1, limit)
+        if old[:line_start] == new[:line_start]:
+            prefix = line_start
+    prefix = _common_prefix_length(old, new, prefix, limit)
+    limit -= prefix
+    if position is not None:
+        line_end = new.find("\n", position)
+        line_end = len(new) if line_end == -1 else line_end
+        if len(new) - line_end <= limit and old[len(old) - len(new) + line_end :] == new[line_end:]:
+            suffix = len(new) - line_end
+    suffix = _common_suffix_length(old, new, suffix, limit)
+    start = old.rfind("\n", 0, prefix) + 1
+    return old.count("\n", 0, start), _lines(old, start, len(old) - suffix), _lines(new, start, len(new) - suffix)
+
+
+def _lines(text, start, end):
+    end = text.find("\n", end)
+    return text[start : len(text) if end == -1 else end].split("\n")
+
+
+def _common_prefix_length(a, b, length, limit):
+    step = CHUNK_SIZE
+    while length < limit and step:
+        end = min(length + step, limit)
+        if a[length:end] == b[length:end]:
+            length = end
+        else:
+            step //= 2
+    return length
+
+
+def _common_suffix_length(a, b, length, limit):
+    step = CHUNK_SIZE
+    while length < limit and step:
+        end = min(length + step, limit)
+        if a[len(a) - end : len(a) - length] == b[len(b) - end : len(b) - length]:
+            length = end
+        else:
+            step //= 2
+    return length
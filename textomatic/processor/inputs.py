@@ -1,81 +1,301 @@
+import csv
+import itertools
 import json
 import shlex
-from typing import List, Any, Mapping
-
-import clevercsv
-from pygments.lexers.data import JsonLexer
-from pygments.lexers.python import PythonLexer
-from pygments.lexers.special import TextLexer
+import threading
+from collections.abc import Sequence
+from dataclasses import dataclass
+from itertools import repeat
+from typing import List, Any, Mapping, Iterable, Callable, Optional
 
 from textomatic.model import ProcessedCommand, MISSING
-from textomatic.processor.common import run_jq
+from textomatic.processor.common import run_jq, gc_paused
 from textomatic.processor.registry import Registry
 
-DEFAULT_LEXER = PythonLexer
+DEFAULT_LEXER = "python"
+SNIFF_SAMPLE_SIZE = 10000
+DIALECTS_CACHE_SIZE = 32
+
+
+@dataclass
+class LineParser:
+    # texts with an equal key parse their lines the same way
+    key: Any
+    # number of leading lines that hold the header
+    header_size: int
+    # parses lines into rows, given the current headers. returns None if these lines cannot be parsed on their own
+    parse: Callable[[List[str], List[str]], Optional[List[Any]]]
+    # returns the headers rows are parsed against, given all lines
+    headers: Callable[[List[str]], List[str]]
+    # whether the headers of the first lines are those of all lines. When they are not, later lines that
+    # differ fail to parse and the headers are only known once all lines were parsed
+    fixed_headers: bool = True
 
 
 class Input:
+    # a pygments lexer class or the alias of one
     lexer = DEFAULT_LEXER
 
     def get_rows(self, text: str, processed_cmd: ProcessedCommand) -> (List[Any], Mapping[int, str]):
         raise NotImplementedError
 
+    def iter_rows(self, lines: Iterable[str], processed_cmd: ProcessedCommand) -> (Iterable[Any], List[str]):
+        """Like get_rows, but consumes lines lazily and may return rows as an iterator"""
+        return self.get_rows("".join(lines), processed_cmd)
+
+    def line_parser(self, text: str, lines: List[str], processed_cmd: ProcessedCommand) -> Optional[LineParser]:
+        """Return a parser for inputs where each non empty line after the header is exactly one row, or None"""
+        return None
+
+    def follow_parser(self, text: str, lines: List[str], processed_cmd: ProcessedCommand) -> Optional[LineParser]:
+        """Like line_parser, for the first lines of an input that keeps growing (see follow). Later lines are
+        parsed with what was detected from the first ones, e.g. their headers, even if they differ"""
+        return self.line_parser(text, lines, processed_cmd)
+
 
 class CSVInput(Input):
-    lexer = PythonLexer
+    lexer = "python"
+
+    def __init__(self):
+        self.dialects = {}
+        self.dialects_lock = threading.Lock()
 
     def get_rows(self, text: str, processed_cmd: ProcessedCommand) -> (List[Any], Mapping[int, str]):
+        rows, headers_list = self._read(text[:SNIFF_SAMPLE_SIZE], text.split("\n"), processed_cmd, text=text)
+        with gc_paused():
+            return list(rows), headers_list
+
+    def iter_rows(self, lines: Iterable[str], processed_cmd: ProcessedCommand) -> (Iterable[Any], List[str]):
+        lines = iter(lines)
+        sample_lines = []
+        sample_size = 0
+        for line in lines:
+            sample_lines.append(line)
+            sample_size += len(line)
+            if sample_size >= SNIFF_SAMPLE_SIZE:
+                break
+        sample = "".join(sample_lines)[:SNIFF_SAMPLE_SIZE]
+        return self._read(sample, itertools.chain(sample_lines, lines), processed_cmd)
+
+    def line_parser(self, text: str, lines: List[str], processed_cmd: ProcessedCommand) -> Optional[LineParser]:
+        dialect = self.sniff(text[:SNIFF_SAMPLE_SIZE], processed_cmd.delimiter)
+        delimiter = self._stdlib_delimiter(dialect, text)
+        if not delimiter:
+            # quoted values may span several lines
+            return None
+        return self._line_parser(
+            delimiter, lines, processed_cmd, csv.reader, delimiter=delimiter, quoting=csv.QUOTE_NONE
+        )
+
+    def follow_parser(self, text: str, lines: List[str], processed_cmd: ProcessedCommand) -> Optional[LineParser]:
+        dialect = self.sniff(text[:SNIFF_SAMPLE_SIZE], processed_cmd.delimiter)
+        # later lines may quote values even if the first ones do not, so the usual quotes are assumed unless other
+        # quotes were detected. Quoted values are assumed to not span lines
+        delimiter = self._stdlib_delimiter(dialect, None)
+        if delimiter:
+            return self._line_parser(delimiter, lines, processed_cmd, csv.reader, delimiter=delimiter)
+        import clevercsv
+
+        return self._line_parser(dialect, lines, processed_cmd, clevercsv.reader, dialect=dialect)
+
+    @staticmethod
+    def _line_parser(key, lines, processed_cmd, reader, **reader_args):
+        header_size = 0
+        if processed_cmd.has_header:
+            header_size = next((i + 1 for i, line in enumerate(lines) if line.strip()), len(lines))
+
+        def parse(lines, headers_list):
+            return list(reader(filter(None, map(str.strip, lines)), **reader_args))
+
+        def headers(lines):
+            return next(iter(parse(lines[:header_size], [])), [])
+
+        return LineParser(key, header_size, parse, headers)
+
+    def sniff(self, sample, delimiter):
+        key = (hash(sample), delimiter)
+        dialect = self.dialects.get(key)
+        if dialect is None:
+            import clevercsv
+
+            delimiters = [delimiter] if delimiter else None
+            dialect = clevercsv.Sniffer().sniff(sample, delimiters=delimiters)
+            # the daemon sniffs in several threads at a time
+            with self.dialects_lock:
+                if len(self.dialects) >= DIALECTS_CACHE_SIZE:
+                    del self.dialects[next(iter(self.dialects))]
+                self.dialects[key] = dialect
+        return dialect
+
+    def _read(self, sample, lines, processed_cmd, text=None):
         headers_list = []
-        delimiters = [processed_cmd.delimiter] if processed_cmd.delimiter else None
-        dialect = clevercsv.Sniffer().sniff(text[:10000], delimiters=delimiters)
-        raw_lines = [line.strip() for line in text.split("\n") if line.strip()]
-        reader = clevercsv.reader(raw_lines, dialect=dialect)
-        rows = list(reader)
-        if processed_cmd.has_header and rows:
-            headers_list, rows = rows[0], rows[1:]
-        return rows, headers_list
+        dialect = self.sniff(sample, processed_cmd.delimiter)
+        raw_lines = filter(None, map(str.strip, lines))
+        delimiter = self._stdlib_delimiter(dialect, text)
+        if delimiter:
+            reader = csv.reader(raw_lines, delimiter=delimiter, quoting=csv.QUOTE_NONE)
+        else:
+            import clevercsv
+
+            reader = clevercsv.reader(raw_lines, dialect=dialect)
+        if processed_cmd.has_header:
+            headers_list = next(reader, [])
+        return reader, headers_list
+
+    @staticmethod
+    def _stdlib_delimiter(dialect, text):
+        # The stdlib reader only agrees with clevercsv when there is no quoting or
+        # escaping involved. When the full text is known, quote and escape chars
+        # that do not appear in it cannot affect parsing and are ignored.
+        if not dialect or len(dialect.delimiter) != 1:
+            return None
+        for char in [dialect.quotechar, dialect.escapechar]:
+            if char and (text is None or char in text):
+                return None
+        if text is not None and "\0" in text:
+            return None
+        return dialect.delimiter
 
 
 class JsonLinesInput(Input):
-    lexer = JsonLexer
+    lexer = "json"
 
     def get_rows(self, text: str, processed_cmd: ProcessedCommand) -> (List[Any], Mapping[int, str]):
-        json_rows = [json.loads(line.strip()) for line in text.split("\n") if line.strip()]
+        # headers are discovered in a single pass. Records that have exactly the headers known so far, in
+        # order, are kept as a list of their values, any other record is kept as is
         headers_list = []
         seen_headers = set()
-        for row in json_rows:
-            for k in row:
-                if k in seen_headers:
-                    continue
-                headers_list.append(k)
-                seen_headers.add(k)
-        rows = []
-        for json_row in json_rows:
-            row = [json_row.get(h, MISSING) for h in headers_list]
-            rows.append(row)
-        return rows, headers_list
+        records = []
+        sparse = False
+        for line in text.split("\n"):
+            line = line.strip()
+            if not line:
+                continue
+            json_row = json.loads(line)
+            keys = list(json_row.keys())
+            if keys == headers_list:
+                records.append(list(json_row.values()))
+                continue
+            if keys != headers_list[: len(keys)]:
+                for k in keys:
+                    if k not in seen_headers:
+                        headers_list.append(k)
+                        seen_headers.add(k)
+            if keys == headers_list:
+                records.append(list(json_row.values()))
+            else:
+                records.append(json_row)
+                sparse = True
+        if sparse:
+            return SparseRows(records, headers_list), headers_list
+        # rows from before the last headers were discovered lack their values
+        width = len(headers_list)
+        for row in records:
+            if len(row) < width:
+                row.extend(repeat(MISSING, width - len(row)))
+        return records, headers_list
+
+    def iter_rows(self, lines: Iterable[str], processed_cmd: ProcessedCommand) -> (Iterable[Any], List[str]):
+        # any record may add headers, so rows are only known once all lines were read
+        return self.get_rows("".join(lines), processed_cmd)
+
+    def line_parser(self, text: str, lines: List[str], processed_cmd: ProcessedCommand) -> Optional[LineParser]:
+        def parse(lines, headers_list):
+            # rows can only be parsed on their own if they have exactly the known headers
+            rows = []
+            for line in filter(None, map(str.strip, lines)):
+                json_row = json.loads(line)
+                if list(json_row) != headers_list:
+                    return None
+                rows.append(list(json_row.values()))
+            return rows
+
+        def headers(lines):
+            # headers are only known up front when all rows have the keys of the first one,
+            # other rows fail to parse
+            line = next(filter(None, map(str.strip, lines)), None)
+            return list(json.loads(line)) if line else []
+
+        return LineParser(None, 0, parse, headers, fixed_headers=False)
+
+    def follow_parser(self, text: str, lines: List[str], processed_cmd: ProcessedCommand) -> Optional[LineParser]:
+        def parse(lines, headers_list):
+            # keys that are not headers are dropped, and headers a record does not have are MISSING
+            return [
+                list(map(json.loads(line).get, headers_list, repeat(MISSING)))
+                for line in filter(None, map(str.strip, lines))
+            ]
+
+        def headers(lines):
+            # the keys of all first records, in the order they are first seen
+            return list(
+                dict.fromkeys(itertools.chain.from_iterable(map(json.loads, filter(None, map(str.strip, lines)))))
+            )
+
+        return LineParser(None, 0, parse, headers)
+
+
+class SparseRows(Sequence):
+    """Rows of records that have different keys, stored as the records themselves.
+
+    A row is built when it is accessed, with the value of each header in order and MISSING for headers
+    its record does not have, so they are the same as the rows of records that have all headers.
+    Records may also be lists of the values of the first headers.
+    """
+
+    def __init__(self, records: list, headers_list: List[str]):
+        self.records = records
+        self.headers_list = headers_list
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return list(map(self._row, self.records[i]))
+        return self._row(self.records[i])
+
+    def __iter__(self):
+        return map(self._row, self.records)
+
+    def __eq__(self, other):
+        return isinstance(other, (list, SparseRows)) and len(self) == len(other) and all(map(list.__eq__, self, other))
+
+    def _row(self, record):
+        width = len(self.headers_list)
+        if isinstance(record, dict):
+            return list(map(record.get, self.headers_list, repeat(MISSING, width)))
+        return record + [MISSING] * (width - len(record))
 
 
 class ShellInput(Input):
-    lexer = TextLexer
+    lexer = "text"
 
     def get_rows(self, text: str, processed_cmd: ProcessedCommand) -> (List[Any], Mapping[int, str]):
-        rows = []
-        lines = text.split("\n")
+        rows, header_line = self.iter_rows(text.split("\n"), processed_cmd)
+        return list(rows), header_line
+
+    def iter_rows(self, lines: Iterable[str], processed_cmd: ProcessedCommand) -> (Iterable[Any], List[str]):
+        lines = iter(lines)
         header_line = []
         if processed_cmd.has_header:
-            header_line, lines = shlex.split(lines[0], posix=True), lines[1:]
-        for line in lines:
-            line = line.strip()
-            if not line:
-                continue
-            row = shlex.split(line, posix=True)
-            rows.append(row)
+            header_line = shlex.split(next(lines, ""), posix=True)
+        rows = (shlex.split(line, posix=True) for line in map(str.strip, lines) if line)
         return rows, header_line
 
+    def line_parser(self, text: str, lines: List[str], processed_cmd: ProcessedCommand) -> Optional[LineParser]:
+        def parse(lines, headers_list):
+            return [shlex.split(line, posix=True) for line in map(str.strip, lines) if line]
+
+        def headers(lines):
+            return shlex.split(lines[0], posix=True) if header_size else []
+
+        header_size = 1 if processed_cmd.has_header else 0
+        return LineParser(None, header_size, parse, headers)
+
 
 class JQInput(Input):
-    lexer = JsonLexer
+    lexer = "json"
 
     def __init__(self, args):
         self.args = args
@@ -83,9 +303,12 @@ class JQInput(Input):
     def get_rows(self, text: str, processed_cmd: ProcessedCommand) -> (List[Any], Mapping[int, str]):
         return run_jq(text, self.args), []
 
+    def iter_rows(self, lines: Iterable[str], processed_cmd: ProcessedCommand) -> (Iterable[Any], List[str]):
+        return run_jq("".join(lines), self.args, parallel=True), []
+
 
 class NopInput(Input):
-    lexer = TextLexer
+    lexer = "text"
 
     def get_rows(self, text: str, processed_cmd: ProcessedCommand) -> (List[Any], Mapping[int, str]):
         return text, []
@@ -0,0 +1,252 @@
+import json
+import os
+import re
+import select
+import subprocess
+import threading
+import time
+from collections import OrderedDict
+
+from textomatic.exceptions import ProcessException
+
+TIMEOUT = 120
+POOL_SIZE = max(os.cpu_count() or 1, 2)
+# starting jq is negligible compared to processing large inputs, while passing them through a pooled worker is not
+LARGE_INPUT_SIZE = 1 << 20
+PARALLEL_JOBS = os.cpu_count() or 1
+PARALLEL_CHUNK_SIZE = 1 << 20
+MAX_FAILED_PROGRAMS = 64
+
+# filters that depend on how inputs are read can only run in a dedicated jq process
+_STATEFUL = re.compile(r"\b(input|inputs|input_line_number|halt|halt_error)\b")
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+# the end of a batch is padded past the size of jq's stdout buffer, so everything up to
+# it is flushed without having jq flush after every output
+END_PADDING = 1 << 14
+_END = b"[1,"
+
+
+def _reject_constant(constant):
+    raise ValueError(f"Unsupported constant {constant}")
+
+
+_decoder = json.JSONDecoder(parse_constant=_reject_constant)
+
+
+def run_once(text, args):
+    final_args = ["jq", "-c", args or "."]
+    text = bytes(text, encoding="utf-8") if text else None
+    try:
+        return subprocess.check_output(
+            final_args,
+            stderr=subprocess.STDOUT,
+            input=text,
+        ).decode()
+    except subprocess.CalledProcessError as e:
+        raise ProcessException(e.stdout.decode())
+
+
+class JQWorker:
+    """A long lived jq process that runs a single filter on batches of inputs.
+
+    Each input is wrapped as [0, value] and each batch is followed by [1, padding], so outputs
+    can be told apart from the end of a batch.
+    """
+
+    def __init__(self, args):
+        program = f"if .[0] == 0 then (.[1] | ({args}\n)) as $o | [0, $o] else [1, .[1] * {END_PADDING}] end"
+        self.process = subprocess.Popen(
+            ["jq", "-c", program],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        os.set_blocking(self.process.stderr.fileno(), False)
+        # the rest of the previous end of batch, which is only flushed along with the next batch
+        self.padding = 0
+
+    def run(self, values, timeout):
+        """Return the output for values, or None if jq reported anything on stderr"""
+        payload = "".join(f"[0,{value}]\n" for value in values).encode() + b'[1,"-"]\n'
+        writer = threading.Thread(target=self._write, args=(payload,), daemon=True)
+        writer.start()
+        fd = self.process.stdout.fileno()
+        output = bytearray()
+        end = -1
+        deadline = time.monotonic() + timeout
+        while end == -1:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError()
+            ready, _, _ = select.select([fd], [], [], remaining)
+            if not ready:
+                continue
+            data = os.read(fd, 1 << 16)
+            if not data:
+                raise BrokenPipeError()
+            start = len(output)
+            output += data
+            if self.padding:
+                skipped = min(self.padding, len(output))
+                del output[:skipped]
+                self.padding -= skipped
+                start = 0
+            end = _find_end(output, max(start - len(_END), 0))
+        # the end of batch line is [1,"<padding>"]
+        self.padding = len(_END) + END_PADDING + 4 - (len(output) - end)
+        writer.join()
+        if self._read_errors():
+            return None
+        lines = output[:end].split(b"\n")[:-1]
+        return b"".join(line[3:-1] + b"\n" for line in lines).decode()
+
+    def close(self):
+        self.process.kill()
+        self.process.wait()
+
+    def _write(self, payload):
+        try:
+            self.process.stdin.write(payload)
+            self.process.stdin.flush()
+        except (BrokenPipeError, ValueError):
+            pass
+
+    def _read_errors(self):
+        # errors are written before jq moves on to the next input, so they are
+        # already available once the end of the batch has been read
+        errors = b""
+        try:
+            while True:
+                data = os.read(self.process.stderr.fileno(), 1 << 16)
+                if not data:
+                    break
+                errors += data
+        except BlockingIOError:
+            pass
+        return errors
+
+
+class JQPool:
+    def __init__(self, size=POOL_SIZE):
+        self.size = size
+        self.idle = OrderedDict()
+        self.failed = set()
+        self.lock = threading.Lock()
+
+    def run(self, text, args, parallel=False):
+        """Run jq with args on text, like run_once.
+
+        Small inputs run in pooled jq processes. Anything the pool cannot reproduce exactly, such as invalid
+        input or jq errors, is run again with run_once so errors are reported as is. With parallel, large
+        inputs are split into chunks of lines that are run concurrently.
+        """
+        args = args or "."
+        if not isinstance(text, str) or _STATEFUL.search(args):
+            return run_once(text, args)
+        result = None
+        if len(text) >= LARGE_INPUT_SIZE:
+            if parallel and PARALLEL_JOBS > 1:
+                result = self._run_parallel(text, args)
+        elif args not in self.failed:
+            values = _split_values(text)
+            if values is not None:
+                result = self._run(values, args)
+        if result is None:
+            result = run_once(text, args)
+        return result
+
+    def close(self):
+        with self.lock:
+            for workers in self.idle.values():
+                for worker in workers:
+                    worker.close()
+            self.idle.clear()
+
+    def _run_parallel(self, text, args):
+        from concurrent.futures import ThreadPoolExecutor
+
+        # chunks end at line boundaries, so JSON lines split cleanly. Values that span lines
+        # make some chunk fail and the whole text is run again
+        chunk_size = max(len(text) // PARALLEL_JOBS + 1, PARALLEL_CHUNK_SIZE)
+        chunks = []
+        start = 0
+        while start < len(text):
+            end = text.find("\n", start + chunk_size)
+            end = len(text) if end == -1 else end + 1
+            chunks.append(text[start:end])
+            start = end
+
+        def run_chunk(chunk):
+            try:
+                return run_once(chunk, args)
+            except ProcessException:
+                return None
+
+        with ThreadPoolExecutor(max_workers=PARALLEL_JOBS) as executor:
+            results = list(executor.map(run_chunk, chunks))
+        if any(r is None for r in results):
+            return None
+        return "".join(results)
+
+    def _run(self, values, args):
+        worker = self._acquire(args)
+        try:
+            result = worker.run(values, TIMEOUT)
+        except TimeoutError:
+            worker.close()
+            raise ProcessException(f"jq did not finish within {TIMEOUT} seconds")
+        except OSError:
+            # the filter could not be compiled or jq crashed
+            worker.close()
+            with self.lock:
+                if len(self.failed) >= MAX_FAILED_PROGRAMS:
+                    self.failed.clear()
+                self.failed.add(args)
+            return None
+        self._release(args, worker)
+        return result
+
+    def _acquire(self, args):
+        with self.lock:
+            workers = self.idle.get(args)
+            if workers:
+                return workers.pop()
+        return JQWorker(args)
+
+    def _release(self, args, worker):
+        with self.lock:
+            self.idle.setdefault(args, []).append(worker)
+            self.idle.move_to_end(args)
+            count = sum(map(len, self.idle.values()))
+            while count > self.size:
+                oldest_args, workers = next(iter(self.idle.items()))
+                workers.pop(0).close()
+                if not workers:
+                    del self.idle[oldest_args]
+                count -= 1
+
+
+def _find_end(output, start):
+    if output.startswith(_END):
+        return 0
+    end = output.find(b"\n" + _END, start)
+    return end if end == -1 else end + 1
+
+
+def _split_values(text):
+    """Return the JSON texts text consists of, or None if it is not a whitespace separated sequence of them"""
+    values = []
+    end = _WHITESPACE.match(text).end()
+    while end < len(text):
+        try:
+            _, value_end = _decoder.raw_decode(text, end)
+        except ValueError:
+            return None
+        values.append(text[end:value_end])
+        end = _WHITESPACE.match(text, value_end).end()
+        if end == value_end and end < len(text):
+            return None
+    return values
+
+
+pool = JQPool()
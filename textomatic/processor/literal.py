@@ -0,0 +1,97 @@
+import datetime
+import decimal
+import pprint
+from typing import Iterator
+
+# the defaults of pprint, which the layout follows
+WIDTH = 80
+INDENT = 1
+# types pprint writes as their repr even when it does not fit
+_SCALAR_TYPES = frozenset(
+    {
+        int,
+        float,
+        complex,
+        bool,
+        type(None),
+        datetime.date,
+        datetime.datetime,
+        datetime.time,
+        datetime.timedelta,
+        decimal.Decimal,
+    }
+)
+
+
+class _Unsupported(Exception):
+    pass
+
+
+def pformat(value) -> str:
+    return pprint.pformat(value, indent=INDENT, width=WIDTH, compact=False, sort_dicts=False)
+
+
+def render(rows) -> Iterator[str]:
+    """Yield the parts of pformat(rows) for a list of rows, formatting each row on its own.
+
+    Rows that fit within the width are their repr. Longer lists, tuples and dicts are wrapped the way
+    pprint wraps them, and rows holding anything else pprint wraps, e.g. long strings, are left to it.
+    """
+    if type(rows) is not list:
+        yield pformat(rows)
+        return
+    # the whole list is on a single line when it fits, which only few rows can
+    if len(rows) <= WIDTH // 3:
+        rep = repr(rows)
+        if len(rep) <= WIDTH:
+            yield rep
+            return
+    delimiter = "["
+    for row in rows:
+        yield delimiter
+        yield format_row(row)
+        delimiter = ",\n" + " " * INDENT
+    yield "]"
+
+
+def format_row(row) -> str:
+    """Format row as pformat formats it within a list of rows"""
+    try:
+        return _format(row, INDENT, 1)
+    except _Unsupported:
+        return pformat([row])[1:-1]
+
+
+def _format(value, indent, allowance):
+    rep = repr(value)
+    if len(rep) <= WIDTH - indent - allowance:
+        return rep
+    value_repr = type(value).__repr__
+    if value_repr is list.__repr__:
+        return f"[{_format_items(value, indent, allowance + 1)}]"
+    if value_repr is tuple.__repr__:
+        end = ",)" if len(value) == 1 else ")"
+        return f"({_format_items(value, indent, allowance + len(end))}{end}"
+    if value_repr is dict.__repr__:
+        return f"{{{_format_dict_items(value, indent, allowance + 1)}}}"
+    if type(value) in _SCALAR_TYPES:
+        return rep
+    raise _Unsupported()
+
+
+def _format_items(items, indent, allowance):
+    indent += INDENT
+    last = len(items) - 1
+    return f",\n{' ' * indent}".join(
+        _format(item, indent, allowance if i == last else 1) for i, item in enumerate(items)
+    )
+
+
+def _format_dict_items(items, indent, allowance):
+    indent += INDENT
+    last = len(items) - 1
+    parts = []
+    for i, (key, value) in enumerate(items.items()):
+        key_rep = repr(key)
+        parts.append(f"{key_rep}: {_format(value, indent + len(key_rep) + 2, allowance if i == last else 1)}")
+    return f",\n{' ' * indent}".join(parts)
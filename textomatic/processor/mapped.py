@@ -0,0 +1,256 @@
+import bisect
+import dataclasses
+import mmap
+import os
+from typing import Callable, Iterator, List, Union
+
+from textomatic.model import ProcessContext, ProcessedCommand
+from textomatic.processor import inputs, outputs, dates
+from textomatic.processor.common import LRUCache
+from textomatic.processor.process import process, process_cmd, process_rows, extract_output_headers
+
+# smaller files are read into the INPUT buffer and can be edited
+MIN_SIZE = 64 << 20
+BLOCK_SIZE = 1 << 20
+BLOCK_CACHE_SIZE = 16
+# rows are parsed and formatted in chunks of lines, as neighbouring lines are usually displayed as well
+CHUNK_SIZE = 100
+CHUNK_CACHE_SIZE = 64
+# leading lines that line parsers find the header and its size in
+HEAD_LINES = 1000
+ENCODING = "utf-8"
+
+
+class MappedFile:
+    """A read only file mapped into memory, whose lines are decoded on demand.
+
+    Lines are indexed in blocks of about BLOCK_SIZE bytes that end on a line boundary, so building the index
+    only counts newlines. Lines are the same as those of the decoded text split on newlines.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self.size = os.fstat(f.fileno()).st_size
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self.size else b""
+        self.block_starts = []
+        # the number of the first line in each block
+        self.block_lines = []
+        start = line = 0
+        while start < self.size or not self.block_starts:
+            end = self.data.find(b"\n", start + BLOCK_SIZE - 1)
+            end = self.size if end == -1 else end + 1
+            self.block_starts.append(start)
+            self.block_lines.append(line)
+            line += self.data[start:end].count(b"\n")
+            start = end
+        self.block_starts.append(self.size)
+        self.line_count = line + 1
+        self.blocks = LRUCache(BLOCK_CACHE_SIZE)
+        self.contained = {}
+
+    def line(self, i: int) -> str:
+        block = bisect.bisect_right(self.block_lines, i) - 1
+        return self._block(block)[i - self.block_lines[block]]
+
+    def lines(self, start: int, end: int) -> List[str]:
+        return [self.line(i) for i in range(start, min(end, self.line_count))]
+
+    def iter_lines(self) -> Iterator[str]:
+        """Yield lines with their newline, like iterating over the file would"""
+        for block in range(len(self.block_lines)):
+            lines = self._block(block)
+            last = block == len(self.block_lines) - 1
+            for i, line in enumerate(lines):
+                if not last or i < len(lines) - 1:
+                    yield f"{line}\n"
+                elif line:
+                    yield line
+
+    def text(self) -> str:
+        return self.data[:].decode(ENCODING, errors="replace") if self.size else ""
+
+    def close(self):
+        if self.size:
+            self.data.close()
+
+    # line parsers use text to sniff a sample of it and to look for characters in it
+
+    def __getitem__(self, item: slice) -> str:
+        return self.data[item].decode(ENCODING, errors="ignore") if self.size else ""
+
+    def __contains__(self, item: str) -> bool:
+        if item not in self.contained:
+            self.contained[item] = self.data.find(item.encode(ENCODING)) != -1
+        return self.contained[item]
+
+    def __len__(self):
+        return self.size
+
+    def _block(self, block):
+        def decode():
+            start, end = self.block_starts[block], self.block_starts[block + 1]
+            lines = self.data[start:end].decode(ENCODING, errors="replace").split("\n")
+            # the empty text after the newline that ends a block is the start of the next one
+            return lines[:-1] if block < len(self.block_lines) - 1 else lines
+
+        return self.blocks.get(block, decode)
+
+
+class MappedOutput:
+    """The output for a mapped file, where each line is parsed, processed and formatted once it is accessed.
+
+    Each line after the header of the input is one line of the output, empty lines included, both when
+    displayed and in the text of the output. Once a line fails to parse or process, the whole text is
+    processed instead, and its output or error replaces this one. Processing it is handed to schedule, e.g.
+    the worker of the app, as lines are accessed while they are displayed, and lines are empty until it is
+    done. Offers the same interface as outputs.LazyOutput.
+    """
+
+    def __init__(self, mapped_file, parser, headers_list, output_obj, processed_command, cmd, schedule=None):
+        self.mapped_file = mapped_file
+        self.cmd = cmd
+        self.schedule = schedule
+        self.parser = parser
+        self.headers_list = headers_list
+        self.headers = {i: h for i, h in enumerate(headers_list)}
+        self.output_obj = output_obj
+        # headers may be replaced on the command by later runs
+        self.processed_command = dataclasses.replace(processed_command)
+        self.header_lines = output_obj.join_rows([], self.processed_command).splitlines()
+        self.row_count = max(mapped_file.line_count - parser.header_size, 0)
+        self.chunks = LRUCache(CHUNK_CACHE_SIZE)
+        # formats of dates are detected from the first chunk, see check, and used for all others
+        self.date_parsers = dates.DateParsers()
+        # the output of processing the whole text, and its error, once a line failed
+        self.failed = False
+        self.fallback = None
+        self.error = None
+
+    @property
+    def line_count(self):
+        if self.fallback is not None:
+            return self.fallback.line_count
+        return len(self.header_lines) + self.row_count
+
+    def line(self, i: int) -> str:
+        fallback = self.fallback
+        if fallback is not None:
+            return fallback.line(i)
+        if not self.failed:
+            try:
+                return self._line(i)
+            except Exception:
+                self.failed = True
+                if self.schedule:
+                    self.schedule(self._fall_back)
+                else:
+                    self._fall_back()
+                    return self.fallback.line(i)
+        return ""
+
+    def _line(self, i):
+        if i < len(self.header_lines):
+            return self.header_lines[i]
+        i -= len(self.header_lines)
+        chunk = i // CHUNK_SIZE
+        return self.chunks.get(chunk, lambda: self._format(chunk))[i % CHUNK_SIZE]
+
+    def check(self):
+        """Raise the error of the first chunk of rows, if any"""
+        if self.row_count:
+            self._format(0)
+
+    def __str__(self):
+        if self.fallback is None and not self.failed:
+            try:
+                return self._str()
+            except Exception:
+                self.failed = True
+        if self.fallback is None:
+            self._fall_back()
+        if self.error:
+            raise self.error
+        return str(self.fallback)
+
+    def _str(self):
+        lines = list(self.header_lines)
+        for chunk in range((self.row_count + CHUNK_SIZE - 1) // CHUNK_SIZE):
+            lines.extend(self._format(chunk))
+        return "\n".join(lines)
+
+    def _fall_back(self):
+        # e.g. jl lines with other keys, whose headers change the output of all rows
+        try:
+            result = process(self.mapped_file.text(), self.cmd, ProcessContext(ProcessedCommand("")), lazy=True)
+        except Exception as e:
+            self.error = e
+            result = ""
+        # set last, as lines may be displayed while this runs in another thread
+        self.fallback = result if isinstance(result, outputs.LazyOutput) else _TextLines(result)
+
+    def _format(self, chunk):
+        start = self.parser.header_size + chunk * CHUNK_SIZE
+        lines = self.mapped_file.lines(start, start + CHUNK_SIZE)
+        formatted_rows = iter(self._format_lines(lines))
+        return [_strip(next(formatted_rows)) if line.strip() else "" for line in lines]
+
+    def _format_lines(self, lines):
+        rows = self.parser.parse(lines, self.headers_list)
+        if rows is None:
+            raise ValueError("Line does not match the header")
+        rows = list(process_rows(self.processed_command, self.headers, rows, date_parsers=self.date_parsers))
+        return self.output_obj.format_rows(rows, self.processed_command)
+
+
+def process_mapped(
+    mapped_file: MappedFile, cmd: str, ctx: ProcessContext, schedule: Callable[[Callable], None] = None
+) -> Union[str, MappedOutput]:
+    """Return the output for the text of mapped_file, like process with lazy.
+
+    A single line oriented input (see Input.line_parser) whose headers are fixed into a single streaming output
+    returns a MappedOutput, which processes the whole text with schedule once a line fails, anything else
+    reads the whole text and processes it.
+    """
+    processed_cmd, _ = process_cmd(ctx, cmd)
+    input_objs = inputs.registry.get(processed_cmd)
+    output_objs = outputs.registry.get(processed_cmd)
+    # lines map to rows one to one, unless rows are filtered or limited
+    selected = processed_cmd.filter is not None or processed_cmd.limit is not None
+    if (
+        not processed_cmd.raw
+        and not selected
+        and len(input_objs) == 1
+        and len(output_objs) == 1
+        and output_objs[0].streaming
+    ):
+        head = mapped_file.lines(0, HEAD_LINES)
+        parser = input_objs[0].line_parser(mapped_file, head, processed_cmd)
+        if parser and parser.fixed_headers:
+            headers_list = parser.headers(head)
+            if headers_list:
+                processed_cmd.has_header = True
+            headers = {i: h for i, h in enumerate(headers_list)}
+            processed_cmd.headers = extract_output_headers(processed_cmd.structure, headers)
+            result = MappedOutput(mapped_file, parser, headers_list, output_objs[0], processed_cmd, cmd, schedule)
+            result.check()
+            return result
+    return process(mapped_file.text(), cmd, ctx, lazy=True)
+
+
+class _TextLines:
+    def __init__(self, text):
+        self.text = text
+        self.lines = text.split("\n")
+        self.line_count = len(self.lines)
+
+    def line(self, i):
+        # lines that were displayed before the fallback may be out of range
+        return self.lines[i] if i < self.line_count else ""
+
+    def __str__(self):
+        return self.text
+
+
+def _strip(formatted_row):
+    return formatted_row[:-1] if formatted_row.endswith("\n") else formatted_row
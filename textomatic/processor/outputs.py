@@ -1,56 +1,99 @@
 import csv
+import dataclasses
+import datetime
 import io
 import json
-import pprint
-
-from pygments.lexers.special import TextLexer
-from tabulate import tabulate
-from pygments.lexers.data import JsonLexer
-from pygments.lexers.html import HtmlLexer
-from pygments.lexers.python import PythonLexer
+from typing import TextIO, List
 
 from textomatic.model import ProcessedCommand
+from textomatic.processor import literal, table
 from textomatic.processor.common import run_jq
 from textomatic.processor.registry import Registry
 
-DEFAULT_LEXER = PythonLexer
+DEFAULT_LEXER = "python"
+LAZY_FORMAT_CHUNK_SIZE = 100
+
+
+def _to_json(value):
+    # values of the d type
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    raise TypeError(f"Object of type {value.__class__.__name__} is not JSON serializable")
+
+
+_json_dumps = json.JSONEncoder(default=_to_json).encode
 
 
 class Output:
+    # a pygments lexer class or the alias of one
     lexer = DEFAULT_LEXER
+    streaming = False
 
     def create_output(self, rows, processed_command: ProcessedCommand) -> str:
         raise NotImplementedError
 
+    def write_output(self, rows, processed_command: ProcessedCommand, out: TextIO):
+        """Write output for rows into out. Outputs with streaming = True accept any iterable of rows"""
+        out.write(f"{self.create_output(rows, processed_command)}\n")
+
+    def format_rows(self, rows, processed_command: ProcessedCommand) -> List[str]:
+        """Format each row on its own. Only implemented by outputs with streaming = True"""
+        raise NotImplementedError
+
+    def join_rows(self, formatted_rows: List[str], processed_command: ProcessedCommand) -> str:
+        """Join rows returned by format_rows into the same output create_output returns"""
+        raise NotImplementedError
+
+    def split_output(self, output: str, processed_command: ProcessedCommand) -> List[str]:
+        """The inverse of join_rows. Rows that span several lines are not split correctly, so callers
+        should verify the number of rows"""
+        raise NotImplementedError
+
 
 class PythonLiteralOutput(Output):
-    lexer = PythonLexer
+    lexer = "python"
 
     def create_output(self, rows, processed_command: ProcessedCommand) -> str:
-        return pprint.pformat(
-            rows,
-            indent=1,
-            compact=False,
-            sort_dicts=False,
-        )
+        return "".join(literal.render(rows))
+
+    def write_output(self, rows, processed_command: ProcessedCommand, out: TextIO):
+        for part in literal.render(rows):
+            out.write(part)
+        out.write("\n")
 
 
 class JsonOutput(Output):
-    lexer = JsonLexer
+    lexer = "json"
 
     def create_output(self, rows, processed_command: ProcessedCommand) -> str:
-        return json.dumps(rows, indent=4)
+        return json.dumps(rows, indent=4, default=_to_json)
 
 
 class JsonLinesOutput(Output):
-    lexer = JsonLexer
+    lexer = "json"
+    streaming = True
 
     def create_output(self, rows, processed_command: ProcessedCommand) -> str:
-        return "\n".join(json.dumps(r) for r in rows)
+        return "\n".join(map(_json_dumps, rows))
+
+    def write_output(self, rows, processed_command: ProcessedCommand, out: TextIO):
+        for r in rows:
+            out.write(_json_dumps(r))
+            out.write("\n")
+
+    def format_rows(self, rows, processed_command: ProcessedCommand) -> List[str]:
+        return list(map(_json_dumps, rows))
+
+    def join_rows(self, formatted_rows: List[str], processed_command: ProcessedCommand) -> str:
+        return "\n".join(formatted_rows)
+
+    def split_output(self, output: str, processed_command: ProcessedCommand) -> List[str]:
+        return output.split("\n") if output else []
 
 
 class CSVOutput(Output):
-    lexer = JsonLexer
+    lexer = "json"
+    streaming = True
 
     class Dialect(csv.Dialect):
         delimiter = ","
@@ -66,35 +109,60 @@ class CSVOutput(Output):
 
     def create_output(self, rows, processed_command: ProcessedCommand) -> str:
         out = io.StringIO()
+        self.write_output(rows, processed_command, out)
+        return out.getvalue()
+
+    def write_output(self, rows, processed_command: ProcessedCommand, out: TextIO):
         writer = csv.writer(out, self.dialect)
         if processed_command.headers:
             writer.writerow(processed_command.headers.values())
         writer.writerows(rows)
-        return out.getvalue()
 
+    def format_rows(self, rows, processed_command: ProcessedCommand) -> List[str]:
+        formatted_rows = []
+        csv.writer(_ListWriter(formatted_rows), self.dialect).writerows(rows)
+        return formatted_rows
 
-class TableOutput(Output):
-    lexer = JsonLexer
+    def join_rows(self, formatted_rows: List[str], processed_command: ProcessedCommand) -> str:
+        header = []
+        if processed_command.headers:
+            header = self.format_rows([processed_command.headers.values()], processed_command)
+        return "".join(header + formatted_rows)
 
-    def create_output(self, rows, processed_command: ProcessedCommand) -> str:
-        kwargs = {}
+    def split_output(self, output: str, processed_command: ProcessedCommand) -> List[str]:
+        lines = output.split("\n")[:-1]
         if processed_command.headers:
-            kwargs["headers"] = processed_command.headers.values()
-        return tabulate(rows, tablefmt="fancy_grid", **kwargs)
+            lines = lines[1:]
+        return [f"{line}\n" for line in lines]
 
 
-class HTMLOutput(Output):
-    lexer = HtmlLexer
+class TableOutput(Output):
+    lexer = "json"
+    tablefmt = "fancy_grid"
 
     def create_output(self, rows, processed_command: ProcessedCommand) -> str:
-        kwargs = {}
-        if processed_command.headers:
-            kwargs["headers"] = processed_command.headers.values()
-        return tabulate(rows, tablefmt="html", **kwargs)
+        return "\n".join(self._render(rows, processed_command))
+
+    def write_output(self, rows, processed_command: ProcessedCommand, out: TextIO):
+        # lines are written as they are rendered, instead of building the whole table first
+        for i, line in enumerate(self._render(rows, processed_command)):
+            if i:
+                out.write("\n")
+            out.write(line)
+        out.write("\n")
+
+    def _render(self, rows, processed_command):
+        headers = processed_command.headers.values() if processed_command.headers else ()
+        return table.render(rows, headers, self.tablefmt)
+
+
+class HTMLOutput(TableOutput):
+    lexer = "html"
+    tablefmt = "html"
 
 
 class JQOutput(Output):
-    lexer = JsonLexer
+    lexer = "json"
 
     def __init__(self, args):
         self.args = args
@@ -102,14 +170,64 @@ class JQOutput(Output):
     def create_output(self, rows, processed_command: ProcessedCommand) -> str:
         return run_jq(rows, self.args)
 
+    def write_output(self, rows, processed_command: ProcessedCommand, out: TextIO):
+        out.write(f"{run_jq(rows, self.args, parallel=True)}\n")
+
 
 class NopOutput(Output):
-    lexer = TextLexer
+    lexer = "text"
 
     def create_output(self, rows, processed_command: ProcessedCommand) -> str:
         return rows
 
 
+class LazyOutput:
+    """The output of a streaming output, where rows are only formatted once their line is accessed.
+
+    Each row is expected to be formatted into a single line, following any header lines.
+    """
+
+    def __init__(self, output_obj: Output, processed_command: ProcessedCommand, rows=None, formatted_rows=None):
+        self.output_obj = output_obj
+        # headers may be replaced on the command by later runs
+        self.processed_command = dataclasses.replace(processed_command)
+        self.rows = rows
+        self.formatted_rows = [None] * len(rows) if formatted_rows is None else formatted_rows
+        self.header_lines = output_obj.join_rows([], self.processed_command).splitlines()
+        self.line_count = len(self.header_lines) + len(self.formatted_rows)
+
+    def line(self, i: int) -> str:
+        if i < len(self.header_lines):
+            return self.header_lines[i]
+        i -= len(self.header_lines)
+        formatted_row = self.formatted_rows[i]
+        if formatted_row is None:
+            # neighbouring rows are usually displayed as well
+            start = i - i % LAZY_FORMAT_CHUNK_SIZE
+            self._format(start, start + LAZY_FORMAT_CHUNK_SIZE)
+            formatted_row = self.formatted_rows[i]
+        return formatted_row[:-1] if formatted_row.endswith("\n") else formatted_row
+
+    def format_all(self) -> List[str]:
+        for start in range(0, len(self.formatted_rows), LAZY_FORMAT_CHUNK_SIZE):
+            if None in self.formatted_rows[start : start + LAZY_FORMAT_CHUNK_SIZE]:
+                self._format(start, start + LAZY_FORMAT_CHUNK_SIZE)
+        return self.formatted_rows
+
+    def _format(self, start, end):
+        end = min(end, len(self.formatted_rows))
+        self.formatted_rows[start:end] = self.output_obj.format_rows(self.rows[start:end], self.processed_command)
+
+    def __str__(self):
+        return self.output_obj.join_rows(self.format_all(), self.processed_command)
+
+
+class _ListWriter:
+    # csv writers write each row with a single call
+    def __init__(self, target: list):
+        self.write = target.append
+
+
 registry = Registry(
     attr="outputs",
     tpe=Output,
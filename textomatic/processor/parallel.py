@@ -0,0 +1,131 @@
+import dataclasses
+import io
+import multiprocessing
+import os
+from typing import TextIO
+
+from textomatic.model import ProcessContext
+from textomatic.processor import inputs, outputs, dates
+from textomatic.processor.common import gc_paused
+from textomatic.processor.process import (
+    process_cmd,
+    process_rows,
+    extract_output_headers,
+    detect_dates,
+    STREAM_CHUNK_SIZE,
+)
+
+# smaller inputs are processed faster than a pool of processes starts
+MIN_PARALLEL_SIZE = 1 << 20
+# more chunks than jobs, so jobs that finish early pick up more work
+CHUNKS_PER_JOB = 4
+
+# the state of the current run, inherited by forked workers instead of being sent to each of them
+_state = None
+
+
+@dataclasses.dataclass
+class _State:
+    text: str
+    parser: inputs.LineParser
+    headers_list: list
+    processed_cmd: object
+    output_obj: outputs.Output
+    date_parsers: dates.DateParsers
+
+
+def default_jobs():
+    return os.cpu_count() or 1
+
+
+def process_parallel(text: str, cmd: str, ctx: ProcessContext, out: TextIO, jobs: int) -> bool:
+    """Process text in jobs processes, writing the output to out like process_stream.
+
+    The text is split into chunks of lines that are parsed, typed and structured by separate processes,
+    and their results are written in order. Returns False without writing anything when text cannot be
+    processed this way, e.g. when it is small, its input is not line oriented (see Input.line_parser)
+    or processing it in chunks would produce a different output.
+    """
+    global _state
+    if jobs < 2 or len(text) < MIN_PARALLEL_SIZE or "fork" not in multiprocessing.get_all_start_methods():
+        return False
+    processed_cmd, _ = process_cmd(ctx, cmd)
+    input_objs = inputs.registry.get(processed_cmd)
+    output_objs = outputs.registry.get(processed_cmd)
+    # limits end processing early, which chunks processed up front would not
+    if processed_cmd.raw or processed_cmd.limit is not None or len(input_objs) != 1:
+        return False
+    lines = text.split("\n")
+    parser = input_objs[0].line_parser(text, lines, processed_cmd)
+    if not parser:
+        return False
+    headers_list = parser.headers(lines)
+    if headers_list:
+        processed_cmd.has_header = True
+    headers = {i: h for i, h in enumerate(headers_list)}
+    processed_cmd.headers = extract_output_headers(processed_cmd.structure, headers)
+    *output_objs, last_output_obj = output_objs
+    streaming = not output_objs and last_output_obj.streaming
+
+    # formats of dates are detected once, from the first rows, like the first chunk of a stream does
+    date_parsers = dates.DateParsers()
+    head_rows = parser.parse(lines[parser.header_size : parser.header_size + STREAM_CHUNK_SIZE], headers_list)
+    if head_rows is None:
+        return False
+    detect_dates(processed_cmd, headers, head_rows, date_parsers)
+
+    body_start = 0
+    for _ in range(parser.header_size):
+        body_start = text.find("\n", body_start) + 1 or len(text)
+    chunks = _split(text, body_start, jobs * CHUNKS_PER_JOB)
+    output_obj = last_output_obj if streaming else None
+    _state = _State(text, parser, headers_list, processed_cmd, output_obj, date_parsers)
+    try:
+        context = multiprocessing.get_context("fork")
+        with context.Pool(jobs) as pool:
+            results = pool.starmap(_process_chunk, chunks)
+    finally:
+        _state = None
+    if any(r is None for r in results):
+        return False
+
+    if streaming:
+        for result in results:
+            out.write(result)
+        return True
+    rows = [row for result in results for row in result]
+    for output_obj in output_objs:
+        rows = output_obj.create_output(rows, processed_cmd)
+    last_output_obj.write_output(rows, processed_cmd, out)
+    return True
+
+
+def _split(text, start, count):
+    # chunks end at line boundaries, the first one also holds whatever output precedes the rows
+    chunk_size = max((len(text) - start) // count, 1)
+    chunks = []
+    while start < len(text) or not chunks:
+        end = text.find("\n", start + chunk_size)
+        end = len(text) if end == -1 else end + 1
+        chunks.append((start, end, not chunks))
+        start = end
+    return chunks
+
+
+def _process_chunk(start, end, first):
+    state = _state
+    processed_cmd = state.processed_cmd
+    headers = {i: h for i, h in enumerate(state.headers_list)}
+    with gc_paused():
+        rows = state.parser.parse(state.text[start:end].split("\n"), state.headers_list)
+        if rows is None:
+            return None
+        rows = list(process_rows(processed_cmd, headers, rows, date_parsers=state.date_parsers))
+    if not state.output_obj:
+        return rows
+    if not first:
+        # headers are only written once, before the rows of the first chunk
+        processed_cmd = dataclasses.replace(processed_cmd, headers=None)
+    out = io.StringIO()
+    state.output_obj.write_output(rows, processed_cmd, out)
+    return out.getvalue()
@@ -1,25 +1,21 @@
+import functools
+import re
 import string
 from dataclasses import dataclass
+from types import SimpleNamespace
 from typing import List, Union, Any
 
-from pyparsing import (
-    Literal,
-    ZeroOrMore,
-    Empty,
-    Word,
-    Optional,
-    Combine,
-    printables,
-    nums,
-    QuotedString,
-    Suppress,
-    Forward,
-    alphanums,
-)
-
 from textomatic.exceptions import ProcessException
 from textomatic.model import NO_DEFAULT
 
+# parse results are shared between callers and must not be modified
+PARSE_CACHE_SIZE = 256
+
+# expressions that are plain lists of types or aliases are parsed without building the grammar
+_PLAIN_TYPES = re.compile(r"\s*[sifbjld_]?\s*(,\s*[sifbjld_]?\s*)*")
+_PLAIN_PROCESSORS = re.compile(r"\s*[A-Za-z0-9]+\s*(,\s*[A-Za-z0-9]+\s*)*")
+_NUMBER = re.compile(r"-?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?")
+
 
 class ParseData:
     pass
@@ -36,6 +32,8 @@ class TypeDefData(ParseData):
     type: str
     optional: bool
     default: Any
+    # e.g. the format of d
+    args: str = None
 
 
 @dataclass
@@ -68,70 +66,183 @@ class ProcessorData(ParseData):
     args: str
 
 
-# general
-OptionalMarker = Optional("?")("optional")
-PrintablesReducedForDefault = Word(string.printable, excludeChars="/")
-PrintablesReducedForArgs = Word(string.printable, excludeChars="`")
-Default = Optional(Combine(Suppress("/") + PrintablesReducedForDefault + Suppress("/")))("default")
-
-# ref
-Loc = Combine(Optional("-") + Word(nums)) + OptionalMarker
-Loc.setParseAction(lambda t: [LocData(int(t[0]), optional=bool(t.optional))])
-PrintablesReducedForId = Word(printables, excludeChars="}]),./:?")
-FreeFormForId = QuotedString("'") | QuotedString('"') | PrintablesReducedForId
-Id = FreeFormForId + OptionalMarker
-Id.setParseAction(lambda t: [IdData(t[0], optional=bool(t.optional))])
-Ref = Loc | Id
-RefPath = (Ref + ZeroOrMore(Suppress(".") + Ref))("ref_path") + Default
-
-# types
-AnyType = Word("sifbjld_", exact=1) + OptionalMarker + Default
-AnyType.setParseAction(lambda t: [TypeDefData(t[0], optional=bool(t.optional), default=t.default or NO_DEFAULT)])
-DefaultType = Empty()
-DefaultType.setParseAction(lambda t: [TypeDefData("_", optional=False, default=NO_DEFAULT)])
-RefToType = Ref + Suppress(":") + AnyType
-RefToType.setParseAction(lambda t: [KeyToValueData(t[0], t[1])])
-TypeDef = RefToType | AnyType | DefaultType
-Types = (TypeDef + ZeroOrMore(Suppress(",") + TypeDef))("types")
-Types.setParseAction(lambda t: [t.types.asList()])
-
-# structure
-Structure = Forward()
-StructureRef = RefPath.copy()
-StructureRef.setParseAction(lambda t: [RefData(t.ref_path.asList(), default=t.default or NO_DEFAULT)])
-StructureOrRef = Structure | StructureRef
-IdToStructureOrRef = Id + Suppress(":") + StructureOrRef
-IdToStructureOrRef.setParseAction(lambda t: [KeyToValueData(t[0], t[1])])
-Field = IdToStructureOrRef | StructureOrRef
-Fields = (Field + ZeroOrMore(Suppress(",") + Field))("fields")
-Fields.setParseAction(lambda t: [t.fields.asList()])
-Structure << ("[" + Fields + "]" | "{" + Fields + "}" | "(" + Fields + ")" | "d(" + Fields + ")" | "s(" + Fields + ")")
-Structure.setParseAction(lambda t: [StructureData(t[0] + t[-1], t[1])])
-EmptyStructure = Literal("[]") | "{}" | "()" | "d()" | "s()"
-EmptyStructure.setParseAction(lambda t: [StructureData(t[0], [])])
-TopLevelStructure = EmptyStructure | Structure
-
-# processor (inputs/outputs)
-ProcessorArgsInner = Optional(PrintablesReducedForArgs)
-ProcessorArgs = (Suppress("`") + ProcessorArgsInner + Suppress("`"))("args")
-ProcessorAlias = Word(alphanums)("alias")
-Processor = ProcessorAlias + Optional(ProcessorArgs)
-Processor.setParseAction(lambda t: [ProcessorData(t.alias, (t.args or [""])[0])])
-Processors = (Processor + ZeroOrMore(Suppress(",") + Processor))("processors")
-Processors.setParseAction(lambda t: [t.processors.asList()])
+@dataclass
+class ComparisonData(ParseData):
+    # the parts of a ref, as in structures
+    ref: list
+    op: str
+    # a str, or an int or float when it is an unquoted number
+    value: Any
+
+
+@dataclass
+class BoolOpData(ParseData):
+    # and/or
+    op: str
+    operands: list
+
+
+@dataclass
+class NotData(ParseData):
+    operand: object
+
+
+@functools.lru_cache(maxsize=None)
+def _grammar():
+    # the grammar is built on first use, as importing and building it is slow
+    # compared to processing small inputs
+    from pyparsing import (
+        Literal,
+        ZeroOrMore,
+        Empty,
+        Word,
+        Keyword,
+        Optional,
+        Combine,
+        printables,
+        nums,
+        QuotedString,
+        Suppress,
+        Forward,
+        alphanums,
+        oneOf,
+        infixNotation,
+        opAssoc,
+    )
+
+    # general
+    OptionalMarker = Optional("?")("optional")
+    PrintablesReducedForDefault = Word(string.printable, excludeChars="/")
+    PrintablesReducedForArgs = Word(string.printable, excludeChars="`")
+    Default = Optional(Combine(Suppress("/") + PrintablesReducedForDefault + Suppress("/")))("default")
+
+    # ref
+    Loc = Combine(Optional("-") + Word(nums)) + OptionalMarker
+    Loc.setParseAction(lambda t: [LocData(int(t[0]), optional=bool(t.optional))])
+    PrintablesReducedForId = Word(printables, excludeChars="}]),./:?")
+    FreeFormForId = QuotedString("'") | QuotedString('"') | PrintablesReducedForId
+    Id = FreeFormForId + OptionalMarker
+    Id.setParseAction(lambda t: [IdData(t[0], optional=bool(t.optional))])
+    Ref = Loc | Id
+    RefPath = (Ref + ZeroOrMore(Suppress(".") + Ref))("ref_path") + Default
+
+    # types
+    TypeArgs = (Suppress("`") + Optional(PrintablesReducedForArgs) + Suppress("`"))("args")
+    AnyType = Word("sifbjld_", exact=1) + Optional(TypeArgs) + OptionalMarker + Default
+    AnyType.setParseAction(
+        lambda t: [
+            TypeDefData(
+                t[0],
+                optional=bool(t.optional),
+                default=t.default or NO_DEFAULT,
+                args=(t.args or [None])[0],
+            )
+        ]
+    )
+    DefaultType = Empty()
+    DefaultType.setParseAction(lambda t: [TypeDefData("_", optional=False, default=NO_DEFAULT)])
+    RefToType = Ref + Suppress(":") + AnyType
+    RefToType.setParseAction(lambda t: [KeyToValueData(t[0], t[1])])
+    TypeDef = RefToType | AnyType | DefaultType
+    Types = (TypeDef + ZeroOrMore(Suppress(",") + TypeDef))("types")
+    Types.setParseAction(lambda t: [t.types.asList()])
+
+    # structure
+    Structure = Forward()
+    StructureRef = RefPath.copy()
+    StructureRef.setParseAction(lambda t: [RefData(t.ref_path.asList(), default=t.default or NO_DEFAULT)])
+    StructureOrRef = Structure | StructureRef
+    IdToStructureOrRef = Id + Suppress(":") + StructureOrRef
+    IdToStructureOrRef.setParseAction(lambda t: [KeyToValueData(t[0], t[1])])
+    Field = IdToStructureOrRef | StructureOrRef
+    Fields = (Field + ZeroOrMore(Suppress(",") + Field))("fields")
+    Fields.setParseAction(lambda t: [t.fields.asList()])
+    Structure << (
+        "[" + Fields + "]" | "{" + Fields + "}" | "(" + Fields + ")" | "d(" + Fields + ")" | "s(" + Fields + ")"
+    )
+    Structure.setParseAction(lambda t: [StructureData(t[0] + t[-1], t[1])])
+    EmptyStructure = Literal("[]") | "{}" | "()" | "d()" | "s()"
+    EmptyStructure.setParseAction(lambda t: [StructureData(t[0], [])])
+    TopLevelStructure = EmptyStructure | Structure
+
+    # processor (inputs/outputs)
+    ProcessorArgsInner = Optional(PrintablesReducedForArgs)
+    ProcessorArgs = (Suppress("`") + ProcessorArgsInner + Suppress("`"))("args")
+    ProcessorAlias = Word(alphanums)("alias")
+    Processor = ProcessorAlias + Optional(ProcessorArgs)
+    Processor.setParseAction(lambda t: [ProcessorData(t.alias, (t.args or [""])[0])])
+    Processors = (Processor + ZeroOrMore(Suppress(",") + Processor))("processors")
+    Processors.setParseAction(lambda t: [t.processors.asList()])
+
+    # filter
+    FilterKeyword = Keyword("and") | Keyword("or") | Keyword("not")
+    FilterLoc = Combine(Optional("-") + Word(nums))
+    FilterLoc.setParseAction(lambda t: [LocData(int(t[0]))])
+    FilterId = QuotedString("'") | QuotedString('"') | ~FilterKeyword + Word(printables, excludeChars="}]()./:?=<>!~")
+    FilterId.setParseAction(lambda t: [IdData(t[0])])
+    FilterRefPart = FilterLoc | FilterId
+    FilterRef = (FilterRefPart + ZeroOrMore(Suppress(".") + FilterRefPart))("ref")
+    FilterOp = oneOf("== != <= >= < > ~")("op")
+    QuotedValue = QuotedString("'", escChar="\\") | QuotedString('"', escChar="\\")
+    PlainValue = Word(printables, excludeChars="()")
+    PlainValue.setParseAction(lambda t: [_plain_value(t[0])])
+    Comparison = FilterRef + FilterOp + (QuotedValue | PlainValue)
+    Comparison.setParseAction(lambda t: [ComparisonData(t.ref.asList(), t.op, t[-1])])
+    Filter = infixNotation(
+        Comparison,
+        [
+            (Keyword("not"), 1, opAssoc.RIGHT, lambda t: [NotData(t[0][1])]),
+            (Keyword("and"), 2, opAssoc.LEFT, lambda t: [BoolOpData("and", t[0][::2])]),
+            (Keyword("or"), 2, opAssoc.LEFT, lambda t: [BoolOpData("or", t[0][::2])]),
+        ],
+    )
+
+    return SimpleNamespace(types=Types, structure=TopLevelStructure, processors=Processors, filter=Filter)
+
+
+def _plain_value(value):
+    # unquoted numbers compare as numbers
+    if not _NUMBER.fullmatch(value):
+        return value
+    try:
+        return int(value)
+    except ValueError:
+        return float(value)
 
 
 # api
+@functools.lru_cache(maxsize=PARSE_CACHE_SIZE)
 def parse_types(expr) -> List[Union[KeyToValueData, TypeDefData]]:
-    return _parse(Types, expr)
+    if _PLAIN_TYPES.fullmatch(expr):
+        return [TypeDefData(t.strip() or "_", optional=False, default=NO_DEFAULT) for t in expr.split(",")]
+    return _parse(_grammar().types, expr)
 
 
+@functools.lru_cache(maxsize=PARSE_CACHE_SIZE)
 def parse_structure(expr) -> StructureData:
-    return _parse(TopLevelStructure, expr)
+    return _parse(_grammar().structure, expr)
 
 
+@functools.lru_cache(maxsize=PARSE_CACHE_SIZE)
 def parse_processors(expr) -> ProcessorData:
-    return _parse(Processors, expr)
+    if _PLAIN_PROCESSORS.fullmatch(expr):
+        return [ProcessorData(alias.strip(), "") for alias in expr.split(",")]
+    return _parse(_grammar().processors, expr)
+
+
+@functools.lru_cache(maxsize=PARSE_CACHE_SIZE)
+def parse_filter(expr) -> Union[ComparisonData, BoolOpData, NotData]:
+    return _parse(_grammar().filter, expr)
+
+
+def parse_limit(expr) -> int:
+    try:
+        limit = int(expr)
+    except ValueError:
+        limit = -1
+    if limit < 0:
+        raise ProcessException(f"Not a valid limit: {expr}")
+    return limit
 
 
 # internal
@@ -1,300 +1,392 @@
 import ast
-import json
+import dataclasses
+import io
+import itertools
+from operator import is_
+from typing import Iterable, TextIO, List, Sequence
 
-from textomatic.context import ProcessContext
-from textomatic.processor import parser, outputs, inputs, macros
-from textomatic.exceptions import ProcessException
-from textomatic.model import ProcessedInput, ProcessedCommand, NO_DEFAULT, MISSING
+from textomatic.processor import parser, outputs, inputs, macros, compiler, columnar, profiling, dates
+from textomatic.exceptions import ProcessException, ProcessCancelled
+from textomatic.model import ProcessedInput, ProcessedCommand, ProcessContext, MISSING
+from textomatic.processor.common import LRUCache, SizedLRUCache
 
 DEFAULT_CMD = ProcessedCommand("")
+ROW_PROCESSORS_CACHE_SIZE = 64
+STREAM_CHUNK_SIZE = 10000
+
+# compiled processors are shared by commands with the same t, s and w expressions
+_row_types_processors = LRUCache(ROW_PROCESSORS_CACHE_SIZE)
+_row_processors = LRUCache(ROW_PROCESSORS_CACHE_SIZE)
+_row_filters = LRUCache(ROW_PROCESSORS_CACHE_SIZE)
+CANCEL_CHECK_INTERVAL = 1000
+# outputs with fewer rows are formatted in full even when a lazy output is requested
+LAZY_MIN_ROWS = 10000
+# the estimated size of the typed and structured rows kept for each context, see _cached_rows
+STAGE_CACHE_MAX_SIZE = 256 << 20
+
+
+def process(text: str, cmd: str, ctx: ProcessContext, trigger: str = None, lazy: bool = False):
+    """Return the output for text. With lazy, large outputs of a single streaming output are
+    returned as an outputs.LazyOutput. The stages of processing are recorded into ctx.profile, if it is set"""
+    with profiling.profiled(ctx.profile):
+        return _process(text, cmd, ctx, trigger, lazy)
+
+
+def _process(text, cmd, ctx, trigger, lazy):
+    with profiling.stage("command"):
+        processed_cmd, changed = process_cmd(ctx, cmd)
+    input_objs = inputs.registry.get(processed_cmd)
+    output_objs = outputs.registry.get(processed_cmd)
 
+    if trigger == "cmd" and not changed:
+        return None
 
-def get(attr, _):
-    def fn(v):
-        result = v[attr]
-        if result is MISSING:
-            raise IndexError(f"Missing {attr}")
-        return result
-
-    return fn
-
+    # with a limit, the input is only parsed up to the rows that pass the filter, see parse_input
+    reparse_attrs = ["delimiter", "inputs", "has_header", "raw", "limit"]
+    if processed_cmd.limit is not None:
+        reparse_attrs.append("filter")
+    date_parsers = dates.DateParsers()
+    if trigger != "cmd" or any(attr in changed for attr in reparse_attrs):
+        rows, headers = parse_input(text, processed_cmd, input_objs, date_parsers)
+        ctx.processed_input = ProcessedInput(rows, headers, selected=parses_head(processed_cmd, input_objs))
+        clear_stages(ctx)
+    else:
+        headers = ctx.processed_input.headers
+        rows = ctx.processed_input.rows
+        if "filter" in changed:
+            clear_stages(ctx)
+    _check_cancelled(ctx)
+    # converts types and builds the structure of each row
+    with profiling.stage("rows") as stage:
+        if processed_cmd.raw:
+            rows = process_rows(processed_cmd, headers, rows)
+        else:
+            rows = _cached_rows(ctx, processed_cmd, headers, rows, ctx.processed_input.selected, date_parsers)
+        if stage:
+            stage.rows = profiling.count(rows)
+    processed_cmd.headers = extract_output_headers(processed_cmd.structure, headers)
 
-def getsafe(attr, default=None):
-    def fn(v):
-        try:
-            result = v[attr]
-            if result is MISSING:
-                result = default
-            return result
-        except Exception:
-            return default
+    if lazy and not processed_cmd.raw and len(output_objs) == 1 and output_objs[0].streaming:
+        if len(rows) >= LAZY_MIN_ROWS:
+            return outputs.LazyOutput(output_objs[0], processed_cmd, rows=rows)
 
-    return fn
+    result = rows
+    for output_obj in output_objs:
+        _check_cancelled(ctx)
+        with profiling.stage(f"output:{outputs.registry.alias_of(output_obj)}") as stage:
+            if stage:
+                stage.rows = profiling.count(result)
+            result = output_obj.create_output(result, processed_cmd)
+            if stage:
+                stage.bytes = profiling.size(result)
+    return result
 
 
-def process(text: str, cmd: str, ctx: ProcessContext, trigger: str = None):
-    processed_cmd, changed = _process_cmd(ctx, cmd)
+def parse_input(text: str, processed_cmd: ProcessedCommand, input_objs=None, date_parsers=None):
+    """Return the rows of text and their headers, by index. With a limit and a single input, lines are
+    only parsed until enough rows pass the filter, and only those rows are returned. The filter parses
+    dates with date_parsers, see process_rows"""
+    rows, headers_list = text, []
+    input_objs = input_objs or inputs.registry.get(processed_cmd)
+    head = parses_head(processed_cmd, input_objs)
+    for input_obj in input_objs:
+        prev_headers = headers_list
+        with profiling.stage(f"input:{inputs.registry.alias_of(input_obj)}") as stage:
+            if stage:
+                stage.bytes = profiling.size(rows)
+            if head:
+                rows, headers_list = _parse_head(input_obj, rows, processed_cmd, date_parsers)
+            else:
+                rows, headers_list = input_obj.get_rows(rows, processed_cmd)
+            if stage:
+                stage.rows = profiling.count(rows)
+        headers_list = headers_list or prev_headers
+    headers = {i: h for i, h in enumerate(headers_list)}
+    if headers:
+        processed_cmd.has_header = True
+    return rows, headers
+
+
+def parses_head(processed_cmd: ProcessedCommand, input_objs=None) -> bool:
+    """Whether parse_input only returns the rows that pass the filter, up to the limit. process_rows is
+    told not to select those rows again"""
+    input_objs = input_objs or inputs.registry.get(processed_cmd)
+    return processed_cmd.limit is not None and len(input_objs) == 1 and not processed_cmd.raw
+
+
+def _parse_head(input_obj, text, processed_cmd, date_parsers):
+    rows, headers_list = input_obj.iter_rows(io.StringIO(text), processed_cmd)
+    rows = iter(rows)
+    result = []
+    while len(result) < processed_cmd.limit:
+        size = STREAM_CHUNK_SIZE if processed_cmd.filter else processed_cmd.limit - len(result)
+        chunk = list(itertools.islice(rows, size))
+        if not chunk:
+            break
+        result.extend(select_rows(processed_cmd, dict(enumerate(headers_list)), chunk, date_parsers))
+    del result[processed_cmd.limit :]
+    return result, headers_list
+
+
+def process_stream(lines: Iterable[str], cmd: str, ctx: ProcessContext, out: TextIO):
+    """Process lines lazily, writing rows to out as they are produced when the output supports it"""
+    processed_cmd, _ = process_cmd(ctx, cmd)
     input_objs = inputs.registry.get(processed_cmd)
     output_objs = outputs.registry.get(processed_cmd)
 
-    if trigger == "cmd" and not changed:
-        return None
+    first_input_obj, *rest_input_objs = input_objs
+    rows, headers_list = first_input_obj.iter_rows(lines, processed_cmd)
+    for input_obj in rest_input_objs:
+        prev_headers = headers_list
+        rows, headers_list = input_obj.get_rows(rows, processed_cmd)
+        headers_list = headers_list or prev_headers
 
-    if trigger != "cmd" or any(attr in changed for attr in ["delimiter", "inputs", "has_header", "raw"]):
-        rows, headers_list = text, []
-        for input_obj in input_objs:
-            prev_headers = headers_list
-            rows, headers_list = input_obj.get_rows(rows, processed_cmd)
-            headers_list = headers_list or prev_headers
-        headers = {i: h for i, h in enumerate(headers_list)}
-        ctx.processed_input = ProcessedInput(rows, headers)
-        if headers:
+    if not processed_cmd.raw:
+        if headers_list:
             processed_cmd.has_header = True
+        headers = {i: h for i, h in enumerate(headers_list)}
+        rows = _stream_rows(processed_cmd, headers, rows)
+        if processed_cmd.limit is not None:
+            # lines after the last row are not read
+            rows = itertools.islice(rows, processed_cmd.limit)
     else:
-        headers = ctx.processed_input.headers
-        rows = ctx.processed_input.rows
-    rows = _process_rows(processed_cmd, headers, rows)
-    processed_cmd.headers = _extract_output_headers(processed_cmd.structure, headers)
+        headers = {}
+    processed_cmd.headers = extract_output_headers(processed_cmd.structure, headers)
 
-    result = rows
-    for output_obj in output_objs:
-        result = output_obj.create_output(result, processed_cmd)
+    *output_objs, last_output_obj = output_objs
+    if output_objs or not last_output_obj.streaming:
+        if not processed_cmd.raw:
+            rows = list(rows)
+        for output_obj in output_objs:
+            rows = output_obj.create_output(rows, processed_cmd)
+    last_output_obj.write_output(rows, processed_cmd, out)
+
+
+def process_follow(batches: Iterable[List[str]], cmd: str, ctx: ProcessContext, out: TextIO):
+    """Process an input that keeps growing, given as batches of its lines as they arrive (see follow).
+
+    The rows of each batch are written to out and flushed before the next batch is waited for. The headers,
+    and e.g. the csv dialect, are detected from the first batch with rows, see Input.follow_parser.
+    """
+    processed_cmd, _ = process_cmd(ctx, cmd)
+    input_objs = inputs.registry.get(processed_cmd)
+    output_objs = outputs.registry.get(processed_cmd)
+    if processed_cmd.raw or len(input_objs) != 1 or len(output_objs) != 1 or not output_objs[0].streaming:
+        raise ProcessException("Following an input requires a single c, sh or jl input and a single jl or c output")
+    (input_obj,), (output_obj,) = input_objs, output_objs
+
+    batches = iter(batches)
+    lines = []
+    parser = None
+    for batch in batches:
+        lines.extend(batch)
+        parser = input_obj.follow_parser("\n".join(lines), lines, processed_cmd)
+        if not parser:
+            raise ProcessException("Following an input requires lines that each hold a single row")
+        if any(map(str.strip, lines[parser.header_size :])):
+            break
+    if not parser:
+        return
+    headers_list = parser.headers(lines)
+    if headers_list:
+        processed_cmd.has_header = True
+    headers = {i: h for i, h in enumerate(headers_list)}
+    processed_cmd.headers = extract_output_headers(processed_cmd.structure, headers)
+    # formats of dates are detected from the first batch with rows
+    date_parsers = dates.DateParsers()
+
+    def rows():
+        for batch in itertools.chain([lines[parser.header_size :]], batches):
+            batch_rows = parser.parse(batch, headers_list)
+            if batch_rows is None:
+                raise ProcessException("Following an input requires lines that each hold a single row")
+            yield from process_rows(processed_cmd, headers, batch_rows, date_parsers=date_parsers)
+            # rows of a batch are written before waiting for the next one
+            out.flush()
+
+    selected = rows()
+    if processed_cmd.limit is not None:
+        selected = itertools.islice(selected, processed_cmd.limit)
+    output_obj.write_output(selected, processed_cmd, out)
+    out.flush()
+
+
+def clear_stages(ctx: ProcessContext):
+    """Forget the rows cached for ctx.processed_input. Called whenever it is replaced or changed"""
+    if ctx.stages:
+        ctx.stages.clear()
+
+
+def _cached_rows(ctx, processed_cmd, headers, rows, selected, date_parsers):
+    # rows of ctx.processed_input after types and structure are cached by the expressions they depend on,
+    # so changing anything downstream of them, e.g. the output, does not process rows again. When the
+    # structure changes but the types do not, rows are typed and structured in two passes and the
+    # typed rows are cached as well, so switching between structures only builds them again
+    if ctx.stages is None:
+        ctx.stages = SizedLRUCache(STAGE_CACHE_MAX_SIZE)
+    stages = ctx.stages
+    t, s = processed_cmd.expressions.get("t"), processed_cmd.expressions.get("s")
+    headers_key = tuple(headers.values())
+    key = ("rows", t, s, headers_key)
+    if key in stages:
+        return stages.get(key, None)
+    typed_key = ("types", t, headers_key)
+    restructured = any(k[0] == "rows" and k[1] == t and k[3] == headers_key for k in stages.keys())
+    if s and (typed_key in stages or restructured) and _complete(rows):
+        w = processed_cmd.expressions.get("w")
+        types_cmd = dataclasses.replace(processed_cmd, structure=None, expressions={"t": t, "w": w})
+        structure_cmd = dataclasses.replace(processed_cmd, types=None, filter=None, limit=None, expressions={"s": s})
+        typed = stages.get(
+            typed_key, lambda: _consume_rows(ctx, process_rows(types_cmd, headers, rows, selected, date_parsers))
+        )
+        result = _consume_rows(ctx, process_rows(structure_cmd, headers, typed))
+    else:
+        result = _consume_rows(ctx, process_rows(processed_cmd, headers, rows, selected, date_parsers))
+    stages.put(key, result)
     return result
 
 
-def _extract_output_headers(structure: parser.StructureData, input_headers):
+def _complete(rows):
+    # typed rows hold None where values are MISSING, which structures treat differently
+    return isinstance(rows, list) and not any(map(is_, itertools.chain.from_iterable(rows), itertools.repeat(MISSING)))
+
+
+def _check_cancelled(ctx: ProcessContext):
+    if ctx.cancelled and ctx.cancelled.is_set():
+        raise ProcessCancelled()
+
+
+def _consume_rows(ctx: ProcessContext, rows):
+    if not ctx.cancelled:
+        return list(rows)
+    result = []
+    while True:
+        chunk = list(itertools.islice(rows, CANCEL_CHECK_INTERVAL))
+        if not chunk:
+            return result
+        _check_cancelled(ctx)
+        result.extend(chunk)
+
+
+def extract_output_headers(structure: parser.StructureData, input_headers):
     if not structure or not structure.fields:
         return input_headers
     result = {}
     for i, field in enumerate(structure.fields):
-        result[i] = _extract_structure_field_name(field, input_headers)
+        result[i] = compiler.structure_field_name(field, input_headers)
     return result
 
 
-def _extract_structure_field_name(field: parser.ParseData, headers):
-    if isinstance(field, parser.KeyToValueData):
-        name = field.key.value
-    elif isinstance(field, parser.RefData):
-        first, rest = field.value[0], field.value[1:]
-        if isinstance(first, parser.LocData):
-            num = first.value
-            if num > 0:
-                num -= 1
-            else:
-                num += len(headers)
-            if num in headers:
-                first_name = headers[num]
-            else:
-                first_name = str(first.value)
-        elif isinstance(first, parser.IdData):
-            first_name = first.value
-        else:
-            raise ProcessException(f"Unexpected first field: {first}")
-        name = ".".join([first_name] + [str(f.value) for f in rest])
-    else:
-        raise ProcessException(f"Unexpected field: {field}")
-    return name
+def process_rows(processed_cmd, headers, rows, selected=False, date_parsers=None):
+    """Return the rows after types and structure. Unless selected, rows that do not pass the filter, or are
+    past the limit, are dropped first.
 
-
-def _process_rows(processed_cmd, headers, rows):
+    Rows that are processed in parts, e.g. the chunks of a stream, pass the date_parsers of their run, so
+    dates are parsed the same in every part. Without them, formats are detected from rows alone.
+    """
     if processed_cmd.raw:
         return rows
-    headers_inverse = {h: i for i, h in headers.items()}
-    type_processors = _build_row_types_processor(processed_cmd.types, headers_inverse)
-    structure_processor = _build_row_structure_processor(processed_cmd.structure, headers, headers_inverse)
-    return [_process_row(type_processors, structure_processor, r) for r in rows]
-
-
-def _process_row(type_processors, structure_processor, row):
-    if type_processors:
-        row = row[:]
-        for i, type_processor, optional_ref, optional_type, default in type_processors:
-            try:
-                value = row[i]
-                if value is MISSING:
-                    if optional_ref:
-                        row[i] = default
-                        continue
-                    else:
-                        raise IndexError(f"Missing index {i}")
-                try:
-                    row[i] = type_processor(value)
-                except ProcessException:
-                    raise
-                except Exception:
-                    if not optional_type:
-                        raise
-                    row[i] = default
-            except IndexError:
-                if not optional_ref:
-                    raise
-    return structure_processor(row)
-
-
-def _build_row_types_processor(types, headers_inverse):
-    type_processors = []
-    if not types:
-        return type_processors
-    saw_header = False
-    for i, col_type in enumerate(types):
-        if isinstance(col_type, parser.TypeDefData):
-            if saw_header:
-                raise ProcessException("Cannot specify types for indexed columns after named columns")
-            type_def = col_type
-            optional_type = type_def.optional
-            optional_ref = optional_type
-            default = type_def.default
-        elif isinstance(col_type, parser.KeyToValueData):
-            saw_header = True
-            type_def = col_type.value
-            optional_type = type_def.optional
-            default = type_def.default
-            if isinstance(col_type.key, parser.LocData):
-                optional_ref = col_type.key.optional
-                i = col_type.key.value
-                if i > 0:
-                    i -= 1
-            elif isinstance(col_type.key, parser.IdData):
-                optional_ref = col_type.key.optional
-                header = col_type.key.value
-                i = headers_inverse[header]
-            else:
-                raise ProcessException(f"Unknown key type: {col_type.key}")
-        else:
-            raise ProcessException(f"Unknown col_type: {col_type}")
-        row_type_processor = _build_type_processor(type_def.type)
-        if default is not NO_DEFAULT and not (optional_ref or optional_type):
-            optional_ref = True
-            optional_type = True
-        if default is NO_DEFAULT:
-            default = None
-        else:
-            try:
-                default = ast.literal_eval(default)
-            except Exception as e:
-                raise ProcessException(f"Invalid default literal value: {default}") from e
-        type_processors.append((i, row_type_processor, optional_ref, optional_type, default))
-    return type_processors
-
-
-def _build_type_processor(t):
-    if t in {"_", "s"}:
-        return str
-    elif t == "f":
-        return float
-    elif t == "i":
-        return int
-    elif t == "b":
-        return lambda v: str(v).lower() in {"true", "yes", "y", "on", "1"}
-    elif t == "j":
-        return lambda v: json.loads(str(v))
-    elif t == "l":
-        return lambda v: ast.literal_eval(str(v))
-    elif t == "d":
-        raise ProcessException("Dates are not supported yet")
-    else:
-        raise ProcessException(f"Unsupported column type: {t}")
-
-
-def _build_row_structure_processor(structure, headers, headers_inverse):
-    def replace_missing_from_row(r):
-        return [replace_missing(v) for v in r]
-
-    def replace_missing(v):
-        return None if v is MISSING else v
-
-    if not structure:
-        return lambda r: replace_missing_from_row(r)
-
-    def impl(data: parser.ParseData, values):
-        if isinstance(data, parser.StructureData):
-            assert values
-            if not data.fields:
-                if data.type == "[]":
-                    return lambda r: replace_missing_from_row(r)
-                elif data.type == "()":
-                    return lambda r: tuple(replace_missing(i) for i in r)
-                elif data.type == "s()":
-                    return lambda r: set(replace_missing(i) for i in r)
-                elif data.type in {"{}", "d()"}:
-                    return lambda r: dict(zip(headers.values(), replace_missing_from_row(r)))
-                else:
-                    raise ProcessException(f"Unsupported data type: {data.type}")
-            else:
-                values = [impl(f, values=True) for f in data.fields]
-                if data.type == "[]":
-                    return lambda row: [v(row) for v in values]
-                elif data.type == "()":
-                    return lambda row: tuple(v(row) for v in values)
-                elif data.type == "s()":
-                    return lambda row: set(v(row) for v in values)
-                elif data.type in {"{}", "d()"}:
-                    keys = [impl(f, values=False) for f in data.fields]
-                    return lambda row: dict(zip(keys, [v(row) for v in values]))
-                else:
-                    raise ProcessException(f"Unsupported data type: {data.type}")
-        elif isinstance(data, parser.KeyToValueData):
-            if values:
-                return impl(data.value, values=True)
-            else:
-                return data.key.value
-        elif isinstance(data, parser.RefData):
-            if values:
-                path = data.value
-                default = data.default
-                has_default = default is not NO_DEFAULT
-                if has_default:
-                    try:
-                        default = ast.literal_eval(default)
-                    except Exception as e:
-                        raise ProcessException(f"Invalid default literal value: {default}") from e
-                else:
-                    default = None
-                has_optional = any(
-                    (isinstance(p, parser.IdData) and p.optional) or (isinstance(p, parser.LocData) and p.optional)
-                    for p in path
-                )
-                value_processor = []
-                for part in path:
-                    getter = get
-                    if isinstance(part, parser.IdData):
-                        if part.optional or (has_default and not has_optional):
-                            getter = getsafe
-                        key = part.value
-                        if not value_processor:
-                            index = headers_inverse.get(key)
-                            value_processor.append(getter(index, default))
-                        else:
-                            value_processor.append(getter(key, default))
-                    elif isinstance(part, parser.LocData):
-                        if part.optional or (has_default and not has_optional):
-                            getter = getsafe
-                        index = part.value
-                        if not value_processor:
-                            if index > 0:
-                                index -= 1
-                        value_processor.append(getter(index, default))
-                    else:
-                        raise ProcessException(f"Unexpected part {part}")
-
-                def fn(row):
-                    result = row
-                    for p in value_processor:
-                        result = p(result)
-                        if result is default:
-                            break
-                    return result
-
-                return fn
-            else:
-                return _extract_structure_field_name(data, headers)
-        else:
-            raise ProcessException(f"Unsupported parser data: {data}")
+    if date_parsers is None:
+        date_parsers = dates.DateParsers()
+    rows = detect_dates(processed_cmd, headers, rows, date_parsers)
+    if not selected:
+        rows = select_rows(processed_cmd, headers, rows, date_parsers)
+    type_processors = _build_row_types_processor(processed_cmd, headers)
+    with profiling.stage("types:columnar"):
+        rows, batched, missing = columnar.convert_columns(rows, type_processors, date_parsers)
+    row_processor = _build_row_processor(processed_cmd, headers, batched, missing)
+    if row_processor.dates and not isinstance(rows, Sequence):
+        rows = list(rows)
+    return map(compiler.bind_dates(row_processor, rows, date_parsers), rows)
+
+
+def select_rows(processed_cmd, headers, rows, date_parsers=None):
+    """Return the rows that pass the filter, up to the limit. Rows are selected before they are typed, and
+    the filter parses dates with date_parsers, see process_rows"""
+    if processed_cmd.filter is None and processed_cmd.limit is None:
+        return rows
+    with profiling.stage("filter") as stage:
+        if processed_cmd.filter is not None:
+            row_filter = _build_row_filter(processed_cmd, headers)
+            if date_parsers is None:
+                date_parsers = dates.DateParsers()
+            if row_filter.dates:
+                rows = detect_dates(processed_cmd, headers, rows, date_parsers)
+            rows = filter(compiler.bind_dates(row_filter, rows, date_parsers), rows)
+        if processed_cmd.limit is not None:
+            rows = itertools.islice(rows, processed_cmd.limit)
+        rows = list(rows)
+        if stage:
+            stage.rows = len(rows)
+    return rows
+
+
+def _stream_rows(processed_cmd, headers, rows):
+    # rows are processed in chunks, so they are written as they are produced with the
+    # speed of processing many rows at once. formats of dates are detected from the first chunk
+    date_parsers = dates.DateParsers()
+    rows = iter(rows)
+    size = STREAM_CHUNK_SIZE
+    if processed_cmd.filter is None and processed_cmd.limit is not None:
+        size = max(1, min(size, processed_cmd.limit))
+    while True:
+        chunk = list(itertools.islice(rows, size))
+        if not chunk:
+            break
+        yield from process_rows(processed_cmd, headers, chunk, date_parsers=date_parsers)
+
+
+def detect_dates(processed_cmd, headers, rows, date_parsers: dates.DateParsers):
+    """Create the parsers of the date columns of processed_cmd that date_parsers lacks, detecting their formats
+    from rows, before any of them are filtered. Returns rows, read into a list if they had to be"""
+    missing = [
+        (i, args)
+        for i, t, *_, args in _build_row_types_processor(processed_cmd, headers)
+        if t == "d" and (i, args) not in date_parsers
+    ]
+    if not missing:
+        return rows
+    if not isinstance(rows, Sequence):
+        rows = list(rows)
+    for i, fmt in missing:
+        date_parsers.get(i, fmt, compiler.column_values(rows, i))
+    return rows
+
+
+def _build_row_types_processor(processed_cmd, headers):
+    key = (processed_cmd.expressions.get("t"), tuple(headers.values()))
+
+    def build():
+        headers_inverse = {h: i for i, h in headers.items()}
+        return compiler.build_row_types_processor(processed_cmd.types, headers_inverse)
+
+    return _row_types_processors.get(key, build)
+
+
+def _build_row_filter(processed_cmd, headers):
+    expressions = processed_cmd.expressions
+    key = (expressions.get("w"), expressions.get("t"), tuple(headers.values()))
+
+    def build():
+        type_processors = _build_row_types_processor(processed_cmd, headers)
+        return compiler.compile_row_filter(processed_cmd.filter, type_processors, headers)
 
-    return impl(structure, values=True)
+    return _row_filters.get(key, build)
 
 
-def _process_cmd(ctx, cmd) -> ProcessedCommand:
+def _build_row_processor(processed_cmd, headers, batched, missing):
+    expressions = processed_cmd.expressions
+    key = (expressions.get("t"), expressions.get("s"), tuple(headers.values()), batched, missing)
+
+    def build():
+        type_processors = _build_row_types_processor(processed_cmd, headers)
+        type_processors = [t for i, t in enumerate(type_processors) if i not in batched]
+        return compiler.compile_row_processor(type_processors, processed_cmd.structure, headers, missing)
+
+    return _row_processors.get(key, build)
+
+
+def process_cmd(ctx, cmd) -> ProcessedCommand:
     cmd = cmd.strip()
 
     if cmd.startswith("@"):
@@ -332,22 +424,35 @@ def _process_cmd(ctx, cmd) -> ProcessedCommand:
             continue
         expression_type, expression_body = expression_split
         expression_type, expression_body = expression_type.strip(), expression_body.strip()
-        if expression_type not in "dhtsio":
+        if expression_type not in "dhtsiown":
             raise ProcessException(f"Unsupported command type: {expression_type}")
         elif expression_type == "d":
             if expression_body.startswith("\\"):
                 expression_body = ast.literal_eval(f'"{expression_body}"')
             result.delimiter = expression_body or DEFAULT_CMD.delimiter
         elif expression_type == "t":
+            result.expressions["t"] = expression_body
             if expression_body:
                 result.types = parser.parse_types(expression_body)
             else:
                 result.types = DEFAULT_CMD.types
         elif expression_type == "s":
+            result.expressions["s"] = expression_body
             if expression_body:
                 result.structure = parser.parse_structure(expression_body)
             else:
                 result.structure = DEFAULT_CMD.structure
+        elif expression_type == "w":
+            result.expressions["w"] = expression_body
+            if expression_body:
+                result.filter = parser.parse_filter(expression_body)
+            else:
+                result.filter = DEFAULT_CMD.filter
+        elif expression_type == "n":
+            if expression_body:
+                result.limit = parser.parse_limit(expression_body)
+            else:
+                result.limit = DEFAULT_CMD.limit
         elif expression_type == "i":
             if expression_body:
                 result.inputs = parser.parse_processors(expression_body)
@@ -363,7 +468,7 @@ def _process_cmd(ctx, cmd) -> ProcessedCommand:
 
     previous_command.cmd = cmd
     ctx.processed_command = result
-    for attr in ["cmd", "delimiter", "outputs", "inputs", "structure", "types", "has_header", "raw"]:
+    for attr in ["cmd", "delimiter", "outputs", "inputs", "structure", "types", "has_header", "raw", "filter", "limit"]:
         if getattr(previous_command, attr) != getattr(result, attr):
             changed.add(attr)
     return result, changed
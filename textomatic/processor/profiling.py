@@ -0,0 +1,102 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field, asdict
+from typing import Callable, List
+
+# (on_start, on_end) callbacks, called with the Stage of every stage that runs
+_hooks = []
+_current = ContextVar("current_profile", default=None)
+
+
+@dataclass
+class Stage:
+    # e.g. input:c, rows, output:jl or jq
+    name: str
+    # how many stages this one is nested in, e.g. jq runs within the stage of the input or output using it
+    depth: int = 0
+    seconds: float = None
+    # the number of rows an input produced or an output consumed
+    rows: int = None
+    # the size of the text an input consumed or an output produced
+    bytes: int = None
+
+
+@dataclass
+class Profile:
+    """The stages of a processing run, in the order they started"""
+
+    stages: List[Stage] = field(default_factory=list)
+    depth: int = field(default=0, repr=False)
+
+    @property
+    def seconds(self):
+        return sum(s.seconds or 0 for s in self.stages if s.depth == 0)
+
+    def slowest(self) -> Stage:
+        return max((s for s in self.stages if s.depth == 0), key=lambda s: s.seconds or 0, default=None)
+
+    def to_dict(self):
+        return {"seconds": self.seconds, "stages": [asdict(s) for s in self.stages]}
+
+
+def add_hook(on_start: Callable[[Stage], None] = None, on_end: Callable[[Stage], None] = None) -> Callable[[], None]:
+    """Call on_start and on_end when any stage starts and ends, whether a profile is active or not.
+
+    Hooks are called from whichever thread processes, and on_end is called even if the stage failed.
+    Returns a function that removes the hook.
+    """
+    hook = (on_start, on_end)
+    _hooks.append(hook)
+    return lambda: _hooks.remove(hook)
+
+
+@contextmanager
+def profiled(profile: Profile = None):
+    """Record stages that run in the current context into profile. Does nothing if profile is None"""
+    if profile is None:
+        yield
+        return
+    token = _current.set(profile)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def stage(name: str):
+    """Time the stage name. Yields its Stage for rows and bytes to be set on, or None if nothing records it"""
+    profile = _current.get()
+    if profile is None and not _hooks:
+        yield None
+        return
+    result = Stage(name)
+    if profile is not None:
+        result.depth = profile.depth
+        profile.stages.append(result)
+        profile.depth += 1
+    hooks = list(_hooks)
+    for on_start, _ in hooks:
+        if on_start:
+            on_start(result)
+    start = time.perf_counter()
+    try:
+        yield result
+    finally:
+        result.seconds = time.perf_counter() - start
+        if profile is not None:
+            profile.depth -= 1
+        for _, on_end in hooks:
+            if on_end:
+                on_end(result)
+
+
+def count(rows):
+    return len(rows) if isinstance(rows, list) else None
+
+
+def size(text):
+    if not isinstance(text, str):
+        return None
+    return len(text) if text.isascii() else len(text.encode())
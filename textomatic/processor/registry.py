@@ -41,3 +41,10 @@ class Registry:
             else:
                 result.append(obj_or_cls)
         return result
+
+    def alias_of(self, obj) -> str:
+        """Return the alias obj was registered with or instantiated from"""
+        for alias, obj_or_cls in self.data.items():
+            if obj_or_cls is obj or (isinstance(obj_or_cls, type) and type(obj) is obj_or_cls):
+                return alias
+        return type(obj).__name__
@@ -0,0 +1,224 @@
+import html
+import math
+from functools import reduce
+from itertools import zip_longest
+from typing import Iterator, List
+
+# column types from the least to the most generic, as tabulate infers them
+_NONE, _BOOL, _INT, _FLOAT, _STR = range(5)
+# extra space around headers
+MIN_PADDING = 2
+# tables with cells that tabulate renders specially, e.g. multiline cells, are left to it
+_SPECIAL = ("\n", "\r", "\x1b")
+_MISSING = ""
+# types and display widths of strings are cached, as columns tend to repeat values
+CACHE_SIZE = 1 << 16
+FORMATS = {
+    "fancy_grid": {
+        "above": ("╒", "═", "╤", "╕"),
+        "below_header": ("╞", "═", "╪", "╡"),
+        "between_rows": ("├", "─", "┼", "┤"),
+        "below": ("╘", "═", "╧", "╛"),
+        "row": ("│ ", " │ ", " │"),
+    },
+    "html": {},
+}
+
+
+class _Unsupported(Exception):
+    pass
+
+
+def render(rows, headers, tablefmt: str) -> Iterator[str]:
+    """Yield the lines of rows rendered as tabulate would render them in tablefmt, one of FORMATS.
+
+    Columns are typed, formatted and measured in a single pass each, and lines are only built as they
+    are consumed. Display widths and types of repeated strings are computed once. Tables tabulate renders
+    differently, e.g. ones with multiline cells or dict rows, are rendered by tabulate.
+    """
+    headers = list(map(str, headers or ()))
+    try:
+        columns = _columns(rows, headers)
+    except _Unsupported:
+        from tabulate import tabulate
+
+        yield tabulate(rows, headers=headers, tablefmt=tablefmt)
+        return
+    if not rows and not headers:
+        return
+    if headers and rows and len(headers) < len(rows[0]):
+        headers = [""] * (len(rows[0]) - len(headers)) + headers
+    if headers:
+        # columns beyond the headers of the first row are dropped, as tabulate does
+        columns = columns[: len(headers)] if rows else [_Column([], [], _STR) for _ in headers]
+        headers = headers[: len(columns)]
+    for column, header in zip(columns, headers):
+        column.fit_header(header)
+    if tablefmt == "html":
+        # without rows, tabulate has no column alignments and renders the header row without cells
+        yield from _html_lines(columns if rows else [], headers)
+    else:
+        yield from _grid_lines(columns, headers, FORMATS[tablefmt])
+
+
+class _Column:
+    def __init__(self, cells: List[str], widths: List[int], column_type: int):
+        self.cells = cells
+        self.widths = widths
+        self.numeric = column_type in (_INT, _FLOAT)
+        self.width = max(widths, default=0)
+        self.header = None
+
+    def fit_header(self, header):
+        self.width = max(self.width, _width(header) + MIN_PADDING)
+        width = self.width + len(header) - _width(header)
+        self.header = header.rjust(width) if self.numeric else header.ljust(width)
+
+    def padded_cells(self):
+        justify = str.rjust if self.numeric else str.ljust
+        width = self.width
+        return [justify(cell, width - (w - len(cell))) for cell, w in zip(self.cells, self.widths)]
+
+
+def _columns(rows, headers):
+    if not rows:
+        return []
+    if any(isinstance(row, dict) for row in rows):
+        raise _Unsupported()
+    columns = list(zip_longest(*map(list, rows)))
+    if not columns:
+        raise _Unsupported()
+    if any(s in header for header in headers for s in _SPECIAL):
+        raise _Unsupported()
+    result = []
+    for values in columns:
+        column_type = reduce(max, map(_type, values), _BOOL)
+        if column_type == _FLOAT:
+            cells = [_MISSING if v is None else format(float(v), "g") for v in values]
+            text = "".join(v for v in values if isinstance(v, str))
+        else:
+            cells = [_MISSING if v is None else v if type(v) is str else "{0}".format(v) for v in values]
+            text = "".join(cells)
+        if any(s in text for s in _SPECIAL):
+            raise _Unsupported()
+        if column_type == _FLOAT:
+            # decimal alignment pads numbers on the right to line up their points
+            decimals = list(map(_after_point, cells))
+            most = max(decimals)
+            cells = [f"{cell}{' ' * (most - d)}" if most != d else cell for cell, d in zip(cells, decimals)]
+        elif column_type != _INT:
+            cells = list(map(str.strip, cells))
+        column = _Column(cells, list(map(_width, cells)), column_type)
+        result.append(column)
+        if column.width < 0 and not headers:
+            # tabulate measures control characters as -1 wide, which only matters without headers
+            raise _Unsupported()
+    return result
+
+
+def _grid_lines(columns, headers, fmt):
+    def line(chars):
+        begin, fill, sep, end = chars
+        return begin + sep.join(fill * (c.width + 2) for c in columns) + end
+
+    begin, sep, end = fmt["row"]
+    yield line(fmt["above"])
+    if headers:
+        yield begin + sep.join(c.header for c in columns) + end
+        yield line(fmt["below_header"])
+    between = line(fmt["between_rows"])
+    for i, cells in enumerate(zip(*(c.padded_cells() for c in columns))):
+        if i:
+            yield between
+        yield begin + sep.join(cells) + end
+    yield line(fmt["below"])
+
+
+def _html_lines(columns, headers):
+    styles = [' style="text-align: right;"' if c.numeric else "" for c in columns]
+    if headers:
+        cells = "".join(f"<th{s}>{html.escape(c.header)}</th>" for c, s in zip(columns, styles))
+        yield f"<table>\n<thead>\n<tr>{cells}</tr>\n</thead>\n<tbody>"
+    else:
+        yield "<table>\n<tbody>"
+    cell_columns = [[f"<td{s}>{cell}</td>" for cell in _escaped_cells(c)] for c, s in zip(columns, styles)]
+    for cells in zip(*cell_columns):
+        yield f"<tr>{''.join(cells)}</tr>"
+    yield "</tbody>\n</table>"
+
+
+def _escaped_cells(column):
+    cells = column.padded_cells()
+    text = "".join(column.cells)
+    # most columns have nothing to escape
+    if any(c in text for c in "&<>\"'"):
+        cells = list(map(html.escape, cells))
+    return cells
+
+
+_string_types = {}
+_string_widths = {}
+
+
+def _type(value):
+    if value is None:
+        return _NONE
+    if isinstance(value, str):
+        column_type = _string_types.get(value)
+        if column_type is None:
+            if len(_string_types) >= CACHE_SIZE:
+                _string_types.clear()
+            column_type = _string_types[value] = _string_type(value)
+        return column_type
+    if type(value) is bool:
+        return _BOOL
+    if type(value) is int:
+        return _INT
+    if isinstance(value, bytes):
+        raise _Unsupported()
+    if hasattr(value, "isoformat"):
+        return _STR
+    try:
+        float(value)
+    except (ValueError, TypeError):
+        return _STR
+    return _FLOAT
+
+
+def _string_type(value):
+    if value in ("True", "False"):
+        return _BOOL
+    try:
+        int(value)
+        return _INT
+    except ValueError:
+        pass
+    try:
+        number = float(value)
+    except ValueError:
+        return _STR
+    if (math.isinf(number) or math.isnan(number)) and value.lower() not in ("inf", "-inf", "nan"):
+        return _STR
+    return _FLOAT
+
+
+def _after_point(cell):
+    # cells of float columns are formatted with "g", so they have a point, an exponent or neither
+    point = cell.rfind(".")
+    if point < 0:
+        point = cell.rfind("e")
+    return len(cell) - point - 1 if point >= 0 else -1
+
+
+def _width(text):
+    if text.isascii() and text.isprintable():
+        return len(text)
+    width = _string_widths.get(text)
+    if width is None:
+        # importing wcwidth is slow compared to rendering small tables
+        from wcwidth import wcswidth
+
+        if len(_string_widths) >= CACHE_SIZE:
+            _string_widths.clear()
+        width = _string_widths[text] = wcswidth(text)
+    return width